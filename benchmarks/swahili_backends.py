@@ -0,0 +1,100 @@
+"""
+Compares the Swahili model backends (see `SWAHILI_BACKEND`) against the full precision `torch` one: how long each takes
+to load, how much memory it adds, how fast it runs, and how closely its entities match. Entities match if they have the
+same type and character offsets.
+
+Run from the repo root with: `python -m benchmarks.swahili_backends --backends torch torch-int8`
+
+To include the `onnx` backend, `pip install optimum[onnxruntime]`, export the model with
+`optimum-cli export onnx --model Davlan/xlm-roberta-large-masakhaner --task token-classification <dir>`, and pass
+`--onnx-path <dir>`.
+"""
+import argparse
+import gc
+import json
+import os
+import time
+from typing import Dict, List
+
+from helpers import SWAHILI_BACKEND_TORCH, SWAHILI_BACKEND_TORCH_INT8, SWAHILI_BACKEND_ONNX, SWAHILI_BACKENDS, \
+    SWAHILI_BATCH_SIZE, TRANSFORMER_CHUNK_MAX_CHARS, TRANSFORMER_CHUNK_OVERLAP_CHARS
+from helpers.chunking import chunk_spans, merge_entities
+from helpers.entities import _huggingface_entities_as_dict
+from helpers.models import get_masakhaner_pipeline, run_huggingface_pipeline, _rss_mb
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _sample_texts() -> List[str]:
+    story = json.load(open(os.path.join(base_dir, 'helpers', 'test', 'fixtures', 'sw_sample_story.json')))
+    return [story['results']['text']]
+
+
+def _entities(nlp, text: str) -> List[Dict]:
+    # the same chunking the server does
+    spans = chunk_spans(text, TRANSFORMER_CHUNK_MAX_CHARS, TRANSFORMER_CHUNK_OVERLAP_CHARS)
+    ner_results = run_huggingface_pipeline(nlp, [text[start:end] for start, end in spans], SWAHILI_BATCH_SIZE)
+    return merge_entities(spans, [_huggingface_entities_as_dict(results) for results in ner_results])
+
+
+def _agreement(expected: List[List[Dict]], found: List[List[Dict]]) -> Dict:
+    expected_keys = {(idx, e['start_char'], e['end_char'], e['type']) for idx, es in enumerate(expected) for e in es}
+    found_keys = {(idx, e['start_char'], e['end_char'], e['type']) for idx, es in enumerate(found) for e in es}
+    matches = len(expected_keys & found_keys)
+    precision = matches / len(found_keys) if found_keys else 1.0
+    recall = matches / len(expected_keys) if expected_keys else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if (precision + recall) else 0.0
+    return dict(precision=round(precision, 3), recall=round(recall, 3), f1=round(f1, 3))
+
+
+def run(backends: List[str], onnx_path: str, texts: List[str], repeats: int) -> List[Dict]:
+    if SWAHILI_BACKEND_TORCH not in backends:
+        backends = [SWAHILI_BACKEND_TORCH] + backends  # the baseline to compare to
+    baseline = None
+    results = []
+    for backend in backends:
+        gc.collect()
+        start_rss = _rss_mb()
+        start_time = time.time()
+        nlp = get_masakhaner_pipeline(backend=backend, onnx_path=onnx_path)
+        load_secs = time.time() - start_time
+        memory_mb = (_rss_mb() - start_rss) if start_rss is not None else None
+        found = [_entities(nlp, text) for text in texts]  # also warms up the model
+        start_time = time.time()
+        for _ in range(repeats):
+            for text in texts:
+                _entities(nlp, text)
+        doc_secs = (time.time() - start_time) / (repeats * len(texts))
+        if baseline is None:
+            baseline = found
+        results.append(dict(backend=backend, loadSecs=round(load_secs, 1),
+                            memoryMb=round(memory_mb) if memory_mb is not None else None,
+                            msPerDoc=round(doc_secs * 1000), entities=sum(len(es) for es in found),
+                            **_agreement(baseline, found)))
+        del nlp
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare speed, memory and accuracy of the Swahili model backends.")
+    parser.add_argument('--backends', nargs='+', choices=SWAHILI_BACKENDS,
+                        default=[SWAHILI_BACKEND_TORCH, SWAHILI_BACKEND_TORCH_INT8],
+                        help="backends to compare against full precision torch")
+    parser.add_argument('--onnx-path', help="directory of the exported ONNX model, for the onnx backend")
+    parser.add_argument('--files', nargs='*', default=[],
+                        help="extra text files to test on, beyond the Swahili test fixture")
+    parser.add_argument('--repeats', type=int, default=3, help="how many times to time each text")
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    args = parser.parse_args()
+    if (SWAHILI_BACKEND_ONNX in args.backends) and not args.onnx_path:
+        parser.error("the onnx backend needs --onnx-path")
+    sample_texts = _sample_texts() + [open(path, encoding='utf-8').read() for path in args.files]
+    benchmark_results = run(args.backends, args.onnx_path, sample_texts, args.repeats)
+    if args.json:
+        print(json.dumps(benchmark_results, indent=2))
+    else:
+        print("{:<11} {:>9} {:>10} {:>10} {:>9} {:>10} {:>7} {:>6}".format(
+            "backend", "load secs", "memory MB", "ms/doc", "entities", "precision", "recall", "f1"))
+        for r in benchmark_results:
+            print("{backend:<11} {loadSecs:>9} {memoryMb:>10} {msPerDoc:>10} {entities:>9} {precision:>10} "
+                  "{recall:>7} {f1:>6}".format(**r))
@@ -0,0 +1,209 @@
+"""
+Load and throughput benchmark for entity extraction. Replays a corpus of documents through `entities.from_text`
+directly, and/or through the ASGI app in-process (via `/entities/from-content`, so including request parsing and the
+response wrapper), and reports docs/sec, chars/sec, p50/p95/p99 latency and peak memory for each language. Results are
+tagged with the server version and MODEL_MODE, and can be saved as JSON to compare across versions.
+
+The corpus is either a JSONL file with `text` and `language` on each line (`--corpus`), or a synthetic one of
+fixed-size articles built from the test fixtures. The entity cache is turned off, so every document runs through the
+models; model loading is done (and timed) before the first timed document of each language.
+
+Run from the repo root with: `python -m benchmarks.throughput --languages en es --docs 50 --output results.json`
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import time
+from typing import Dict, List
+
+from helpers import LANGUAGES, ENGLISH, SPANISH, PORTUGUESE, FRENCH, GERMAN, KOREAN, SWAHILI, MODEL_MODE, VERSION
+import helpers.entities as entities
+from helpers.cache import TieredCache
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+fixtures_dir = os.path.join(base_dir, 'helpers', 'test', 'fixtures')
+
+TARGET_DIRECT = 'direct'
+TARGET_ASGI = 'asgi'
+
+# for languages without a test fixture
+SAMPLE_TEXTS = {
+    ENGLISH: """President Joe Biden met with Prime Minister Justin Trudeau in Ottawa on Friday to discuss trade, border
+security and climate policy. The two leaders announced a new agreement on migration, and Mr. Biden addressed the
+Canadian Parliament before returning to Washington. Officials from the State Department said talks with Mexico would
+follow next month in Mexico City. """,
+    PORTUGUESE: """O presidente Luiz Inácio Lula da Silva recebeu nesta segunda-feira em Brasília o chanceler alemão Olaf
+Scholz para discutir a proteção da Amazônia e o acordo entre o Mercosul e a União Europeia. Depois do encontro, Lula
+viajou para São Paulo, onde participou de um evento com empresários da Federação das Indústrias. """,
+    FRENCH: """Le président Emmanuel Macron a reçu mardi à l'Élysée le chancelier allemand Olaf Scholz pour évoquer la
+guerre en Ukraine et la politique énergétique de l'Union européenne. La Première ministre a ensuite présenté à
+l'Assemblée nationale un projet de loi sur les retraites, vivement critiqué par les syndicats à Paris et à Lyon. """,
+    GERMAN: """Bundeskanzler Olaf Scholz hat am Mittwoch in Berlin den französischen Präsidenten Emmanuel Macron
+empfangen. Bei dem Treffen im Kanzleramt ging es um die Energiepolitik der Europäischen Union und die Lage in der
+Ukraine. Anschließend reiste Scholz nach München, wo er mit Vertretern von Siemens und BMW sprach. """,
+}
+
+
+def _fixture_texts() -> Dict[str, str]:
+    spanish_story = json.load(open(os.path.join(fixtures_dir, '2210723002.json')))
+    korean_stories = json.load(open(os.path.join(fixtures_dir, 'ko_sample_stories.json')))
+    swahili_story = json.load(open(os.path.join(fixtures_dir, 'sw_sample_story.json')))
+    return dict(SAMPLE_TEXTS, **{
+        SPANISH: spanish_story['story_text'],
+        KOREAN: " ".join(korean_stories),
+        SWAHILI: swahili_story['results']['text'],
+    })
+
+
+def synthetic_corpus(languages: List[str], docs: int, chars: int) -> List[Dict]:
+    """
+    `docs` articles of `chars` characters for each language, made by repeating sample text. Each one starts at a
+    different place in the sample, so they are all different.
+    """
+    samples = _fixture_texts()
+    corpus = []
+    for lang in languages:
+        sample = samples[lang]
+        repeated = sample * (chars // len(sample) + 2)
+        for idx in range(docs):
+            start = (idx * 97) % len(sample)
+            corpus.append(dict(language=lang, text=repeated[start:start + chars]))
+    return corpus
+
+
+def load_corpus(path: str, languages: List[str], docs: int) -> List[Dict]:
+    corpus = []
+    counts = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            lang = (item.get('language') or '').lower()
+            if ('text' not in item) or (lang not in languages) or (counts.get(lang, 0) >= docs):
+                continue
+            counts[lang] = counts.get(lang, 0) + 1
+            corpus.append(dict(language=lang, text=item['text']))
+    return corpus
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024  # bytes on macOS, KB on linux
+
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    # nearest-rank
+    idx = max(0, int(round(percent / 100 * len(sorted_values))) - 1)
+    return sorted_values[min(idx, len(sorted_values) - 1)]
+
+
+def _summary(target: str, lang: str, docs: List[Dict], latencies: List[float], elapsed_secs: float,
+             load_secs: float) -> Dict:
+    latencies = sorted(latencies)
+    chars = sum(len(doc['text']) for doc in docs)
+    return dict(
+        version=VERSION, modelMode=MODEL_MODE, target=target, language=lang, docs=len(docs), chars=chars,
+        modelLoadSecs=round(load_secs, 2),
+        docsPerSec=round(len(docs) / elapsed_secs, 2),
+        charsPerSec=round(chars / elapsed_secs),
+        p50Ms=round(_percentile(latencies, 50) * 1000, 1),
+        p95Ms=round(_percentile(latencies, 95) * 1000, 1),
+        p99Ms=round(_percentile(latencies, 99) * 1000, 1),
+        peakRssMb=round(_peak_rss_mb()),
+    )
+
+
+def _load_model(lang: str) -> float:
+    start_time = time.perf_counter()
+    entities.language_nlp_lookup.get(lang)
+    return time.perf_counter() - start_time
+
+
+def run_direct(lang: str, docs: List[Dict]) -> Dict:
+    load_secs = _load_model(lang)
+    entities.from_text(docs[0]['text'], lang)  # warm up
+    latencies = []
+    start_time = time.perf_counter()
+    for doc in docs:
+        doc_start_time = time.perf_counter()
+        entities.from_text(doc['text'], lang)
+        latencies.append(time.perf_counter() - doc_start_time)
+    return _summary(TARGET_DIRECT, lang, docs, latencies, time.perf_counter() - start_time, load_secs)
+
+
+def run_asgi(lang: str, docs: List[Dict], concurrency: int) -> Dict:
+    import httpx
+    from server import app
+    load_secs = _load_model(lang)
+
+    async def replay():
+        latencies = []
+        slots = asyncio.Semaphore(concurrency)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://benchmark', timeout=None) as client:
+            async def post(doc: Dict):
+                async with slots:
+                    doc_start_time = time.perf_counter()
+                    response = await client.post('/entities/from-content',
+                                                 data=dict(text=doc['text'], language=lang,
+                                                           url='https://example.com/benchmark'))
+                    latencies.append(time.perf_counter() - doc_start_time)
+                    if response.json()['status'] != 'ok':
+                        raise RuntimeError("Request failed: {}".format(response.json()))
+            await post(docs[0])  # warm up
+            latencies.clear()
+            start_time = time.perf_counter()
+            await asyncio.gather(*[post(doc) for doc in docs])
+            return latencies, time.perf_counter() - start_time
+
+    latencies, elapsed_secs = asyncio.run(replay())
+    return _summary(TARGET_ASGI, lang, docs, latencies, elapsed_secs, load_secs)
+
+
+def run(corpus: List[Dict], targets: List[str], concurrency: int) -> List[Dict]:
+    entities.entity_cache = TieredCache(0)  # so every document really runs through the model
+    docs_by_language = {}
+    for doc in corpus:
+        docs_by_language.setdefault(doc['language'], []).append(doc)
+    results = []
+    for lang, docs in docs_by_language.items():
+        if TARGET_DIRECT in targets:
+            results.append(run_direct(lang, docs))
+        if TARGET_ASGI in targets:
+            results.append(run_asgi(lang, docs, concurrency))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure entity extraction throughput and latency.")
+    parser.add_argument('--corpus', help="JSONL file of documents with `text` and `language` (default: synthetic)")
+    parser.add_argument('--languages', nargs='+', default=[ENGLISH, SPANISH], choices=LANGUAGES,
+                        help="languages to test")
+    parser.add_argument('--docs', type=int, default=50, help="most documents to run for each language")
+    parser.add_argument('--chars', type=int, default=5000, help="length of each synthetic article")
+    parser.add_argument('--targets', nargs='+', default=[TARGET_DIRECT, TARGET_ASGI],
+                        choices=[TARGET_DIRECT, TARGET_ASGI], help="call entities.from_text, the ASGI app, or both")
+    parser.add_argument('--concurrency', type=int, default=4, help="simultaneous requests to the ASGI app")
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    parser.add_argument('--output', help="also save the results as JSON to this file")
+    args = parser.parse_args()
+    if args.corpus:
+        documents = load_corpus(args.corpus, args.languages, args.docs)
+    else:
+        documents = synthetic_corpus(args.languages, args.docs, args.chars)
+    benchmark_results = run(documents, args.targets, args.concurrency)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(benchmark_results, f, indent=2)
+    if args.json:
+        print(json.dumps(benchmark_results, indent=2))
+    else:
+        print("{:<7} {:<5} {:>5} {:>9} {:>8} {:>10} {:>8} {:>8} {:>8} {:>8}".format(
+            "target", "lang", "docs", "load secs", "docs/s", "chars/s", "p50 ms", "p95 ms", "p99 ms", "peak MB"))
+        for r in benchmark_results:
+            print("{target:<7} {language:<5} {docs:>5} {modelLoadSecs:>9} {docsPerSec:>8} {charsPerSec:>10} "
+                  "{p50Ms:>8} {p95Ms:>8} {p99Ms:>8} {peakRssMb:>8}".format(**r))
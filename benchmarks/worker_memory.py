@@ -0,0 +1,101 @@
+"""
+Measures how much memory each gunicorn worker really uses, with and without `--preload` (see `gunicorn.conf.py`). With
+preloading the models are loaded once in the master and shared copy-on-write with the forked workers, so each worker's
+unique memory (USS) drops by about the size of the models. Reads `/proc/<pid>/smaps_rollup`, so Linux only.
+
+ * RSS: all the memory the process can see, including pages shared with other processes
+ * PSS: shared pages divided between the processes sharing them; the sum over processes is the real total
+ * USS: pages only this process uses; what you save by running one fewer worker
+
+Run from the repo root with: `PRELOAD_LANGUAGES=en,es python -m benchmarks.worker_memory --workers 4`
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import requests
+
+
+def memory_mb(pid: int) -> Dict:
+    values = {}
+    with open('/proc/{}/smaps_rollup'.format(pid)) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return dict(
+        rssMb=round(values.get('Rss', 0)),
+        pssMb=round(values.get('Pss', 0)),
+        ussMb=round(values.get('Private_Clean', 0) + values.get('Private_Dirty', 0)),
+    )
+
+
+def child_pids(pid: int) -> List[int]:
+    children = []
+    for task in os.listdir('/proc/{}/task'.format(pid)):
+        with open('/proc/{}/task/{}/children'.format(pid, task)) as f:
+            children += [int(child) for child in f.read().split()]
+    return children
+
+
+def measure(workers: int, preload: bool, port: int, timeout_secs: int) -> Dict:
+    command = [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-k', 'uvicorn.workers.UvicornWorker',
+               '-b', '127.0.0.1:{}'.format(port), '--timeout', '300', 'server:app']
+    if preload:
+        command.append('--preload')
+    master = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_until_ready(port, workers, timeout_secs)
+        # use the models in every worker (requests are spread across them), like a real server would
+        for _ in range(workers * 4):
+            requests.post('http://127.0.0.1:{}/entities/from-content'.format(port),
+                          data=dict(text="Barack Obama visited Boston on Tuesday.", language='en',
+                                    url='https://example.com/'))
+        worker_memory = [memory_mb(pid) for pid in child_pids(master.pid)]
+        return dict(
+            preload=preload, workers=workers, master=memory_mb(master.pid),
+            perWorker={key: round(sum(w[key] for w in worker_memory) / len(worker_memory)) for key in worker_memory[0]},
+            totalPssMb=memory_mb(master.pid)['pssMb'] + sum(w['pssMb'] for w in worker_memory),
+        )
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait()
+
+
+def _wait_until_ready(port: int, workers: int, timeout_secs: int):
+    # every worker has to report ready; requests go to whichever one accepts first, so ask a few times in a row
+    deadline = time.time() + timeout_secs
+    ready_in_a_row = 0
+    while ready_in_a_row < workers * 3:
+        if time.time() > deadline:
+            raise RuntimeError("Server wasn't ready after {} secs".format(timeout_secs))
+        try:
+            ready = requests.get('http://127.0.0.1:{}/health/ready'.format(port), timeout=5).status_code == 200
+        except requests.exceptions.ConnectionError:
+            ready = False
+        ready_in_a_row = ready_in_a_row + 1 if ready else 0
+        time.sleep(0.1 if ready else 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure gunicorn worker memory with and without --preload.")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--timeout', type=int, default=600, help="secs to wait for the models to load")
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    args = parser.parse_args()
+    results = [measure(args.workers, preload, args.port, args.timeout) for preload in (False, True)]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print("{:<8} {:>8} {:>11} {:>11} {:>11} {:>13}".format("preload", "workers", "worker RSS", "worker PSS",
+                                                              "worker USS", "total PSS MB"))
+        for r in results:
+            print("{:<8} {:>8} {:>11} {:>11} {:>11} {:>13}".format(str(r['preload']), r['workers'],
+                                                                   r['perWorker']['rssMb'], r['perWorker']['pssMb'],
+                                                                   r['perWorker']['ussMb'], r['totalPssMb']))
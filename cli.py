@@ -0,0 +1,192 @@
+"""
+Bulk entity extraction from the command line, for reprocessing archives (ie. after a model upgrade) without going
+through the HTTP server. Reads JSONL files (optionally gzipped) with one document per line, in the same shape
+`/entities/stream` takes: an `id`, a `language` (or `auto` to detect it) and either `text`, `html` (plus an optional
+`url`) or a `url` to fetch (plus optional `title`). Each line of output is the same as the one `/entities/stream` sends
+back for it.
+
+Documents are handled in chunks of `--chunk-lines` lines by a pool of worker processes, each loading its models once
+and keeping them for every chunk it gets. The results for each chunk go to their own gzipped shard in the output
+directory (`<input name>-<chunk number>.jsonl.gz`), and a `checkpoint.jsonl` there records the chunks that are done, so
+running the same command again after it stopped part way carries on from where it left off. The entity cache is turned
+off in the workers, since each document is only seen once.
+
+Run from the repo root with: `python -m cli archive-*.jsonl.gz --output-dir results --workers 4`
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import helpers
+import helpers.documents as documents
+import helpers.entities as entities
+from helpers.cache import TieredCache
+from helpers.encoding import json_default
+from helpers.pool import init_worker
+from helpers.stream import handle_line
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILENAME = 'checkpoint.jsonl'
+
+# set up in each worker process by `_init_cli_worker`
+_loop = None
+_fetch_concurrency = None
+
+
+def _input_name(path: str) -> str:
+    name = os.path.basename(path)
+    for extension in ['.gz', '.jsonl', '.ndjson', '.json']:
+        if name.endswith(extension):
+            name = name[:-len(extension)]
+    return name
+
+
+def shard_name(path: str, chunk: int) -> str:
+    return "{}-{:05d}.jsonl.gz".format(_input_name(path), chunk)
+
+
+def read_chunks(path: str, chunk_lines: int) -> Iterator[Tuple[int, int, List[bytes]]]:
+    """
+    The lines of a JSONL file (gzipped if it ends in `.gz`) in chunks.
+    :return: (chunk number, line number of the first line, the lines) for each chunk
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        chunk, first_line_number, lines = 0, 1, []
+        for line in f:
+            lines.append(line)
+            if len(lines) >= chunk_lines:
+                yield chunk, first_line_number, lines
+                chunk, first_line_number, lines = chunk + 1, first_line_number + len(lines), []
+        if lines:
+            yield chunk, first_line_number, lines
+
+
+def load_checkpoint(output_dir: str, chunk_lines: int) -> Dict[str, Dict]:
+    """
+    The chunks already done, by shard name, skipping any whose shard has gone missing.
+    """
+    path = os.path.join(output_dir, CHECKPOINT_FILENAME)
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record['chunkLines'] != chunk_lines:
+                sys.exit("{} was made with --chunk-lines {}, so use that to carry on (or a new --output-dir)".format(
+                    path, record['chunkLines']))
+            if os.path.exists(os.path.join(output_dir, record['shard'])):
+                done[record['shard']] = record
+    return done
+
+
+def _init_cli_worker(fetch_concurrency: int):
+    global _loop, _fetch_concurrency
+    init_worker()  # loads the PRELOAD_LANGUAGES models, and runs NER here rather than in a pool of its own
+    entities.entity_cache = TieredCache(0)
+    # one event loop for the life of the worker, so the connection pool for fetching urls is kept between chunks
+    _loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_loop)
+    _fetch_concurrency = fetch_concurrency
+
+
+async def _handle_lines(first_line_number: int, lines: List[bytes]) -> List[Dict]:
+    slots = asyncio.Semaphore(_fetch_concurrency)
+
+    async def handle(line_number: int, line: bytes) -> Dict:
+        async with slots:
+            return await handle_line(line_number, line if len(line) <= helpers.STREAM_MAX_LINE_BYTES else None,
+                                     documents.entities_from_stream_item, helpers.STREAM_MAX_LINE_BYTES)
+    return await asyncio.gather(*[handle(first_line_number + idx, line) for idx, line in enumerate(lines)
+                                  if line.strip()])
+
+
+def process_chunk(output_dir: str, shard: str, first_line_number: int, lines: List[bytes]) -> Dict:
+    """
+    Find the entities for a chunk of lines and write the results to its shard. Runs in a worker process.
+    :return: the checkpoint record for the chunk
+    """
+    start_time = time.time()
+    results = _loop.run_until_complete(_handle_lines(first_line_number, lines))
+    shard_path = os.path.join(output_dir, shard)
+    partial_path = shard_path + '.partial'
+    with gzip.open(partial_path, 'wt', encoding='utf-8') as f:
+        for result in results:
+            f.write(json.dumps(result, default=json_default) + '\n')
+    os.replace(partial_path, shard_path)  # so a shard is either all there or not there at all
+    return dict(shard=shard, docs=len(results), errors=sum(1 for r in results if r['status'] != 'ok'),
+                secs=round(time.time() - start_time, 3))
+
+
+def run(paths: List[str], output_dir: str, workers: int, chunk_lines: int, fetch_concurrency: int,
+        max_in_flight: Optional[int] = None) -> Dict:
+    """
+    Process every chunk of the input files that isn't done yet, recording each one in the checkpoint as it finishes.
+    :return: totals for this run
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    names = [_input_name(path) for path in paths]
+    if len(set(names)) != len(names):
+        sys.exit("Input files need different names, because their shards are named after them")
+    done = load_checkpoint(output_dir, chunk_lines)
+    totals = dict(chunks=0, skippedChunks=0, docs=0, errors=0)
+    max_in_flight = max_in_flight or (workers * 2)  # enough to keep the workers busy, without reading everything in
+    start_time = time.time()
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_cli_worker,
+                             initargs=(fetch_concurrency,)) as executor, \
+            open(os.path.join(output_dir, CHECKPOINT_FILENAME), 'a') as checkpoint:
+        in_flight = set()
+
+        def record(finished):
+            for future in finished:
+                in_flight.discard(future)
+                chunk_record = future.result()
+                checkpoint.write(json.dumps(dict(chunk_record, chunkLines=chunk_lines)) + '\n')
+                checkpoint.flush()
+                totals['chunks'] += 1
+                totals['docs'] += chunk_record['docs']
+                totals['errors'] += chunk_record['errors']
+                logger.info("Wrote {shard}: {docs} docs, {errors} errors, in {secs} secs".format(**chunk_record))
+
+        for path in paths:
+            for chunk, first_line_number, lines in read_chunks(path, chunk_lines):
+                shard = shard_name(path, chunk)
+                if shard in done:
+                    totals['skippedChunks'] += 1
+                    continue
+                if len(in_flight) >= max_in_flight:
+                    record(wait(in_flight, return_when=FIRST_COMPLETED).done)
+                in_flight.add(executor.submit(process_chunk, output_dir, shard, first_line_number, lines))
+        record(wait(in_flight).done)
+    elapsed_secs = time.time() - start_time
+    totals['secs'] = round(elapsed_secs, 1)
+    totals['docsPerSec'] = round(totals['docs'] / elapsed_secs, 2) if elapsed_secs else 0
+    return totals
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s][%(levelname)s] %(name)s | %(message)s")
+    parser = argparse.ArgumentParser(description="Find entities in JSONL files of documents, without the server.")
+    parser.add_argument('inputs', nargs='+', help="JSONL files of documents, optionally gzipped")
+    parser.add_argument('--output-dir', required=True, help="where to write result shards and the checkpoint")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="worker processes (default: one per CPU)")
+    parser.add_argument('--chunk-lines', type=int, default=1000,
+                        help="documents in each chunk, and so in each output shard (keep it the same to carry on)")
+    parser.add_argument('--fetch-concurrency', type=int, default=8,
+                        help="documents each worker works on at once, for inputs with urls to fetch")
+    args = parser.parse_args()
+    run_totals = run(args.inputs, args.output_dir, args.workers, args.chunk_lines, args.fetch_concurrency)
+    print(json.dumps(run_totals))
@@ -0,0 +1,24 @@
+"""
+Gunicorn settings, which gunicorn reads automatically when started from the repo root. Run with `--preload` to load
+the PRELOAD_LANGUAGES models once in the master process, so the forked workers share the model memory copy-on-write
+instead of each loading their own copy.
+"""
+import gc
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def when_ready(server):
+    # runs in the master, after the app is imported and before any workers are forked
+    if not server.cfg.preload_app:
+        return
+    import helpers.startup as startup
+    from helpers.pool import ner_pool
+    if ner_pool.enabled:
+        logger.warning("Not preloading models in the gunicorn master, because NER_WORKERS loads them in worker processes")
+        return
+    startup.load_models()
+    # move everything loaded so far out of the garbage collector's view, so collections in the workers don't write to
+    # (and so copy) the memory pages holding the models
+    gc.freeze()
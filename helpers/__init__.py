@@ -12,14 +12,21 @@ KOREAN = 'ko'
 SWAHILI = 'sw'
 
 LANGUAGES = [ENGLISH, SPANISH, PORTUGUESE, FRENCH, GERMAN, KOREAN, SWAHILI]
+# pass this instead of a language code to have the language detected from the text
+LANGUAGE_AUTO = 'auto'
 
 MODEL_MODE_SMALL = 'small'
 MODEL_MODE_LARGE = 'large'
 MODEL_MODES = [MODEL_MODE_SMALL, MODEL_MODE_LARGE]
 
+SWAHILI_BACKEND_TORCH = 'torch'
+SWAHILI_BACKEND_TORCH_INT8 = 'torch-int8'
+SWAHILI_BACKEND_ONNX = 'onnx'
+SWAHILI_BACKENDS = [SWAHILI_BACKEND_TORCH, SWAHILI_BACKEND_TORCH_INT8, SWAHILI_BACKEND_ONNX]
+
 load_dotenv()
 
-VERSION = '2.5.1'
+VERSION = '2.6.0'
 
 # setup logging
 logging.basicConfig(level=logging.INFO,
@@ -32,3 +39,121 @@ if MODEL_MODE not in MODEL_MODES:
     sys.exit("invalid model mode - must be one of [{}]".format(", ".join(MODEL_MODES)))
 logger.info("Starting {}, with '{}' models".format(VERSION, MODEL_MODE))
 
+
+# models are loaded the first time each language is used; list languages here to load them at startup instead
+PRELOAD_LANGUAGES = [lang.strip().lower() for lang in os.environ.get('PRELOAD_LANGUAGES', '').split(',') if lang.strip()]
+for lang in PRELOAD_LANGUAGES:
+    if lang not in LANGUAGES:
+        sys.exit("invalid preload language '{}' - must be one of [{}]".format(lang, ", ".join(LANGUAGES)))
+# least-recently-used models are unloaded to stay under these budgets (0 means no limit)
+MAX_LOADED_MODELS = int(os.environ.get('MAX_LOADED_MODELS', 0))
+MAX_MODELS_MEMORY_MB = int(os.environ.get('MAX_MODELS_MEMORY_MB', 0))
+# optional directory of models saved with `python -m helpers.snapshot`, which load faster than installed packages
+MODEL_SNAPSHOT_DIR = os.environ.get('MODEL_SNAPSHOT_DIR', None)
+
+# defaults for running many documents through a language pipeline at once (see `entities.from_texts`)
+NLP_BATCH_SIZE = int(os.environ.get('NLP_BATCH_SIZE', 32))
+NLP_N_PROCESS = int(os.environ.get('NLP_N_PROCESS', 1))
+# we only use the entities spaCy finds, so by default skip running the pipeline components NER doesn't need
+SPACY_NER_ONLY = os.environ.get('SPACY_NER_ONLY', '1') == '1'
+
+# limits for downloading webpages (see `helpers.fetch`)
+FETCH_TIMEOUT_SECS = float(os.environ.get('FETCH_TIMEOUT_SECS', 60))
+FETCH_MAX_CONNECTIONS = int(os.environ.get('FETCH_MAX_CONNECTIONS', 100))
+FETCH_MAX_PER_HOST = int(os.environ.get('FETCH_MAX_PER_HOST', 4))
+# how many threads do content extraction and NER for the async endpoints (see `helpers.executor`)
+WORKER_THREADS = int(os.environ.get('WORKER_THREADS', 4))
+
+# cache of entities found in each text, in memory and optionally on disk (see `helpers.cache`)
+ENTITY_CACHE_SIZE = int(os.environ.get('ENTITY_CACHE_SIZE', 1000))  # 0 to turn off the in-memory cache
+ENTITY_CACHE_PATH = os.environ.get('ENTITY_CACHE_PATH', None)  # a SQLite file to cache results in across restarts
+ENTITY_CACHE_DISK_SIZE = int(os.environ.get('ENTITY_CACHE_DISK_SIZE', 100000))
+
+# cache of content extracted from each url (see `helpers.fetch.extract_url`)
+URL_CACHE_SIZE = int(os.environ.get('URL_CACHE_SIZE', 1000))  # 0 to turn it off
+URL_CACHE_TTL_SECS = float(os.environ.get('URL_CACHE_TTL_SECS', 600))
+# after the TTL, ask the site if the page changed (via ETag/Last-Modified) instead of always downloading it again
+URL_CACHE_REVALIDATE = os.environ.get('URL_CACHE_REVALIDATE', '1') == '1'
+
+# run NER in a pool of worker processes, so one server process can use more than one core (see `helpers.pool`)
+NER_WORKERS = int(os.environ.get('NER_WORKERS', 0))  # 0 to run NER in the request thread
+NER_QUEUE_SIZE = int(os.environ.get('NER_QUEUE_SIZE', NER_WORKERS * 4))  # reject requests beyond this many waiting
+NER_FORK_AFTER_LOAD = os.environ.get('NER_FORK_AFTER_LOAD', '0') == '1'  # share preloaded models with the workers
+NER_RETRY_AFTER_SECS = int(os.environ.get('NER_RETRY_AFTER_SECS', 5))
+
+# split long texts into windows before NER, so they fit within the models' limits (see `helpers.chunking`)
+CHUNK_MAX_CHARS = int(os.environ.get('CHUNK_MAX_CHARS', 100000))  # 0 to never split texts for spaCy
+CHUNK_OVERLAP_CHARS = int(os.environ.get('CHUNK_OVERLAP_CHARS', 0))
+# the HuggingFace model truncates at 512 tokens, so it needs much smaller windows
+TRANSFORMER_CHUNK_MAX_CHARS = int(os.environ.get('TRANSFORMER_CHUNK_MAX_CHARS', 1500))
+TRANSFORMER_CHUNK_OVERLAP_CHARS = int(os.environ.get('TRANSFORMER_CHUNK_OVERLAP_CHARS', 200))
+
+# the streaming endpoint works on at most this many documents from each stream at once
+STREAM_MAX_IN_FLIGHT = int(os.environ.get('STREAM_MAX_IN_FLIGHT', 8))
+STREAM_MAX_LINE_BYTES = int(os.environ.get('STREAM_MAX_LINE_BYTES', 10 * 1024 * 1024))
+
+# gather concurrent Swahili requests into batches for the transformer model (see `helpers.batching`)
+SWAHILI_BATCH_SIZE = int(os.environ.get('SWAHILI_BATCH_SIZE', 16))
+SWAHILI_BATCH_WAIT_MS = float(os.environ.get('SWAHILI_BATCH_WAIT_MS', 10))  # 0 to run each request on its own
+TORCH_NUM_THREADS = int(os.environ.get('TORCH_NUM_THREADS', 0))  # 0 to use torch's default (one per core)
+
+# how to run the Swahili model: full precision, quantized to int8, or an exported ONNX graph (see README)
+SWAHILI_BACKEND = os.environ.get('SWAHILI_BACKEND', SWAHILI_BACKEND_TORCH)
+if SWAHILI_BACKEND not in SWAHILI_BACKENDS:
+    sys.exit("invalid Swahili backend - must be one of [{}]".format(", ".join(SWAHILI_BACKENDS)))
+SWAHILI_ONNX_PATH = os.environ.get('SWAHILI_ONNX_PATH', None)  # directory with the exported model
+if (SWAHILI_BACKEND == SWAHILI_BACKEND_ONNX) and not SWAHILI_ONNX_PATH:
+    sys.exit("the onnx Swahili backend needs SWAHILI_ONNX_PATH set to the exported model")
+
+# add a `timings` breakdown (milliseconds spent in each stage, ie. fetch or spacy) to every response
+RESPONSE_TIMINGS = os.environ.get('RESPONSE_TIMINGS', '0') == '1'
+
+# clean up text before NER, so there is less for the models to do (see `helpers.preprocess`); off by default
+PREPROCESS_COLLAPSE_WHITESPACE = os.environ.get('PREPROCESS_COLLAPSE_WHITESPACE', '0') == '1'
+PREPROCESS_DROP_BOILERPLATE = os.environ.get('PREPROCESS_DROP_BOILERPLATE', '0') == '1'
+PREPROCESS_MAX_CHARS = int(os.environ.get('PREPROCESS_MAX_CHARS', 0))  # 0 for no limit
+
+# detecting the language (for `language=auto`) only looks at the start of the text, and gives up below this confidence
+LANGUAGE_DETECT_MAX_CHARS = int(os.environ.get('LANGUAGE_DETECT_MAX_CHARS', 1000))
+LANGUAGE_DETECT_MIN_CONFIDENCE = float(os.environ.get('LANGUAGE_DETECT_MIN_CONFIDENCE', 0.5))
+
+# canonical domains are remembered by hostname, since most URLs we see are from a small number of sites
+DOMAIN_CACHE_SIZE = int(os.environ.get('DOMAIN_CACHE_SIZE', 100000))  # 0 to turn it off
+DOMAINS_BATCH_MAX_URLS = int(os.environ.get('DOMAINS_BATCH_MAX_URLS', 10000))  # most URLs in one batch request
+
+# admission control for POST endpoints (see `helpers.admission`); each server process applies these on its own
+ADMISSION_MAX_CONCURRENT = int(os.environ.get('ADMISSION_MAX_CONCURRENT', 0))  # per endpoint, 0 for no limit
+# per endpoint overrides of ADMISSION_MAX_CONCURRENT, like `/entities/from-url=16,/entities/from-content=4`
+ADMISSION_ENDPOINT_LIMITS = {}
+for limit in os.environ.get('ADMISSION_ENDPOINT_LIMITS', '').split(','):
+    if not limit.strip():
+        continue
+    path, _, value = limit.partition('=')
+    if (not path.strip().startswith('/')) or (not value.strip().isdigit()):
+        sys.exit("invalid admission endpoint limit '{}' - must be like /entities/from-url=16".format(limit.strip()))
+    ADMISSION_ENDPOINT_LIMITS[path.strip()] = int(value)
+ADMISSION_QUEUE_SIZE = int(os.environ.get('ADMISSION_QUEUE_SIZE', 100))  # requests waiting per endpoint, beyond the cap
+ADMISSION_MAX_WAIT_SECS = float(os.environ.get('ADMISSION_MAX_WAIT_SECS', 30))
+ADMISSION_RETRY_AFTER_SECS = int(os.environ.get('ADMISSION_RETRY_AFTER_SECS', 5))
+# per client token bucket: clients are told apart by the RATE_LIMIT_KEY_HEADER header if it has one of the
+# RATE_LIMIT_API_KEYS, or by their IP address otherwise (so clients can't dodge the limit by making up new keys)
+RATE_LIMIT_PER_SEC = float(os.environ.get('RATE_LIMIT_PER_SEC', 0))  # 0 for no limit
+RATE_LIMIT_BURST = int(os.environ.get('RATE_LIMIT_BURST', 10))
+RATE_LIMIT_KEY_HEADER = os.environ.get('RATE_LIMIT_KEY_HEADER', 'X-API-Key')
+RATE_LIMIT_API_KEYS = {key.strip() for key in os.environ.get('RATE_LIMIT_API_KEYS', '').split(',') if key.strip()}
+# how many proxies in front of the server add to X-Forwarded-For, to take the IP address from there (0 to not use it)
+RATE_LIMIT_TRUST_FORWARDED = int(os.environ.get('RATE_LIMIT_TRUST_FORWARDED', 0))
+
+# the job API (see `helpers.jobs`) keeps its queue in this SQLite file, and is turned off without one
+JOB_DB_PATH = os.environ.get('JOB_DB_PATH', None)
+JOB_FETCH_WORKERS = int(os.environ.get('JOB_FETCH_WORKERS', 8))  # webpages downloaded at once, per server process
+JOB_NER_WORKERS = int(os.environ.get('JOB_NER_WORKERS', 1))  # threads finding entities, per server process
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+JOB_RETRY_BACKOFF_SECS = float(os.environ.get('JOB_RETRY_BACKOFF_SECS', 30))  # doubles after each failed attempt
+JOB_RESULT_TTL_SECS = float(os.environ.get('JOB_RESULT_TTL_SECS', 24 * 60 * 60))
+JOB_LEASE_SECS = float(os.environ.get('JOB_LEASE_SECS', 600))  # retry a job if its worker hasn't finished by then
+JOB_POLL_SECS = float(os.environ.get('JOB_POLL_SECS', 1))
+
+# request bodies sent with `Content-Encoding: gzip` (or zstd) are decompressed as they are read, up to this size
+REQUEST_MAX_DECOMPRESSED_BYTES = int(os.environ.get('REQUEST_MAX_DECOMPRESSED_BYTES', 100 * 1024 * 1024))  # 0 for none
+RESPONSE_GZIP_MIN_BYTES = int(os.environ.get('RESPONSE_GZIP_MIN_BYTES', 1000))  # 0 to never gzip responses
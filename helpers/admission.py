@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Dict, Optional, Set
+
+from helpers import ADMISSION_MAX_CONCURRENT, ADMISSION_ENDPOINT_LIMITS, ADMISSION_QUEUE_SIZE, \
+    ADMISSION_MAX_WAIT_SECS, ADMISSION_RETRY_AFTER_SECS, RATE_LIMIT_PER_SEC, RATE_LIMIT_BURST, RATE_LIMIT_KEY_HEADER, \
+    RATE_LIMIT_API_KEYS, RATE_LIMIT_TRUST_FORWARDED
+from helpers.cache import LRUCache
+from helpers.encoding import negotiate
+from helpers.exceptions import ServerBusyException, RateLimitedException
+from helpers.metrics import ADMISSION_WAITING, ADMISSION_REJECTED
+from helpers.request import back_off_response
+
+logger = logging.getLogger(__name__)
+
+# clients can ask us not to start their request if it can't start within this many seconds
+DEADLINE_HEADER = 'X-Request-Timeout'
+
+REASON_RATE_LIMITED = 'rate_limited'
+REASON_QUEUE_FULL = 'queue_full'
+REASON_DEADLINE = 'deadline'
+
+# how much each finished request moves the average time requests take, for estimating how long a wait will be
+_SERVICE_TIME_WEIGHT = 0.2
+
+
+class ConcurrencyLimiter:
+    """
+    Lets at most `max_concurrent` requests run at once, with up to `queue_size` more waiting their turn in order.
+    Requests that can't start within their deadline are turned away with a `ServerBusyException`: right away if the
+    queue is full, or if the time requests have been taking says they wouldn't start in time, otherwise when the
+    deadline passes. All the methods must be called from the same event loop.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, queue_size: int, retry_after_secs: int):
+        self.name = name
+        self._max_concurrent = max_concurrent
+        self._queue_size = queue_size
+        self._retry_after_secs = retry_after_secs
+        self._active = 0
+        self._waiters = deque()
+        self._avg_secs = None  # moving average of how long requests take, once some have finished
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def expected_wait_secs(self) -> Optional[float]:
+        if self._avg_secs is None:
+            return None
+        return math.ceil((self.waiting + 1) / self._max_concurrent) * self._avg_secs
+
+    async def acquire(self, deadline_secs: float):
+        if (self._active < self._max_concurrent) and not self._waiters:
+            self._active += 1
+            return
+        if self.waiting >= self._queue_size:
+            self._reject(REASON_QUEUE_FULL, "Too many requests waiting for {}".format(self.name))
+        expected_wait_secs = self.expected_wait_secs()
+        if (expected_wait_secs is not None) and (expected_wait_secs > deadline_secs):
+            self._reject(REASON_DEADLINE, "Requests to {} are waiting about {:.1f} secs to start, longer than the "
+                                          "{:.1f} sec deadline".format(self.name, expected_wait_secs, deadline_secs))
+        turn = asyncio.get_running_loop().create_future()
+        self._waiters.append(turn)
+        ADMISSION_WAITING.inc(endpoint=self.name)
+        try:
+            await asyncio.wait_for(turn, deadline_secs)
+        except asyncio.TimeoutError:
+            self._give_up(turn)
+            self._reject(REASON_DEADLINE, "Request to {} couldn't start within {:.1f} secs".format(self.name,
+                                                                                                   deadline_secs))
+        except BaseException:  # ie. the client went away
+            self._give_up(turn)
+            raise
+        finally:
+            ADMISSION_WAITING.dec(endpoint=self.name)
+
+    def release(self, secs: Optional[float] = None):
+        """
+        Hand the slot to the next request waiting, if any. Pass how long the request took, to improve wait estimates.
+        """
+        if secs is not None:
+            self._avg_secs = secs if self._avg_secs is None else \
+                (_SERVICE_TIME_WEIGHT * secs + (1 - _SERVICE_TIME_WEIGHT) * self._avg_secs)
+        while self._waiters:
+            turn = self._waiters.popleft()
+            if not turn.done():
+                turn.set_result(None)  # the slot passes straight to it, so `_active` stays the same
+                return
+        self._active -= 1
+
+    def _give_up(self, turn: asyncio.Future):
+        if turn.done() and not turn.cancelled():
+            self.release()  # it was handed the slot just as it gave up
+        elif turn in self._waiters:
+            self._waiters.remove(turn)
+
+    def _reject(self, reason: str, message: str):
+        ADMISSION_REJECTED.inc(endpoint=self.name, reason=reason)
+        raise ServerBusyException(message, self._retry_after_secs)
+
+
+class TokenBucket:
+    """
+    Allows `rate_per_sec` requests per second on average, with bursts of up to `burst` at once.
+    """
+
+    def __init__(self, rate_per_sec: float, burst: int):
+        self._rate_per_sec = rate_per_sec
+        self._burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def take(self) -> float:
+        """
+        Take a token if there is one. Returns 0 if there was, otherwise how many seconds until there will be.
+        """
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate_per_sec)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self._rate_per_sec
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware that decides whether to start each POST request, before its body is read or a thread is tied up
+    working on it: first against the client's rate limit (429 if it is over), then against the concurrency cap for the
+    endpoint (503 if it can't start in time). Rejections use the same response format as `api_method`, with a
+    `Retry-After` header so clients can back off.
+    """
+
+    def __init__(self, app, max_concurrent: int = ADMISSION_MAX_CONCURRENT,
+                 endpoint_limits: Dict[str, int] = ADMISSION_ENDPOINT_LIMITS, queue_size: int = ADMISSION_QUEUE_SIZE,
+                 max_wait_secs: float = ADMISSION_MAX_WAIT_SECS, retry_after_secs: int = ADMISSION_RETRY_AFTER_SECS,
+                 rate_per_sec: float = RATE_LIMIT_PER_SEC, burst: int = RATE_LIMIT_BURST,
+                 key_header: str = RATE_LIMIT_KEY_HEADER, api_keys: Set[str] = RATE_LIMIT_API_KEYS,
+                 trusted_proxies: int = RATE_LIMIT_TRUST_FORWARDED, max_clients: int = 10000):
+        self.app = app
+        self._max_concurrent = max_concurrent
+        self._endpoint_limits = endpoint_limits
+        self._queue_size = queue_size
+        self._max_wait_secs = max_wait_secs
+        self._retry_after_secs = retry_after_secs
+        self._rate_per_sec = rate_per_sec
+        self._burst = burst
+        self._key_header = key_header.lower().encode('latin-1')
+        self._api_keys = api_keys
+        self._trusted_proxies = trusted_proxies
+        self._limiters = {}
+        self._endpoints = None
+        self._buckets = LRUCache(max_clients)  # forgetting a quiet client just gives it a full bucket again
+
+    async def __call__(self, scope, receive, send):
+        if (scope['type'] != 'http') or (scope['method'] != 'POST') or not self._is_endpoint(scope):
+            await self.app(scope, receive, send)
+            return
+        start_time = time.time()
+        path = scope['path']
+        headers = dict(scope['headers'])
+        limiter = self._limiter(path)
+        try:
+            self._check_rate(path, scope, headers)
+            if limiter is not None:
+                await limiter.acquire(self._deadline_secs(headers))
+        except (RateLimitedException, ServerBusyException) as e:
+            logger.info("Turned away request to {}: {}".format(path, e))
+            # this runs before `ResponseFormatMiddleware`, so work out the format from the `Accept` header here
+            media_type = negotiate(headers.get(b'accept', b'').decode('latin-1'))
+            await back_off_response(e, start_time, media_type)(scope, receive, send)
+            return
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+        work_start_time = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(time.monotonic() - work_start_time)
+
+    def _is_endpoint(self, scope) -> bool:
+        # only paths the app has routes for, so requests to made up ones can't fill up the limiters (or the metrics)
+        if self._endpoints is None:
+            self._endpoints = {getattr(route, 'path', None) for route in scope['app'].routes}
+        return scope['path'] in self._endpoints
+
+    def _limiter(self, path: str) -> Optional[ConcurrencyLimiter]:
+        max_concurrent = self._endpoint_limits.get(path, self._max_concurrent)
+        if max_concurrent <= 0:
+            return None
+        if path not in self._limiters:
+            self._limiters[path] = ConcurrencyLimiter(path, max_concurrent, self._queue_size, self._retry_after_secs)
+        return self._limiters[path]
+
+    def _deadline_secs(self, headers: Dict[bytes, bytes]) -> float:
+        requested = headers.get(DEADLINE_HEADER.lower().encode('latin-1'))
+        try:
+            return min(self._max_wait_secs, float(requested)) if requested else self._max_wait_secs
+        except ValueError:
+            return self._max_wait_secs
+
+    def _client_key(self, scope, headers: Dict[bytes, bytes]) -> str:
+        api_key = headers.get(self._key_header, b'').decode('latin-1')
+        if api_key in self._api_keys:  # anything else could be made up, so it counts against the IP address
+            return 'key:' + api_key
+        forwarded = headers.get(b'x-forwarded-for') if self._trusted_proxies > 0 else None
+        if forwarded:
+            # each proxy adds the address it got the request from to the end, and the client can send anything before
+            # those, so take the one added by the proxy furthest out
+            addresses = [address.strip() for address in forwarded.decode('latin-1').split(',')]
+            return 'ip:' + addresses[max(len(addresses) - self._trusted_proxies, 0)]
+        client = scope.get('client')
+        return 'ip:' + (client[0] if client else 'unknown')
+
+    def _check_rate(self, path: str, scope, headers: Dict[bytes, bytes]):
+        if self._rate_per_sec <= 0:
+            return
+        key = self._client_key(scope, headers)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self._rate_per_sec, self._burst)
+            self._buckets.put(key, bucket)
+        wait_secs = bucket.take()
+        if wait_secs > 0:
+            ADMISSION_REJECTED.inc(endpoint=path, reason=REASON_RATE_LIMITED)
+            raise RateLimitedException("Rate limit of {} requests/sec exceeded".format(self._rate_per_sec),
+                                       max(1, math.ceil(wait_secs)))
@@ -0,0 +1,82 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent calls into batches. Each call hands over a list of texts and blocks; a background thread
+    gathers the texts from calls made within `max_wait_ms` of each other (up to `max_batch_size` of them), runs them
+    through `func` as one batch, and hands each caller back its own slice of the results. This lets a model that is
+    much faster on batches (ie. a transformer) benefit when many requests each bring one document. With `max_wait_ms`
+    of 0 calls just run `func` directly.
+    """
+
+    def __init__(self, func: Callable[[List[str]], List], max_batch_size: int, max_wait_ms: float,
+                 name: str = "batcher"):
+        """
+        :param func: takes a list of texts and returns a list of results, one for each
+        :param max_batch_size: stop gathering calls once there are this many texts
+        :param max_wait_ms: longest to wait for more calls after the first one arrives
+        :param name: for the background thread
+        """
+        self._func = func
+        self._max_batch_size = max_batch_size
+        self._max_wait_secs = max_wait_ms / 1000
+        self._name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._max_wait_secs > 0
+
+    def __call__(self, texts: List[str]) -> List:
+        if (not self.enabled) or (not texts):
+            return self._func(texts)
+        self._start()
+        future = Future()
+        self._queue.put((texts, future))
+        return future.result()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            pending = [self._queue.get()]
+            size = len(pending[0][0])
+            deadline = time.monotonic() + self._max_wait_secs
+            while size < self._max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+                size += len(pending[-1][0])
+            self._run_batch(pending)
+
+    def _run_batch(self, pending):
+        texts = [text for call_texts, _ in pending for text in call_texts]
+        try:
+            results = self._func(texts)
+        except Exception as e:
+            for _, future in pending:
+                future.set_exception(e)
+            return
+        logger.debug("Ran a batch of {} texts from {} calls".format(len(texts), len(pending)))
+        offset = 0
+        for call_texts, future in pending:
+            future.set_result(results[offset:offset + len(call_texts)])
+            offset += len(call_texts)
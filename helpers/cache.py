@@ -0,0 +1,185 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# connections a forked process inherited from its parent, kept so they are never closed (or used) in the child
+_inherited_connections = []
+
+# counts of cache hits and misses for the request currently being handled (see `helpers.request.api_method`)
+_request_stats: ContextVar[Optional[Dict]] = ContextVar('cache_request_stats', default=None)
+
+
+def start_request_stats() -> Dict:
+    """
+    Start counting cache hits and misses for the current request. Returns the dict the counts are added to.
+    """
+    stats = dict(hits=0, misses=0)
+    _request_stats.set(stats)
+    return stats
+
+
+def cache_key(*parts: str) -> str:
+    return hashlib.sha256("\0".join(parts).encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory cache that holds up to `max_size` items, dropping the least-recently-used ones first.
+    """
+
+    def __init__(self, max_size: int):
+        self._max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key: str, value: Any):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self._max_size:
+                self._items.popitem(last=False)
+
+
+class SQLiteConnection:
+    """
+    A SQLite connection shared by the threads of a process, opened on first use. SQLite connections mustn't be
+    carried across a `fork()` (ie. the gunicorn master preloading the app with `--preload`), so after a fork the
+    child opens its own connection, and leaves the one it inherited alone.
+    """
+
+    def __init__(self, path: str, setup: Optional[Callable[[sqlite3.Connection], None]] = None):
+        """
+        :param path:
+        :param setup: called with each new connection, ie. to create tables
+        """
+        self._path = path
+        self._setup = setup
+        self._lock = threading.Lock()
+        self._db = None
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        The connection for this process, locked for the duration of the `with` block.
+        """
+        with self._lock:
+            if self._db is None:
+                self._db = sqlite3.connect(self._path, check_same_thread=False, timeout=30)
+                if self._setup is not None:
+                    self._setup(self._db)
+            yield self._db
+
+    def _after_fork(self):
+        if self._db is not None:
+            _inherited_connections.append(self._db)
+        self._db = None
+        self._lock = threading.Lock()  # another thread in the parent might have been holding it
+
+
+class SQLiteCache:
+    """
+    On-disk cache of JSON-serializable values in a SQLite file, so results survive restarts (and can be shared by
+    several workers on the same machine). When it grows past `max_size` items the oldest ones are deleted.
+    """
+
+    PRUNE_EVERY = 1000  # check the size after this many writes
+
+    def __init__(self, path: str, max_size: int = 0):
+        self._max_size = max_size
+        self._writes = 0
+        self._db = SQLiteConnection(path, self._create)
+
+    @staticmethod
+    def _create(db: sqlite3.Connection):
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, created REAL)")
+        db.execute("CREATE INDEX IF NOT EXISTS cache_created ON cache (created)")
+        db.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._db.connection() as db:
+            row = db.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, value: Any):
+        with self._db.connection() as db:
+            db.execute("INSERT OR REPLACE INTO cache (key, value, created) VALUES (?, ?, ?)",
+                       (key, json.dumps(value), time.time()))
+            db.commit()
+            self._writes += 1
+            if self._max_size and (self._writes % self.PRUNE_EVERY == 0):
+                self._prune(db)
+
+    def _prune(self, db: sqlite3.Connection):
+        db.execute("DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                   (self._max_size,))
+        db.commit()
+
+
+class TieredCache:
+    """
+    A bounded in-memory LRU cache, optionally backed by a SQLite file. Lookups check memory first, then disk
+    (promoting disk hits into memory). Keeps running totals of hits and misses, plus counts for the current request.
+    """
+
+    def __init__(self, memory_size: int, disk_path: Optional[str] = None, disk_size: int = 0):
+        self._memory = LRUCache(memory_size) if memory_size > 0 else None
+        self._disk = SQLiteCache(disk_path, disk_size) if disk_path else None
+        self._hits = 0
+        self._misses = 0
+        if self._disk is not None:
+            logger.info("Caching results on disk at {}".format(disk_path))
+
+    @property
+    def enabled(self) -> bool:
+        return (self._memory is not None) or (self._disk is not None)
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        value = self._memory.get(key) if self._memory is not None else None
+        if (value is None) and (self._disk is not None):
+            value = self._disk.get(key)
+            if (value is not None) and (self._memory is not None):
+                self._memory.put(key, value)
+        self._count(value is not None)
+        return value
+
+    def put(self, key: str, value: Any):
+        if self._memory is not None:
+            self._memory.put(key, value)
+        if self._disk is not None:
+            self._disk.put(key, value)
+
+    def stats(self) -> Dict:
+        return dict(hits=self._hits, misses=self._misses)
+
+    def _count(self, hit: bool):
+        if hit:
+            self._hits += 1
+        else:
+            self._misses += 1
+        request_stats = _request_stats.get()
+        if request_stats is not None:
+            request_stats['hits' if hit else 'misses'] += 1
@@ -0,0 +1,79 @@
+import re
+from typing import Dict, List, Tuple
+
+# places to split text, from most to least preferred: paragraphs, then sentences, then any whitespace
+_BOUNDARIES = [
+    re.compile(r'\n\s*\n\s*'),
+    re.compile(r'(?<=[.!?。？！])\s+'),
+    re.compile(r'\s+'),
+]
+
+
+def chunk_spans(text: str, max_chars: int, overlap_chars: int = 0) -> List[Tuple[int, int]]:
+    """
+    Split text into windows of at most `max_chars`, breaking at paragraph or sentence boundaries where possible (and
+    at whitespace, or mid-word, only if there are none). Consecutive windows share about `overlap_chars` of text, so an
+    entity cut in two at the end of one window is found whole in the next.
+    :param text:
+    :param max_chars: longest window to make (0 for no limit)
+    :param overlap_chars: how much text each window should repeat from the end of the one before it
+    :return: a list of (start, end) character offsets into the text
+    """
+    if (max_chars <= 0) or (len(text) <= max_chars):
+        return [(0, len(text))]
+    overlap_chars = min(overlap_chars, max_chars // 4)  # so each window still moves well past the one before it
+    spans = []
+    start = 0
+    while start + max_chars < len(text):
+        end = _last_boundary(text, start + max_chars // 2, start + max_chars) or (start + max_chars)
+        spans.append((start, end))
+        start = end
+        if overlap_chars > 0:
+            start = _first_boundary(text, end - overlap_chars, end) or (end - overlap_chars)
+    spans.append((start, len(text)))
+    return spans
+
+
+def _last_boundary(text: str, lo: int, hi: int) -> int:
+    for boundary in _BOUNDARIES:
+        matches = list(boundary.finditer(text, lo, hi))
+        if matches:
+            return matches[-1].end()
+    return 0
+
+
+def _first_boundary(text: str, lo: int, hi: int) -> int:
+    for boundary in _BOUNDARIES[1:]:  # a paragraph break is too rare to wait for here
+        match = boundary.search(text, lo, hi)
+        if match and match.end() < hi:
+            return match.end()
+    return 0
+
+
+def merge_entities(spans: List[Tuple[int, int]], chunk_entities: List[List[Dict]]) -> List[Dict]:
+    """
+    Combine the entities found in each window into one list with offsets into the whole text. Where windows overlap
+    the same entity can be found twice, perhaps cut short at the edge of one window; in that case we keep the version
+    found furthest from the edge of its window, where the model had the most context.
+    :param spans: the windows, from `chunk_spans`
+    :param chunk_entities: the entities found in each window, with offsets relative to that window
+    :return: a list of entities sorted by `start_char`
+    """
+    text_end = spans[-1][1] if spans else 0
+    candidates = []
+    for (start, end), entities in zip(spans, chunk_entities):
+        for entity in entities:
+            shifted = dict(entity, start_char=entity['start_char'] + start, end_char=entity['end_char'] + start)
+            # the edges of the whole text aren't cuts, so they don't count
+            margin = min(shifted['start_char'] - start if start > 0 else text_end,
+                         end - shifted['end_char'] if end < text_end else text_end)
+            candidates.append((shifted, margin))
+    candidates.sort(key=lambda candidate: (candidate[0]['start_char'], -candidate[0]['end_char']))
+    merged = []
+    for entity, margin in candidates:
+        if merged and entity['start_char'] < merged[-1][0]['end_char']:
+            if margin > merged[-1][1]:
+                merged[-1] = (entity, margin)
+            continue
+        merged.append((entity, margin))
+    return [entity for entity, _ in merged]
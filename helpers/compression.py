@@ -0,0 +1,179 @@
+import zlib
+from typing import Callable, Iterable, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from starlette.middleware.gzip import GZipMiddleware
+
+from helpers import REQUEST_MAX_DECOMPRESSED_BYTES, RESPONSE_GZIP_MIN_BYTES
+
+# optional: `pip install zstandard` to accept zstd request bodies
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ENCODING_GZIP = 'gzip'
+ENCODING_ZSTD = 'zstd'
+_GZIP_ALIASES = [ENCODING_GZIP, 'x-gzip']
+
+# compressed bodies are decompressed into pieces of at most this size, and the size limit is checked after each one,
+# so a small body that decompresses to something huge is stopped with at most this much more than the limit in memory
+_PIECE_BYTES = 64 * 1024
+
+# responses are gzipped at this level: most of the size savings of 9 for much less CPU time
+GZIP_LEVEL = 6
+
+
+def supported_encodings() -> Iterable[str]:
+    return [ENCODING_GZIP] + ([ENCODING_ZSTD] if zstandard is not None else [])
+
+
+def is_supported(encoding: str) -> bool:
+    return (encoding in _GZIP_ALIASES) or ((encoding == ENCODING_ZSTD) and (zstandard is not None))
+
+
+class _GzipDecoder:
+
+    def __init__(self, out: Callable[[bytes], None]):
+        self._out = out
+        self._zlib = zlib.decompressobj(16 + zlib.MAX_WBITS)  # expect a gzip header and trailer
+
+    def write(self, data: bytes):
+        while data:
+            self._out(self._zlib.decompress(data, _PIECE_BYTES))
+            data = self._zlib.unconsumed_tail  # the input it stopped at, once it had a whole piece
+
+    def finish(self):
+        self._out(self._zlib.flush())
+        if not self._zlib.eof:
+            raise ValueError("the compressed body ended early")
+
+
+class _Pieces:
+    # a file-like object that hands on whatever is written to it
+
+    def __init__(self, out: Callable[[bytes], None]):
+        self._out = out
+
+    def write(self, data: bytes) -> int:
+        self._out(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+class _ZstdDecoder:
+    # zstd's `decompressobj` returns everything a chunk decompresses to at once, but its `stream_writer` hands the
+    # output on a piece at a time
+
+    def __init__(self, out: Callable[[bytes], None]):
+        self._writer = zstandard.ZstdDecompressor().stream_writer(_Pieces(out), write_size=_PIECE_BYTES)
+
+    def write(self, data: bytes):
+        self._writer.write(data)
+
+    def finish(self):
+        self._writer.flush()
+
+
+def decompressor(encoding: str, out: Callable[[bytes], None]):
+    """
+    A streaming decompressor for a `Content-Encoding`, or None if we can't decode it. Pass compressed data to its
+    `write` method, and call `finish` at the end; the decompressed data is passed to `out` a piece at a time.
+    """
+    if not is_supported(encoding):
+        return None
+    return _GzipDecoder(out) if encoding in _GZIP_ALIASES else _ZstdDecoder(out)
+
+
+class _DecompressingReceive:
+    # wraps the ASGI `receive` function, decompressing each chunk of the body as the app reads it
+
+    def __init__(self, receive, encoding: str, max_bytes: int):
+        self._receive = receive
+        self._max_bytes = max_bytes
+        self._total_bytes = 0
+        self._pieces = []
+        self._decoder = decompressor(encoding, self._counted)
+        self._finished = False
+
+    async def __call__(self):
+        message = await self._receive()
+        if (message['type'] != 'http.request') or self._finished:
+            return message
+        more_body = message.get('more_body', False)
+        body = self._decompress(message.get('body', b''), final=not more_body)
+        self._finished = not more_body
+        return dict(message, body=body)
+
+    def _decompress(self, data: bytes, final: bool) -> bytes:
+        try:
+            self._decoder.write(data)
+            if final:
+                self._decoder.finish()
+        except HTTPException:
+            raise
+        except Exception as e:  # ie. `zlib.error` or `zstandard.ZstdError` for a corrupt body
+            raise HTTPException(status_code=400, detail="Couldn't decompress the request body: {}".format(e))
+        body, self._pieces = b''.join(self._pieces), []
+        return body
+
+    def _counted(self, piece: bytes):
+        self._total_bytes += len(piece)
+        if self._max_bytes and (self._total_bytes > self._max_bytes):
+            raise HTTPException(status_code=413, detail="Request body is more than {} bytes once decompressed".format(
+                self._max_bytes))
+        self._pieces.append(piece)
+
+
+class RequestDecompressionMiddleware:
+    """
+    ASGI middleware that decompresses request bodies sent with a `Content-Encoding` of gzip (or zstd, if `zstandard`
+    is installed). The body is decompressed a chunk at a time as the endpoint reads it, so the whole compressed body is
+    never held in memory alongside the decompressed one, and reading stops with a 413 as soon as it gets past
+    `max_bytes`. Other encodings are turned away with a 415.
+    """
+
+    def __init__(self, app, max_bytes: int = REQUEST_MAX_DECOMPRESSED_BYTES):
+        self.app = app
+        self._max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope['headers'])
+        encoding = headers.get(b'content-encoding', b'').decode('latin-1').strip().lower()
+        if encoding in ('', 'identity'):
+            await self.app(scope, receive, send)
+            return
+        if not is_supported(encoding):
+            response = JSONResponse(dict(detail="Unsupported Content-Encoding '{}' - use one of: {}".format(
+                encoding, ', '.join(supported_encodings()))), status_code=415)
+            await response(scope, receive, send)
+            return
+        # the endpoint sees a plain body, of a length we don't know yet
+        scope = dict(scope, headers=[(name, value) for name, value in scope['headers']
+                                     if name not in (b'content-encoding', b'content-length')])
+        await self.app(scope, _DecompressingReceive(receive, encoding, self._max_bytes), send)
+
+
+class ResponseCompressionMiddleware(GZipMiddleware):
+    """
+    Gzip responses of at least `minimum_size` bytes for clients that accept it, except on `excluded_paths`. Streaming
+    endpoints should be excluded, because gzip holds on to small writes until it has a block's worth, which would
+    stop results going out as soon as they are ready.
+    """
+
+    def __init__(self, app, minimum_size: int = RESPONSE_GZIP_MIN_BYTES, excluded_paths: Optional[Iterable[str]] = None,
+                 compresslevel: int = GZIP_LEVEL):
+        super().__init__(app, minimum_size=minimum_size, compresslevel=compresslevel)
+        self._excluded_paths = set(excluded_paths or [])
+
+    async def __call__(self, scope, receive, send):
+        if (self.minimum_size <= 0) or (scope['type'] != 'http') or (scope['path'] in self._excluded_paths):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
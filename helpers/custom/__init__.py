@@ -1,4 +1,5 @@
 import re
+from typing import List
 
 
 def matches_as_entities(pattern, text, type, **kwargs):
@@ -8,3 +9,36 @@ def matches_as_entities(pattern, text, type, **kwargs):
         text=text[m.start(0):m.end(0)],
         type=type
     ) for m in re.finditer(pattern, text, **kwargs)]
+
+
+def words_pattern(words: List[str]) -> str:
+    """
+    Build a case-insensitive regular expression that matches any of the words. The words are arranged into a trie, so
+    at each position in the text the regex engine checks each shared prefix once, instead of trying every word.
+    :param words: list of literal strings (not regular expressions)
+    :return: a regular expression string
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word.lower():
+            node = node.setdefault(char, {})
+        node[''] = {}  # marks the end of a word
+    return '(?i:{})'.format(_trie_pattern(trie))
+
+
+def _trie_pattern(node: dict) -> str:
+    alternatives = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char != '']
+    if not alternatives:
+        return ''
+    pattern = alternatives[0] if len(alternatives) == 1 else '(?:{})'.format('|'.join(alternatives))
+    if '' in node:  # a word ends here, so the rest is optional
+        pattern = '(?:{})?'.format(pattern)
+    return pattern
+
+
+def initials(words: List[str]) -> str:
+    """
+    The characters the words start with, escaped to go inside a regular expression character class.
+    """
+    return ''.join(sorted({re.escape(word[0].lower()) for word in words}))
@@ -6,6 +6,18 @@ from helpers.custom import matches_as_entities
 
 ENTITY_TYPE_C_AGE = "C_AGE"
 
+# ages of the form "x(x) años" for Spanish, "x(x) anos" for Portuguese, and "x(x)(-)year(s)(-)old" for English
+AGE_PATTERNS = {
+    SPANISH: r'[0-9]{1,2}\saños',
+    ENGLISH: r'[0-9]{1,2}(?:\s|-)(?:years|year)(?:\s|-)(?:old)',
+    PORTUGUESE: r'[0-9]{1,2}\sanos',
+}
+
+# the characters an age can start with in each language (see `helpers.custom.extractors`)
+AGE_INITIALS = {lang: '0-9' for lang in AGE_PATTERNS}
+
+_AGE_REGEXPS = {lang: re.compile(pattern) for lang, pattern in AGE_PATTERNS.items()}
+
 
 def extract_ages(text: str, language_code: str) -> List:
     """
@@ -15,14 +27,7 @@ def extract_ages(text: str, language_code: str) -> List:
     :param language_code: 'EN', 'ES' or 'PT'
     :return: List of strings corresponding to ages contained in the text.
     """
-    if language_code.lower() == SPANISH:
-        regexp = re.compile(r'[0-9]{1,2}\saños')
-    elif language_code.lower() == ENGLISH:
-        regexp = re.compile(r'[0-9]{1,2}(?:\s|-)(?:years|year)(?:\s|-)(?:old)')
-    elif language_code.lower() == PORTUGUESE:
-        regexp = re.compile(r'[0-9]{1,2}\sanos')
-    else:
-        regexp = None
+    regexp = _AGE_REGEXPS.get(language_code.lower())
     if regexp:
         return matches_as_entities(regexp, text, ENTITY_TYPE_C_AGE)
     return []
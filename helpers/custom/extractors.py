@@ -0,0 +1,53 @@
+import heapq
+import re
+from typing import Dict, Iterator, List, Tuple
+
+from helpers import LANGUAGES
+import helpers.custom.ages as ages
+import helpers.custom.dates as dates
+
+# registry of custom extractors: (entity type, regular expression for each language, characters a match can start
+# with in each language)
+EXTRACTORS = [
+    (ages.ENTITY_TYPE_C_AGE, ages.AGE_PATTERNS, ages.AGE_INITIALS),
+    (dates.ENTITY_TYPE_C_DATE, dates.DATE_PATTERNS, dates.DATE_INITIALS),
+]
+
+
+def _compile(language_code: str) -> List[Tuple[str, re.Pattern]]:
+    # one regular expression for each entity type, scanned separately so a match for one type can overlap another
+    # (ie. the "12/05/21 años" in "Tiene 12/05/21 años" is both a date and an age)
+    regexps = []
+    for entity_type, patterns, pattern_initials in EXTRACTORS:
+        if language_code in patterns:
+            # checking the next character first lets the engine skip most positions in the text without trying the
+            # whole pattern
+            regexps.append((entity_type, re.compile('(?=(?i:[{}])){}'.format(pattern_initials[language_code],
+                                                                             patterns[language_code]))))
+    return regexps
+
+
+_LANGUAGE_REGEXPS = {lang: _compile(lang) for lang in LANGUAGES}
+
+
+def _matches(regexp: re.Pattern, entity_type: str, text: str) -> Iterator[Dict]:
+    for m in regexp.finditer(text):
+        yield dict(
+            end_char=m.end(0),
+            start_char=m.start(0),
+            text=m.group(0),
+            type=entity_type
+        )
+
+
+def extract(text: str, language_code: str) -> List[Dict]:
+    """
+    Find all the custom entities (ages, dates, etc.) in the text, in the order they appear. Each entity type is found
+    with its own scan, so entities of different types can overlap.
+    :param text: string
+    :param language_code: one of the supported languages
+    :return: List of entity dicts, like the ones from `helpers.custom.matches_as_entities`
+    """
+    regexps = _LANGUAGE_REGEXPS.get(language_code.lower(), [])
+    return list(heapq.merge(*[_matches(regexp, entity_type, text) for entity_type, regexp in regexps],
+                            key=lambda k: k['start_char']))
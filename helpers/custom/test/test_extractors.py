@@ -0,0 +1,57 @@
+import re
+import unittest
+
+import helpers.custom.ages as ages
+import helpers.custom.dates as dates
+import helpers.custom.extractors as extractors
+from helpers.custom import words_pattern
+from helpers import SPANISH, ENGLISH, PORTUGUESE, GERMAN
+from helpers.custom.test.test_dates import test_string_es, test_string_pt
+from helpers.custom.test.test_ages import test_string_en
+
+
+class TestCustomExtractors(unittest.TestCase):
+
+    def _assert_same_as_separate_extractors(self, text: str, language_code: str):
+        separate_results = ages.extract_ages(text, language_code) + dates.extract_dates(text, language_code)
+        separate_results = sorted(separate_results, key=lambda k: k['start_char'])
+        assert extractors.extract(text, language_code) == separate_results
+
+    def test_extract_es(self):
+        results = extractors.extract(test_string_es, SPANISH)
+        assert len(results) == 13
+        assert [r['type'] for r in results].count(ages.ENTITY_TYPE_C_AGE) == 1
+        self._assert_same_as_separate_extractors(test_string_es, SPANISH)
+
+    def test_extract_pt(self):
+        results = extractors.extract(test_string_pt, PORTUGUESE)
+        assert len(results) == 13
+        assert results[0]['text'] == '08/03/21'
+        assert results[0]['type'] == dates.ENTITY_TYPE_C_DATE
+        self._assert_same_as_separate_extractors(test_string_pt, PORTUGUESE)
+
+    def test_extract_en(self):
+        results = extractors.extract(test_string_en, ENGLISH)
+        assert len(results) == 3
+        self._assert_same_as_separate_extractors(test_string_en, ENGLISH)
+
+    def test_extract_overlapping(self):
+        results = extractors.extract('Tiene 12/05/21 años', SPANISH)
+        assert [(r['type'], r['start_char'], r['end_char']) for r in results] == [
+            (dates.ENTITY_TYPE_C_DATE, 6, 14), (ages.ENTITY_TYPE_C_AGE, 12, 19)]
+        self._assert_same_as_separate_extractors('Tiene 12/05/21 años', SPANISH)
+
+    def test_extract_unsupported(self):
+        assert extractors.extract(test_string_es, GERMAN) == []
+
+    def test_words_pattern(self):
+        pattern = words_pattern(['Mar.', 'Marzo', 'Mayo', 'Lunes'])
+        assert re.fullmatch(pattern, 'MARZO')
+        assert re.fullmatch(pattern, 'mar.')
+        assert re.fullmatch(pattern, 'mayo')
+        assert not re.fullmatch(pattern, 'mar')
+        assert not re.fullmatch(pattern, 'marx')
+
+
+if __name__ == "__main__":
+    unittest.main()
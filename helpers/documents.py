@@ -0,0 +1,80 @@
+from typing import Dict, Optional
+
+import mcmetadata
+
+import helpers.domains as domains
+import helpers.entities as entities
+import helpers.fetch as fetch
+import helpers.languages as languages
+from helpers.executor import run_in_executor
+from helpers.metrics import stage
+
+# finding the entities in each kind of document the API takes, shared by the server and the command line tool
+
+
+def backwards_compatible_results(results: Dict) -> Dict:
+    results['text'] = results['text_content']
+    del results['text_content']
+    results['title'] = results['article_title']
+    del results['article_title']
+    results['url'] = results['original_url']
+    del results['original_url']
+    results['domain_name'] = results['canonical_domain']
+    del results['canonical_domain']
+    return results
+
+
+def entities_from_article(article_info: Dict, title: Optional[int], language: Optional[str] = None) -> Dict:
+    include_title = title == 1 if title is not None else False
+    article_text = ""
+    if include_title and (article_info['article_title'] is not None):
+        article_text += article_info['article_title'] + " "
+    article_text += article_info['text_content']
+    if language is not None:
+        article_info['language'] = languages.resolve(language, article_text)
+    found_entities = entities.from_text(article_text, article_info['language'])
+    results = article_info | dict(entities=found_entities)
+    results = backwards_compatible_results(results)
+    del results['text']
+    return results
+
+
+def entities_from_html(html: str, language: str, url: Optional[str]) -> Dict:
+    with stage('content_extraction'):
+        content = mcmetadata.content.from_html(url, html)
+    lang = languages.resolve(language, content['text'])
+    results = dict(
+        entities=entities.from_text(content['text'], lang),
+        domain_name=domains.canonical_domain(url) if url is not None else None,
+        url=url,
+        language=lang,
+    )
+    return results
+
+
+async def entities_from_stream_item(item: Dict) -> Dict:
+    """
+    Find the entities in one document from `/entities/stream` (or a line of a `cli` input file).
+    :param item: with a `language` and either `text`, `html` (plus an optional `url`) or a `url` to fetch (plus an
+                 optional `title`)
+    """
+    if item.get('text') is not None:
+        if item.get('language') is None:
+            raise ValueError("Missing language")
+        lang = languages.resolve(item['language'], item['text'])
+        found_entities = await run_in_executor(entities.from_text, item['text'], lang)
+        url = item.get('url')
+        return dict(
+            entities=found_entities,
+            domain_name=domains.canonical_domain(url) if url is not None else None,
+            url=url,
+            language=lang,
+        )
+    if item.get('html') is not None:
+        if item.get('language') is None:
+            raise ValueError("Missing language")
+        return await run_in_executor(entities_from_html, item['html'], item['language'], item.get('url'))
+    if item.get('url') is None:
+        raise ValueError("Each line needs either text, html or a url")
+    article_info = await fetch.extract_url(item['url'])
+    return await run_in_executor(entities_from_article, article_info, item.get('title'), item.get('language'))
@@ -0,0 +1,63 @@
+import logging
+import re
+from typing import List, Optional, Tuple
+
+import mcmetadata.urls
+
+from helpers import DOMAIN_CACHE_SIZE
+from helpers.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# a well-formed URL, split into its host (plus an optional port) and everything after it
+_URL_PARTS = re.compile(r'^https?://([^/?#\s:@]+)(?::\d+)?([/?#].*)?$', re.IGNORECASE | re.DOTALL)
+# `canonical_domain` changes these based on the rest of the URL, not just the host
+_PATH_DEPENDENT_HOSTS = ('archive.is', 'podomatic.com')
+
+_domain_cache = LRUCache(DOMAIN_CACHE_SIZE) if DOMAIN_CACHE_SIZE else None
+
+
+def _memo_key(url: str) -> Optional[Tuple[str, bool]]:
+    # None if the canonical domain might depend on more than the host, so it has to be worked out from the whole URL
+    match = _URL_PARTS.match(url.strip())
+    if match is None:
+        return None
+    host = match.group(1).lower()
+    rest = (match.group(2) or '').lower()
+    if host.endswith(_PATH_DEPENDENT_HOSTS) or ('podomatic' in rest) or mcmetadata.urls.blog_domain_pattern.search(rest):
+        return None
+    # percent-encoded characters in the path get decoded before the domain is worked out, so they could hide a dot
+    if '%' in rest:
+        return None
+    # the subdomain-stripping pattern in `normalize_url` can reach past a single-dot host into the path, if it has a dot
+    return host, '.' in rest
+
+
+def canonical_domain(url: str) -> str:
+    """
+    The same as `mcmetadata.urls.canonical_domain`, but remembers the result for each host, so repeated hosts are only
+    worked out once. URLs whose domain could depend on their path (ie. archive.is links) always get worked out in full.
+    """
+    key = _memo_key(url) if _domain_cache is not None else None
+    if key is None:
+        return mcmetadata.urls.canonical_domain(url)
+    domain = _domain_cache.get(key)
+    if domain is None:
+        domain = mcmetadata.urls.canonical_domain(url)
+        _domain_cache.put(key, domain)
+    return domain
+
+
+def canonical_domains(urls: List[str]) -> List[Optional[str]]:
+    """
+    The canonical domain of each URL, in the same order. A URL that can't be parsed gets None rather than failing the
+    whole list.
+    """
+    domains = []
+    for url in urls:
+        try:
+            domains.append(canonical_domain(url))
+        except Exception as e:
+            logger.debug("Couldn't get a domain for {}: {}".format(url, e))
+            domains.append(None)
+    return domains
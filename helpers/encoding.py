@@ -0,0 +1,173 @@
+import logging
+from contextvars import ContextVar
+from typing import Any, Dict, List, NamedTuple, Optional
+from urllib.parse import parse_qs
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
+
+from helpers.summary import summarize
+
+logger = logging.getLogger(__name__)
+
+# both optional: `orjson` comes with `fastapi[all]`, and `pip install msgpack` to offer msgpack responses
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MEDIA_JSON = 'application/json'
+MEDIA_MSGPACK = 'application/msgpack'
+_MSGPACK_ALIASES = [MEDIA_MSGPACK, 'application/x-msgpack', 'application/vnd.msgpack']
+
+LAYOUT_ROWS = 'rows'
+LAYOUT_COLUMNAR = 'columnar'
+LAYOUT_SUMMARY = 'summary'
+LAYOUTS = [LAYOUT_ROWS, LAYOUT_COLUMNAR, LAYOUT_SUMMARY]
+LAYOUT_PARAM = 'entity_layout'
+TOP_K_PARAM = 'entity_top_k'  # for the summary layout
+
+
+class ResponseFormat(NamedTuple):
+    media_type: str
+    layout: str = LAYOUT_ROWS
+    top_k: int = 0
+
+
+# how the client asked for the response to the request currently being handled
+_response_format: ContextVar[Optional[ResponseFormat]] = ContextVar('response_format', default=None)
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """
+    The media type to respond with for an `Accept` header: msgpack if the client prefers it (and it is installed),
+    otherwise JSON.
+    """
+    if not accept:
+        return MEDIA_JSON
+    ranges = []
+    for position, media_range in enumerate(accept.split(',')):
+        media_type, *params = [part.strip() for part in media_range.split(';')]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        ranges.append((-quality, position, media_type.lower()))
+    for negative_quality, _, media_type in sorted(ranges):
+        if negative_quality >= 0:  # q=0 means "not this"
+            break
+        if (media_type in _MSGPACK_ALIASES) and (msgpack is not None):
+            return MEDIA_MSGPACK
+        if media_type in (MEDIA_JSON, 'application/*', '*/*'):
+            return MEDIA_JSON
+    return MEDIA_JSON
+
+
+def columnar_entities(entities: List[Dict]) -> Dict:
+    """
+    Entities as parallel arrays instead of a list of dicts, with each type stored once in a `types` table and
+    referred to by its index, which is much smaller and faster to encode for entity-dense articles. Entity `i` is
+    `text[i]`, `types[type[i]]`, `start_char[i]` and `end_char[i]`.
+    """
+    type_indexes = {}
+    columns = dict(types=[], text=[], type=[], start_char=[], end_char=[])
+    for entity in entities:
+        if entity['type'] not in type_indexes:
+            type_indexes[entity['type']] = len(columns['types'])
+            columns['types'].append(entity['type'])
+        columns['text'].append(entity['text'])
+        columns['type'].append(type_indexes[entity['type']])
+        columns['start_char'].append(entity['start_char'])
+        columns['end_char'].append(entity['end_char'])
+    return columns
+
+
+def _entities_in_layout(entities: List[Dict], layout: str, top_k: int):
+    if layout == LAYOUT_COLUMNAR:
+        return columnar_entities(entities)
+    return summarize(entities, top_k)
+
+
+def to_layout(results: Any, layout: str, top_k: int = 0) -> Any:
+    """
+    Change every `entities` list in the results to the layout (they are already in the `rows` one): `columnar` (see
+    `columnar_entities`) or a `summary` of each unique entity (see `helpers.summary.summarize`).
+    """
+    if layout == LAYOUT_ROWS:
+        return results
+    if isinstance(results, list):
+        return [to_layout(item, layout, top_k) for item in results]
+    if isinstance(results, dict):
+        return {key: _entities_in_layout(value, layout, top_k) if (key == 'entities') and isinstance(value, list)
+                else to_layout(value, layout, top_k) for key, value in results.items()}
+    return results
+
+
+def json_default(obj: Any) -> Any:
+    """
+    Anything `json.dumps` or msgpack don't know about (ie. publication dates in article metadata), encoded the same way
+    as in JSON responses. Pass it as the `default` everywhere results are encoded outside of a response.
+    """
+    return jsonable_encoder(obj)
+
+
+class MsgpackResponse(Response):
+    media_type = MEDIA_MSGPACK
+
+    def render(self, content: Any) -> bytes:
+        return msgpack.packb(content, default=json_default, use_bin_type=True)
+
+
+def response_format() -> Optional[ResponseFormat]:
+    """
+    How to encode the response to the current request, or None outside of a request (ie. in tests).
+    """
+    return _response_format.get()
+
+
+def encode(content: Any, media_type: str, status_code: int = 200, headers: Optional[Dict] = None) -> Response:
+    # the same url can get JSON or msgpack back, so caches have to keep them apart
+    headers = {'Vary': 'Accept', **(headers or {})}
+    if media_type == MEDIA_MSGPACK:
+        return MsgpackResponse(content, status_code=status_code, headers=headers)
+    if orjson is not None:
+        try:
+            return ORJSONResponse(content, status_code=status_code, headers=headers)
+        except TypeError as e:  # something orjson can't encode; FastAPI's encoder handles more types, more slowly
+            logger.debug("Falling back to the standard JSON encoder: {}".format(e))
+    return JSONResponse(jsonable_encoder(content), status_code=status_code, headers=headers)
+
+
+class ResponseFormatMiddleware:
+    """
+    ASGI middleware that works out how to encode the response from the `Accept` header and the `entity_layout` and
+    `entity_top_k` query params, for `api_method` to use.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope['headers'])
+        accept = headers.get(b'accept', b'').decode('latin-1')
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        layout = query.get(LAYOUT_PARAM, [LAYOUT_ROWS])[0]
+        if layout not in LAYOUTS:
+            layout = LAYOUT_ROWS
+        top_k = query.get(TOP_K_PARAM, ['0'])[0]
+        token = _response_format.set(ResponseFormat(negotiate(accept), layout, int(top_k) if top_k.isdigit() else 0))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _response_format.reset(token)
@@ -1,50 +1,166 @@
-import spacy
-from typing import List, Dict
-
-from helpers import ENGLISH, SPANISH, PORTUGUESE, FRENCH, GERMAN, KOREAN, SWAHILI, MODEL_MODE_SMALL, MODEL_MODE
-import helpers.custom.ages as ages
-import helpers.custom.dates as dates
+from typing import List, Dict, Optional, Tuple
+
+from helpers import SWAHILI, NLP_BATCH_SIZE, NLP_N_PROCESS, MAX_LOADED_MODELS, \
+    MAX_MODELS_MEMORY_MB, ENTITY_CACHE_SIZE, ENTITY_CACHE_PATH, ENTITY_CACHE_DISK_SIZE, MODEL_MODE, VERSION, \
+    CHUNK_MAX_CHARS, CHUNK_OVERLAP_CHARS, TRANSFORMER_CHUNK_MAX_CHARS, TRANSFORMER_CHUNK_OVERLAP_CHARS, \
+    SWAHILI_BATCH_SIZE, SWAHILI_BATCH_WAIT_MS, SWAHILI_BACKEND, PREPROCESS_COLLAPSE_WHITESPACE, \
+    PREPROCESS_DROP_BOILERPLATE, PREPROCESS_MAX_CHARS
+import helpers.custom.extractors as extractors
+from helpers.batching import MicroBatcher
+from helpers.cache import TieredCache, cache_key
+from helpers.chunking import chunk_spans, merge_entities
 from helpers.exceptions import UnknownLanguageException
+from helpers.languages import resolve as resolve_language
+from helpers.metrics import stage, count_document
+from helpers.models import ModelRegistry, default_loaders, run_huggingface_pipeline
+from helpers.pool import ner_pool
+from helpers.preprocess import preprocess
 
-from transformers import pipeline, AutoTokenizer, AutoModelForTokenClassification
-
+# lookup table that maps from language code to default spaCy or HuggingFace NER model, loaded on first use (or at
+# startup, see `helpers.startup`)
+language_nlp_lookup = ModelRegistry(default_loaders(), max_loaded=MAX_LOADED_MODELS,
+                                    max_memory_mb=MAX_MODELS_MEMORY_MB)
 
-def get_masakhaner_pipeline(hf_ner_model="Davlan/xlm-roberta-large-masakhaner"):
-    tokenizer = AutoTokenizer.from_pretrained(hf_ner_model)
-    model = AutoModelForTokenClassification.from_pretrained(hf_ner_model)
-    return pipeline("ner", model=model, tokenizer=tokenizer, aggregation_strategy="simple")
+# the transformer is much faster on batches, so concurrent Swahili requests are run through it together
+swahili_batcher = MicroBatcher(lambda texts: run_huggingface_pipeline(language_nlp_lookup[SWAHILI], texts,
+                                                                      SWAHILI_BATCH_SIZE),
+                               SWAHILI_BATCH_SIZE, SWAHILI_BATCH_WAIT_MS, name="swahili-batcher")
 
-
-# lookup table that maps from language code to default spaCy or HuggingFace NER model
-language_nlp_lookup = {
-    ENGLISH: spacy.load("en_core_web_sm" if MODEL_MODE == MODEL_MODE_SMALL else "en_core_web_lg"),
-    SPANISH: spacy.load("es_core_news_sm" if MODEL_MODE == MODEL_MODE_SMALL else "es_core_news_lg"),
-    PORTUGUESE: spacy.load("pt_core_news_sm" if MODEL_MODE == MODEL_MODE_SMALL else "pt_core_news_lg"),
-    FRENCH: spacy.load("fr_core_news_sm" if MODEL_MODE == MODEL_MODE_SMALL else "fr_core_news_lg"),
-    GERMAN: spacy.load("de_core_news_sm" if MODEL_MODE == MODEL_MODE_SMALL else "de_core_news_lg"),
-    KOREAN: spacy.load("ko_core_news_sm" if MODEL_MODE == MODEL_MODE_SMALL else "ko_core_news_lg"),
-    SWAHILI: get_masakhaner_pipeline() 
-}
+# the same text is often submitted many times (ie. syndicated wire stories, or retried batches)
+entity_cache = TieredCache(ENTITY_CACHE_SIZE, ENTITY_CACHE_PATH, ENTITY_CACHE_DISK_SIZE)
 
 
 def from_text(text: str, language_code: str) -> List[Dict]:
-    lang = language_code.lower()
+    lang = resolve_language(language_code, text)  # detects it for `auto`
 
     if lang not in language_nlp_lookup:
         raise UnknownLanguageException()
 
+    count_document(lang, text)
+    key = _cache_key(text, lang)
+    cached_entities = entity_cache.get(key)
+    if cached_entities is not None:
+        return _copy(cached_entities)
+    entities = ner_pool.run(_from_text, text, lang)
+    entity_cache.put(key, entities)
+    return _copy(entities)
+
+
+def _from_text(text: str, lang: str) -> List[Dict]:
+    return _from_texts([text], lang, NLP_BATCH_SIZE, 1)[0]
+
+
+def from_texts(items: List[Dict], batch_size: Optional[int] = None, n_process: Optional[int] = None) -> List[List[Dict]]:
+    """
+    Find entities in many documents at once. Documents are grouped by language so each model can process them as a
+    batch (via spaCy's `nlp.pipe`, or a list input to the HuggingFace pipeline), which is much faster than calling
+    `from_text` on each one.
+    :param items: list of dicts, each with `text` and `language` keys (the language can be `auto` to detect it, so
+                  a batch in mixed languages is split up between the right models)
+    :param batch_size: how many documents the model should process at a time (defaults to NLP_BATCH_SIZE)
+    :param n_process: how many processes spaCy should use (defaults to NLP_N_PROCESS)
+    :return: a list of entity lists, in the same order as the input items
+    """
+    batch_size = batch_size or NLP_BATCH_SIZE
+    n_process = n_process or NLP_N_PROCESS
+    # validate (or detect) all the languages up front, so we don't do any work on a batch that is going to fail
+    languages = resolve_languages(items)
+    for item, lang in zip(items, languages):
+        count_document(lang, item['text'])
+    results = [None] * len(items)
+    keys = [_cache_key(item['text'], lang) for item, lang in zip(items, languages)]
+    indices_by_language = {}
+    for idx, lang in enumerate(languages):
+        cached_entities = entity_cache.get(keys[idx])
+        if cached_entities is not None:
+            results[idx] = _copy(cached_entities)
+        else:
+            indices_by_language.setdefault(lang, []).append(idx)
+    if ner_pool.enabled:
+        n_process = 1  # worker processes can't start processes of their own
+    for lang, indices in indices_by_language.items():
+        texts = [items[idx]['text'] for idx in indices]
+        batch_entities = ner_pool.run(_from_texts, texts, lang, batch_size, n_process)
+        for idx, entities in zip(indices, batch_entities):
+            entity_cache.put(keys[idx], entities)
+            results[idx] = _copy(entities)
+    return results
+
+
+def resolve_languages(items: List[Dict]) -> List[str]:
+    """
+    The language code to process each item with, detecting it for items whose `language` is `auto`. Raises
+    `UnknownLanguageException` if any of them isn't supported.
+    """
+    languages = []
+    for idx, item in enumerate(items):
+        try:
+            lang = resolve_language(item['language'], item['text'])
+        except UnknownLanguageException as e:
+            raise UnknownLanguageException("{} for item {}".format(e, idx))
+        if lang not in language_nlp_lookup:
+            raise UnknownLanguageException("Unsupported language '{}' for item {}".format(item['language'], idx))
+        languages.append(lang)
+    return languages
+
+
+def _from_texts(texts: List[str], lang: str, batch_size: int, n_process: int) -> List[List[Dict]]:
+    # cleaning up the texts leaves less for the models to do; entity offsets are mapped back to the originals at the end
+    with stage('preprocess'):
+        preprocessed = [preprocess(text, PREPROCESS_COLLAPSE_WHITESPACE, PREPROCESS_DROP_BOILERPLATE,
+                                   PREPROCESS_MAX_CHARS) for text in texts]
+    texts = [text for text, _ in preprocessed]
+    # long texts are split into windows the model can handle, and all the windows are run as one batch
+    max_chars, overlap_chars = _chunk_sizes(lang)
+    spans_by_text = [chunk_spans(text, max_chars, overlap_chars) for text in texts]
+    chunks = [text[start:end] for text, spans in zip(texts, spans_by_text) for start, end in spans]
+    chunk_entities = _run_model(chunks, lang, batch_size, n_process)
+    batch_entities = []
+    for (text, offset_map), spans in zip(preprocessed, spans_by_text):
+        entities = merge_entities(spans, chunk_entities[:len(spans)])
+        chunk_entities = chunk_entities[len(spans):]
+        with stage('custom_entities'):
+            entities += _custom_entities(text, lang)  # these are just regexes, so they can run on the whole text
+        batch_entities.append(offset_map.map_entities(entities))
+    return batch_entities
+
+
+def _run_model(texts: List[str], lang: str, batch_size: int, n_process: int) -> List[List[Dict]]:
+    if lang == SWAHILI:
+        with stage('transformer'):
+            return [_huggingface_entities_as_dict(ner_results) for ner_results in swahili_batcher(texts)]
     nlp = language_nlp_lookup[lang]
+    with stage('spacy'):
+        return [_entities_as_dict(doc) for doc in nlp.pipe(texts, batch_size=batch_size, n_process=n_process)]
 
+
+def _chunk_sizes(lang: str) -> Tuple[int, int]:
     if lang == SWAHILI:
-        ner_results = nlp(text)
-        entities = _huggingface_entities_as_dict(ner_results)
-    else:
-        doc = nlp(text)
-        entities = _entities_as_dict(doc)
-
-    entities += ages.extract_ages(text, lang)
-    entities += dates.extract_dates(text, lang)
-    return entities
+        return TRANSFORMER_CHUNK_MAX_CHARS, TRANSFORMER_CHUNK_OVERLAP_CHARS
+    return CHUNK_MAX_CHARS, CHUNK_OVERLAP_CHARS
+
+
+def _cache_key(text: str, lang: str) -> str:
+    # only trailing whitespace is normalized away, because anything else would change the character offsets
+    return cache_key(VERSION, MODEL_MODE, lang, _settings_key(lang), text.rstrip())
+
+
+def _settings_key(lang: str) -> str:
+    # other settings that change the entities found
+    settings = list(_chunk_sizes(lang)) + [PREPROCESS_COLLAPSE_WHITESPACE, PREPROCESS_DROP_BOILERPLATE,
+                                           PREPROCESS_MAX_CHARS]
+    if lang == SWAHILI:
+        settings.append(SWAHILI_BACKEND)
+    return ':'.join(str(setting) for setting in settings)
+
+
+def _copy(entities: List[Dict]) -> List[Dict]:
+    # so callers can't change what is in the cache
+    return [dict(e) for e in entities]
+
+
+def _custom_entities(text: str, lang: str) -> List[Dict]:
+    return extractors.extract(text, lang)
 
 
 def _entities_as_dict(doc) -> List[Dict]:
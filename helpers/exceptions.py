@@ -2,3 +2,19 @@
 class UnknownLanguageException(Exception):
     """Raised when the input language is invalid"""
     pass
+
+
+class ServerBusyException(Exception):
+    """Raised when there is too much work waiting to accept more"""
+
+    def __init__(self, message: str, retry_after_secs: int):
+        super().__init__(message)
+        self.retry_after_secs = retry_after_secs
+
+
+class RateLimitedException(Exception):
+    """Raised when a client has made more requests than it is allowed to"""
+
+    def __init__(self, message: str, retry_after_secs: int):
+        super().__init__(message)
+        self.retry_after_secs = retry_after_secs
@@ -0,0 +1,20 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from helpers import WORKER_THREADS
+
+# a dedicated, bounded, pool for CPU-bound work (content extraction and NER) that async endpoints hand off to, so
+# it doesn't compete with FastAPI's own threadpool for the cheap sync endpoints
+_executor = ThreadPoolExecutor(max_workers=WORKER_THREADS, thread_name_prefix="worker")
+
+
+async def run_in_executor(func, *args, **kwargs):
+    """
+    Run a blocking function on the worker pool and wait for the result without blocking the event loop. Context
+    variables are copied over so per-request state still works inside the function.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, functools.partial(context.run, func, *args, **kwargs))
@@ -0,0 +1,200 @@
+import asyncio
+import ssl
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from urllib.parse import urlparse, urlsplit, urlunsplit
+
+import charset_normalizer
+import httpx
+import mcmetadata
+from requests.exceptions import SSLError, ReadTimeout, TooManyRedirects, ConnectionError, RequestException
+
+from helpers import FETCH_TIMEOUT_SECS, FETCH_MAX_CONNECTIONS, FETCH_MAX_PER_HOST, URL_CACHE_SIZE, URL_CACHE_TTL_SECS, \
+    URL_CACHE_REVALIDATE
+from helpers.cache import LRUCache
+from helpers.executor import run_in_executor
+from helpers.metrics import stage
+
+# the pooled client and per-host limits belong to one event loop, so we track which loop they were created on
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_client: Optional[httpx.AsyncClient] = None
+_host_limits: Dict[str, '_HostLimit'] = {}  # only for hosts with requests running or waiting, so it stays small
+
+# extraction results by url (see `_cache_key`), so repeated requests for the same page don't download and parse it again
+url_cache = LRUCache(URL_CACHE_SIZE) if URL_CACHE_SIZE > 0 else None
+
+
+def _guess_encoding(content: bytes) -> str:
+    best_guess = charset_normalizer.from_bytes(content).best()
+    return best_guess.encoding if best_guess else 'utf-8'
+
+
+def _caused_by(exception: BaseException, cause_type: type) -> bool:
+    while exception is not None:
+        if isinstance(exception, cause_type):
+            return True
+        exception = exception.__cause__ or exception.__context__
+    return False
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _loop, _client, _host_limits
+    loop = asyncio.get_running_loop()
+    if (_client is None) or (_loop is not loop):
+        _loop = loop
+        _host_limits = {}
+        _client = httpx.AsyncClient(
+            headers={"User-Agent": mcmetadata.webpages.DEFAULT_USER_AGENT},
+            timeout=httpx.Timeout(FETCH_TIMEOUT_SECS),
+            limits=httpx.Limits(max_connections=FETCH_MAX_CONNECTIONS),
+            follow_redirects=True,
+        )
+    return _client
+
+
+class _HostLimit:
+
+    def __init__(self):
+        self.semaphore = asyncio.Semaphore(FETCH_MAX_PER_HOST)
+        self.users = 0  # requests running or waiting
+
+
+@asynccontextmanager
+async def _host_slot(url: str):
+    # at most FETCH_MAX_PER_HOST requests to each host at once; a host's limit is dropped once nothing is using it
+    host = urlparse(url).hostname or ''
+    limit = _host_limits.get(host)
+    if limit is None:
+        limit = _host_limits[host] = _HostLimit()
+    limit.users += 1
+    try:
+        async with limit.semaphore:
+            yield
+    finally:
+        limit.users -= 1
+        if (limit.users == 0) and (_host_limits.get(host) is limit):
+            del _host_limits[host]
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def _get(url: str, headers: Optional[Dict] = None) -> httpx.Response:
+    client = _get_client()
+    try:
+        async with _host_slot(url):
+            return await asyncio.wait_for(client.get(url, headers=headers), FETCH_TIMEOUT_SECS)
+    except asyncio.TimeoutError:
+        raise ReadTimeout("Timed out after {} secs fetching {}".format(FETCH_TIMEOUT_SECS, url))
+    except httpx.TimeoutException as te:
+        raise ReadTimeout(str(te) or "Timed out fetching {}".format(url))
+    except httpx.TooManyRedirects as tmr:
+        raise TooManyRedirects(str(tmr))
+    except httpx.ConnectError as ce:
+        if _caused_by(ce, ssl.SSLError):
+            raise SSLError(str(ce))
+        raise ConnectionError(str(ce) or "Couldn't connect to {}".format(url))
+    except (httpx.HTTPError, httpx.InvalidURL) as he:
+        raise RequestException(str(he) or "Couldn't fetch {}".format(url))
+
+
+def _final_url(url: str, response: httpx.Response) -> str:
+    # the same checks as `mcmetadata.webpages.fetch`; returns the url the content really came from (after redirects and
+    # archive lookups)
+    if response.status_code != 200:
+        raise RuntimeError("Webpage didn't return content ({}) from {}".format(response.status_code, url))
+    if ("content-type" in response.headers) and ("text/html" not in response.headers["content-type"]):
+        raise RuntimeError("Webpage didn't return html content ({}) from {}".format(
+            response.headers["content-type"], url))
+    # check for archived URLs
+    final_url = str(response.url)  # followed all the redirects
+    if "memento-datetime" in response.headers:
+        final_url = response.links.get("original", {}).get("url", final_url)  # the original url archived
+    return final_url
+
+
+def _decode(content: bytes, declared_encoding: Optional[str]) -> str:
+    # trust a page that says it is UTF-8, but guess the encoding of any other page, because they are often improperly
+    # marked; guessing can take a good fraction of a second on a big page, so call this from a worker thread
+    if declared_encoding and (declared_encoding.lower() == 'utf-8'):
+        encoding = declared_encoding
+    else:
+        encoding = _guess_encoding(content)
+    return content.decode(encoding, errors='replace')
+
+
+def extract(url: str, html_text: str, final_url: str) -> Dict:
+    """
+    Run the `mcmetadata` extraction on HTML we already fetched, with the same results as `mcmetadata.extract(url)`.
+    This is CPU-bound, so call it from a worker thread.
+    """
+    results = mcmetadata.extract(final_url, html_text=html_text)
+    return _for_url(results, url)
+
+
+def _extract_response(url: str, content: bytes, declared_encoding: Optional[str], final_url: str) -> Dict:
+    return extract(url, _decode(content, declared_encoding), final_url)
+
+
+def _for_url(results: Dict, url: str) -> Dict:
+    # the parts of the results that depend on the exact url asked for, rather than the page it led to
+    return results | dict(
+        original_url=url,
+        is_homepage=mcmetadata.urls.is_homepage_url(url),
+        is_shortened=mcmetadata.urls.is_shortened_url(url),
+    )
+
+
+def _cache_key(url: str) -> str:
+    # only the scheme and host are case-insensitive; the path and query can pick out different pages (ie. shortened
+    # urls, or article ids), so unlike `mcmetadata.urls.normalize_url` this keeps them as they are
+    parts = urlsplit(url.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, parts.query, ''))
+
+
+async def extract_url(url: str) -> Dict:
+    """
+    Download and extract the content of a webpage without blocking a thread, with the same results as
+    `mcmetadata.extract(url)`. Downloads use a pooled async client with a limit on concurrent requests to any one host,
+    and an overall deadline. Errors are raised as the equivalent `requests` exceptions so they are handled just like
+    errors from `mcmetadata`. Results are cached by URL for URL_CACHE_TTL_SECS. After that, if the site sent an ETag or
+    Last-Modified header we ask it whether the page changed, and only download and parse it again if it did.
+    """
+    key = _cache_key(url)
+    cached = url_cache.get(key) if url_cache is not None else None
+    if cached is not None and cached['expires'] > time.time():
+        return _for_url(cached['results'], url)
+    validators = _conditional_headers(cached) if cached is not None else {}
+    with stage('fetch'):
+        response = await _get(url, headers=validators)
+    if validators and (response.status_code == 304):
+        cached['expires'] = time.time() + URL_CACHE_TTL_SECS
+        return _for_url(cached['results'], url)
+    final_url = _final_url(url, response)
+    with stage('content_extraction'):
+        results = await run_in_executor(_extract_response, url, response.content, response.charset_encoding,
+                                        final_url)
+    if url_cache is not None:
+        url_cache.put(key, dict(
+            results=results,
+            etag=response.headers.get('etag'),
+            last_modified=response.headers.get('last-modified'),
+            expires=time.time() + URL_CACHE_TTL_SECS,
+        ))
+    return dict(results)  # a copy, so callers can't change what is in the cache
+
+
+def _conditional_headers(cached: Dict) -> Dict:
+    if not URL_CACHE_REVALIDATE:
+        return {}
+    headers = {}
+    if cached['etag']:
+        headers['If-None-Match'] = cached['etag']
+    if cached['last_modified']:
+        headers['If-Modified-Since'] = cached['last_modified']
+    return headers
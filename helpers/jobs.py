@@ -0,0 +1,343 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from requests.exceptions import RequestException, SSLError, TooManyRedirects
+
+from helpers import JOB_FETCH_WORKERS, JOB_NER_WORKERS, JOB_MAX_ATTEMPTS, JOB_RETRY_BACKOFF_SECS, \
+    JOB_RESULT_TTL_SECS, JOB_LEASE_SECS, JOB_POLL_SECS
+from helpers.cache import SQLiteConnection
+from helpers.encoding import json_default
+from helpers.exceptions import ServerBusyException
+
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+STAGE_FETCH = 'fetch'
+STAGE_NER = 'ner'
+
+# how often to delete finished jobs past their TTL
+PRUNE_EVERY_SECS = 60
+CALLBACK_TIMEOUT_SECS = 10
+# how long to wait for NER workers to finish the job they are on when stopping
+STOP_TIMEOUT_SECS = 10
+
+
+def _dumps(value) -> Optional[str]:
+    return json.dumps(value, default=json_default) if value is not None else None
+
+
+def is_retryable(exception: Exception) -> bool:
+    """
+    Whether a job that failed with this exception might work if tried again later: network problems and timeouts
+    (the `requests` exceptions `fetch` raises), or the NER pool being too busy. Bad certificates and redirect loops
+    won't fix themselves.
+    """
+    if isinstance(exception, (SSLError, TooManyRedirects)):
+        return False
+    return isinstance(exception, (RequestException, ServerBusyException))
+
+
+class JobStore:
+    """
+    Jobs saved in a SQLite file, so they survive restarts and can be shared by several server processes. Each job moves
+    through stages (`fetch`, then `ner`); a worker claims a job for a stage with a lease, and if it doesn't finish
+    before the lease runs out (ie. the process died) the job can be claimed again.
+    """
+
+    def __init__(self, path: str):
+        # opened on first use in each process, so the store can be created before gunicorn forks its workers
+        self._db = SQLiteConnection(path, self._create)
+
+    @staticmethod
+    def _create(db: sqlite3.Connection):
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY, status TEXT, stage TEXT, params TEXT, data TEXT, results TEXT, error TEXT,
+            attempts INTEGER, created REAL, updated REAL, run_after REAL, lease_until REAL, expires REAL)""")
+        db.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (stage, status, run_after)")
+        db.execute("CREATE INDEX IF NOT EXISTS jobs_expires ON jobs (expires)")
+        db.commit()
+
+    def submit(self, params: Dict) -> Dict:
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._db.connection() as db:
+            db.execute("INSERT INTO jobs (id, status, stage, params, attempts, created, updated, run_after) "
+                             "VALUES (?, ?, ?, ?, 0, ?, ?, ?)",
+                             (job_id, STATUS_QUEUED, STAGE_FETCH, _dumps(params), now, now, now))
+            db.commit()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._db.connection() as db:
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._as_dict(row) if row else None
+
+    def claim(self, stage: str, lease_secs: float) -> Optional[Dict]:
+        """
+        Take the next job ready for the stage (or whose last worker's lease ran out), or None if there aren't any.
+        """
+        now = time.time()
+        with self._db.connection() as db:
+            row = db.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_until = ?, updated = ? WHERE id = ("
+                "SELECT id FROM jobs WHERE stage = ? AND ((status = ? AND run_after <= ?) OR "
+                "(status = ? AND lease_until < ?)) ORDER BY run_after LIMIT 1) RETURNING *",
+                (STATUS_RUNNING, now + lease_secs, now, stage, STATUS_QUEUED, now, STATUS_RUNNING, now)).fetchone()
+            db.commit()
+        return self._as_dict(row) if row else None
+
+    def advance(self, job_id: str, stage: str, data):
+        # on to the next stage, which starts its own attempts
+        self._update(job_id, status=STATUS_QUEUED, stage=stage, data=_dumps(data), attempts=0, run_after=time.time())
+
+    def retry(self, job_id: str, error: str, delay_secs: float):
+        self._update(job_id, status=STATUS_QUEUED, error=error, run_after=time.time() + delay_secs)
+
+    def finish(self, job_id: str, results, ttl_secs: float):
+        self._update(job_id, status=STATUS_DONE, data=None, results=_dumps(results), error=None,
+                     expires=time.time() + ttl_secs)
+
+    def fail(self, job_id: str, error: str, ttl_secs: float):
+        self._update(job_id, status=STATUS_FAILED, data=None, error=error, expires=time.time() + ttl_secs)
+
+    def prune(self) -> int:
+        """
+        Delete finished jobs past their TTL. Returns how many were deleted.
+        """
+        with self._db.connection() as db:
+            deleted = db.execute("DELETE FROM jobs WHERE expires < ?", (time.time(),)).rowcount
+            db.commit()
+        return deleted
+
+    def counts(self) -> Dict[str, int]:
+        with self._db.connection() as db:
+            rows = db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def _update(self, job_id: str, **columns):
+        columns['updated'] = time.time()
+        assignments = ", ".join("{} = ?".format(name) for name in columns)
+        with self._db.connection() as db:
+            db.execute("UPDATE jobs SET {} WHERE id = ?".format(assignments), list(columns.values()) + [job_id])
+            db.commit()
+
+    @staticmethod
+    def _as_dict(row: sqlite3.Row) -> Dict:
+        job = dict(row)
+        for column in ['params', 'data', 'results']:
+            job[column] = json.loads(job[column]) if job[column] is not None else None
+        return job
+
+
+def public_view(job: Dict) -> Dict:
+    """
+    The parts of a job to show clients.
+    """
+    view = dict(id=job['id'], status=job['status'], stage=job['stage'], attempts=job['attempts'],
+                created=job['created'], updated=job['updated'], error=job['error'])
+    if job['status'] == STATUS_DONE:
+        view['results'] = job['results']
+    return view
+
+
+def check_callback_url(callback_url: Optional[str]):
+    """
+    Raise a `ValueError` unless the callback url is one the job can be POSTed to (or None).
+    """
+    if callback_url is None:
+        return
+    try:
+        url = httpx.URL(callback_url)
+    except httpx.InvalidURL as iu:
+        raise ValueError("Invalid callback_url: {}".format(iu))
+    if (url.scheme not in ('http', 'https')) or not url.host:
+        raise ValueError("Invalid callback_url: it needs to be an http or https url")
+
+
+class JobRunner:
+    """
+    Runs jobs from a `JobStore` in two kinds of workers: `fetch_workers` async tasks that download and extract each
+    webpage (I/O bound, so many can share the event loop), then `ner_workers` threads that find the entities (CPU
+    bound). Jobs that fail with a retryable error (see `is_retryable`) are tried again with exponential backoff, up to
+    `max_attempts` times. Finished jobs are kept for `ttl_secs`, and POSTed to the job's `callback_url` if it has one.
+    """
+
+    def __init__(self, store: JobStore, fetch_func: Callable[[Dict], Awaitable[Dict]],
+                 process_func: Callable[[Dict, Dict], Dict], fetch_workers: int = JOB_FETCH_WORKERS,
+                 ner_workers: int = JOB_NER_WORKERS, max_attempts: int = JOB_MAX_ATTEMPTS,
+                 retry_backoff_secs: float = JOB_RETRY_BACKOFF_SECS, ttl_secs: float = JOB_RESULT_TTL_SECS,
+                 lease_secs: float = JOB_LEASE_SECS, poll_secs: float = JOB_POLL_SECS):
+        """
+        :param store:
+        :param fetch_func: async, takes the job's params and returns the data the `process_func` needs
+        :param process_func: takes the job's params and the data from `fetch_func`, and returns the job's results
+        """
+        self.store = store
+        self._fetch_func = fetch_func
+        self._process_func = process_func
+        self._fetch_workers = fetch_workers
+        self._ner_workers = ner_workers
+        self._max_attempts = max_attempts
+        self._retry_backoff_secs = retry_backoff_secs
+        self._ttl_secs = ttl_secs
+        self._lease_secs = lease_secs
+        self._poll_secs = poll_secs
+        self._tasks: List[asyncio.Task] = []
+        self._threads: List[threading.Thread] = []
+        self._stopping = threading.Event()
+        self._fetch_wakeup: Optional[asyncio.Event] = None
+        self._ner_wakeup = threading.Event()
+
+    def start(self):
+        """
+        Start the workers. Call this from the event loop the fetch workers should run on.
+        """
+        self._stopping.clear()
+        self._fetch_wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._fetch_worker()) for _ in range(self._fetch_workers)]
+        self._tasks.append(asyncio.create_task(self._pruner()))
+        self._threads = [threading.Thread(target=self._ner_worker, name="job-ner-{}".format(idx), daemon=True)
+                         for idx in range(self._ner_workers)]
+        for thread in self._threads:
+            thread.start()
+        logger.info("Started {} fetch and {} NER job workers".format(self._fetch_workers, self._ner_workers))
+
+    async def stop(self):
+        # jobs being worked on are claimed again when their lease runs out, so it is fine to stop in the middle
+        self._stopping.set()
+        self._ner_wakeup.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for thread in self._threads:
+            await asyncio.to_thread(thread.join, STOP_TIMEOUT_SECS)
+        self._threads = []
+
+    async def submit(self, params: Dict) -> Dict:
+        check_callback_url(params.get('callback_url'))
+        job = await asyncio.to_thread(self.store.submit, params)
+        if self._fetch_wakeup is not None:
+            self._fetch_wakeup.set()
+        return job
+
+    async def _fetch_worker(self):
+        while True:
+            job = None
+            try:
+                job = await asyncio.to_thread(self.store.claim, STAGE_FETCH, self._lease_secs)
+                if job is None:
+                    self._fetch_wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._fetch_wakeup.wait(), self._poll_secs)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._fetch(job)
+            except Exception as e:
+                await asyncio.to_thread(self._crashed, job, e)
+                if job is None:
+                    await asyncio.sleep(self._poll_secs)
+
+    async def _fetch(self, job: Dict):
+        if await asyncio.to_thread(self._gave_up, job):
+            return
+        try:
+            data = await self._fetch_func(job['params'])
+        except Exception as e:
+            await asyncio.to_thread(self._failed, job, e)
+            return
+        await asyncio.to_thread(self.store.advance, job['id'], STAGE_NER, data)
+        self._ner_wakeup.set()
+
+    def _ner_worker(self):
+        while not self._stopping.is_set():
+            job = None
+            try:
+                job = self.store.claim(STAGE_NER, self._lease_secs)
+                if job is None:
+                    self._ner_wakeup.wait(self._poll_secs)
+                    self._ner_wakeup.clear()
+                    continue
+                self._process(job)
+            except Exception as e:
+                self._crashed(job, e)
+                if job is None:
+                    self._stopping.wait(self._poll_secs)
+
+    def _process(self, job: Dict):
+        if self._gave_up(job):
+            return
+        try:
+            results = self._process_func(job['params'], job['data'])
+        except Exception as e:
+            self._failed(job, e)
+            return
+        self.store.finish(job['id'], results, self._ttl_secs)
+        self._send_callback(job['id'])
+
+    def _crashed(self, job: Optional[Dict], exception: Exception):
+        # something went wrong outside of the job's own work (ie. the store, or sending the callback), so log it and
+        # fail the job rather than stopping the worker; without a job (ie. claiming one failed) the worker waits a bit
+        logger.error("Job worker error: {}".format(exception), exc_info=exception)
+        if job is None:
+            return
+        try:
+            self.store.fail(job['id'], "{}: {}".format(exception.__class__.__name__, exception), self._ttl_secs)
+        except Exception as e:
+            logger.exception(e)
+
+    async def _pruner(self):
+        while True:
+            await asyncio.sleep(PRUNE_EVERY_SECS)
+            try:
+                deleted = await asyncio.to_thread(self.store.prune)
+                if deleted:
+                    logger.info("Deleted {} expired jobs".format(deleted))
+            except Exception as e:
+                logger.exception(e)
+
+    def _gave_up(self, job: Dict) -> bool:
+        # a job claimed again after its lease ran out too many times (ie. it keeps crashing the worker)
+        if job['attempts'] <= self._max_attempts:
+            return False
+        self.store.fail(job['id'], job['error'] or "Gave up after {} attempts".format(self._max_attempts),
+                        self._ttl_secs)
+        self._send_callback(job['id'])
+        return True
+
+    def _failed(self, job: Dict, exception: Exception):
+        error = "{}: {}".format(exception.__class__.__name__, exception)
+        if is_retryable(exception) and (job['attempts'] < self._max_attempts):
+            delay_secs = self._retry_backoff_secs * (2 ** (job['attempts'] - 1))
+            logger.info("Job {} failed ({}), retrying in {} secs".format(job['id'], error, delay_secs))
+            self.store.retry(job['id'], error, delay_secs)
+            return
+        logger.info("Job {} failed: {}".format(job['id'], error))
+        self.store.fail(job['id'], error, self._ttl_secs)
+        self._send_callback(job['id'])
+
+    def _send_callback(self, job_id: str):
+        job = self.store.get(job_id)
+        callback_url = (job['params'] or {}).get('callback_url') if job else None
+        if not callback_url:
+            return
+        try:
+            httpx.post(callback_url, content=_dumps(public_view(job)), timeout=CALLBACK_TIMEOUT_SECS,
+                       headers={'Content-Type': 'application/json'}).raise_for_status()
+        except (httpx.HTTPError, httpx.InvalidURL) as e:
+            # clients can still poll for the results
+            logger.warning("Couldn't send job {} to {}: {}".format(job_id, callback_url, e))
@@ -0,0 +1,56 @@
+import threading
+
+from py3langid.langid import LanguageIdentifier, MODEL_FILE
+
+from helpers import LANGUAGES, LANGUAGE_AUTO, LANGUAGE_DETECT_MAX_CHARS, LANGUAGE_DETECT_MIN_CONFIDENCE
+from helpers.exceptions import UnknownLanguageException
+from helpers.metrics import stage
+
+# the same detector mcmetadata uses for webpages; it is small, local and takes well under a millisecond per text
+_identifier = None
+_identifier_lock = threading.Lock()
+
+
+def _get_identifier() -> LanguageIdentifier:
+    global _identifier
+    with _identifier_lock:
+        if _identifier is None:
+            # normalized probabilities, so the confidence is comparable across texts
+            _identifier = LanguageIdentifier.from_pickled_model(MODEL_FILE, norm_probs=True)
+        return _identifier
+
+
+def detect(text: str, max_chars: int = LANGUAGE_DETECT_MAX_CHARS,
+           min_confidence: float = LANGUAGE_DETECT_MIN_CONFIDENCE) -> str:
+    """
+    Detect the language of the text from the start of it. Raises `UnknownLanguageException` if it isn't one of the
+    supported languages, or the detector isn't confident enough, so we don't run the text through the wrong model.
+    :param text:
+    :param max_chars: only look at this many characters from the start (0 for all of it)
+    :param min_confidence: lowest probability (0 to 1) to accept the detected language with
+    :return: a supported two-letter language code
+    """
+    sample = text[:max_chars] if max_chars else text
+    if not sample.strip():
+        raise UnknownLanguageException("Can't detect the language of empty text")
+    with stage('language_detection'):
+        lang, confidence = _get_identifier().classify(sample)
+    if lang not in LANGUAGES:
+        raise UnknownLanguageException("Detected unsupported language '{}'".format(lang))
+    if confidence < min_confidence:
+        raise UnknownLanguageException("Not confident about the language (best guess '{}', {:.2f})".format(
+            lang, confidence))
+    return lang
+
+
+def resolve(language_code: str, text: str) -> str:
+    """
+    The language code to process the text with: the one passed in (lowercased), or the detected one if that is `auto`.
+    Raises `UnknownLanguageException` for unsupported languages, before any model is touched.
+    """
+    lang = (language_code or '').lower()
+    if lang == LANGUAGE_AUTO:
+        return detect(text)
+    if lang not in LANGUAGES:
+        raise UnknownLanguageException("Unsupported language '{}'".format(language_code))
+    return lang
@@ -0,0 +1,173 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+# seconds; roughly the same as the Prometheus client defaults, plus some for slow downloads and long articles
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# time spent in each stage for the request currently being handled (see `helpers.request.api_method`)
+_request_timings: ContextVar[Optional[Dict]] = ContextVar('request_timings', default=None)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = ['{}="{}"'.format(name, _escape(value)) for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def exposition(self) -> List[str]:
+        lines = ["# HELP {} {}".format(self.name, self.description), "# TYPE {} {}".format(self.name, self.kind)]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines += self._sample_lines(key, value)
+        return lines
+
+    def _sample_lines(self, key, value) -> List[str]:
+        return ["{}{} {}".format(self.name, _label_text(self.labels, key), value)]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = dict(counts=[0] * len(self.buckets), count=0, sum=0.0)
+            series = self._values[key]
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][idx] += 1
+            series['count'] += 1
+            series['sum'] += value
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            series = self._values.get(self._key(labels))
+            return series['count'] if series else 0
+
+    def _sample_lines(self, key, series) -> List[str]:
+        lines = []
+        for bound, bucket_count in zip(self.buckets, series['counts']):
+            lines.append("{}_bucket{} {}".format(self.name, _label_text(self.labels, key, 'le="{}"'.format(bound)),
+                                                 bucket_count))
+        lines.append("{}_bucket{} {}".format(self.name, _label_text(self.labels, key, 'le="+Inf"'), series['count']))
+        lines.append("{}_sum{} {}".format(self.name, _label_text(self.labels, key), series['sum']))
+        lines.append("{}_count{} {}".format(self.name, _label_text(self.labels, key), series['count']))
+        return lines
+
+
+class Registry:
+    """
+    The metrics for this process, in the Prometheus text format. Each server worker process has its own, so scrape
+    each one (or run a single worker per container).
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def add(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def exposition(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.exposition()
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+REQUEST_SECONDS = registry.add(Histogram('entity_server_request_duration_seconds', "Time to handle a request",
+                                         ('endpoint',)))
+REQUESTS_IN_FLIGHT = registry.add(Gauge('entity_server_requests_in_flight', "Requests being handled now",
+                                        ('endpoint',)))
+ERRORS = registry.add(Counter('entity_server_errors_total', "Requests that failed, by the kind of error",
+                              ('endpoint', 'exception')))
+STAGE_SECONDS = registry.add(Histogram('entity_server_stage_duration_seconds',
+                                       "Time spent in each stage of handling a request", ('stage',)))
+DOCUMENTS = registry.add(Counter('entity_server_documents_total', "Documents checked for entities", ('language',)))
+DOCUMENT_CHARS = registry.add(Counter('entity_server_document_chars_total', "Characters checked for entities",
+                                      ('language',)))
+ADMISSION_WAITING = registry.add(Gauge('entity_server_admission_waiting', "Requests waiting for a slot to start in",
+                                       ('endpoint',)))
+ADMISSION_REJECTED = registry.add(Counter('entity_server_admission_rejected_total',
+                                          "Requests turned away before starting, by the reason why",
+                                          ('endpoint', 'reason')))
+
+
+def start_request_timings() -> Dict:
+    """
+    Start adding up the time spent in each stage for the current request. Returns the dict of seconds by stage.
+    """
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def record_stage(name: str, secs: float):
+    STAGE_SECONDS.observe(secs, stage=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0) + secs
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Time a block of code as one stage of handling the current request (ie. `fetch` or `spacy`).
+    """
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start_time)
+
+
+def count_document(language: str, text: str):
+    DOCUMENTS.inc(language=language)
+    DOCUMENT_CHARS.inc(len(text), language=language)
@@ -0,0 +1,246 @@
+import gc
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from helpers import ENGLISH, SPANISH, PORTUGUESE, FRENCH, GERMAN, KOREAN, SWAHILI, MODEL_MODE_SMALL, MODEL_MODE, \
+    SPACY_NER_ONLY, TORCH_NUM_THREADS, SWAHILI_BACKEND, SWAHILI_BACKEND_TORCH_INT8, SWAHILI_BACKEND_ONNX, \
+    SWAHILI_ONNX_PATH, MODEL_SNAPSHOT_DIR
+from helpers.metrics import record_stage
+
+logger = logging.getLogger(__name__)
+
+# small and large spaCy model names for each language
+SPACY_MODELS = {
+    ENGLISH: ("en_core_web_sm", "en_core_web_lg"),
+    SPANISH: ("es_core_news_sm", "es_core_news_lg"),
+    PORTUGUESE: ("pt_core_news_sm", "pt_core_news_lg"),
+    FRENCH: ("fr_core_news_sm", "fr_core_news_lg"),
+    GERMAN: ("de_core_news_sm", "de_core_news_lg"),
+    KOREAN: ("ko_core_news_sm", "ko_core_news_lg"),
+}
+
+MASAKHANER_MODEL = "Davlan/xlm-roberta-large-masakhaner"
+
+# spaCy component factories that set `doc.ents`, which is all we read from a parsed doc
+ENTITY_FACTORIES = {'ner', 'beam_ner', 'entity_ruler'}
+
+
+def spacy_model_name(language_code: str) -> str:
+    small_name, large_name = SPACY_MODELS[language_code]
+    return small_name if MODEL_MODE == MODEL_MODE_SMALL else large_name
+
+
+def snapshot_path(snapshot_dir: Optional[str], model_name: str) -> Optional[str]:
+    """
+    Where a model is saved in a snapshot directory (see `helpers.snapshot`), or None if it isn't there.
+    """
+    if not snapshot_dir:
+        return None
+    path = os.path.join(snapshot_dir, model_name.replace('/', '--'))
+    return path if os.path.isdir(path) else None
+
+
+def load_spacy_model(language_code: str, ner_only: bool = SPACY_NER_ONLY, snapshot_dir: Optional[str] = None):
+    # imported here so we don't pay for it until a model is actually needed
+    import spacy
+    model_name = spacy_model_name(language_code)
+    nlp = spacy.load(snapshot_path(snapshot_dir, model_name) or model_name)
+    if ner_only:
+        unused = unused_by_ner(nlp)
+        nlp.select_pipes(disable=unused)
+        logger.info("  disabled {} components not needed for NER: {}".format(language_code, ", ".join(unused)))
+    return nlp
+
+
+def unused_by_ner(nlp) -> List[str]:
+    """
+    The names of components in a spaCy pipeline that entity recognition doesn't depend on (ie. the tagger, parser and
+    lemmatizer), so they can be disabled. Shared embedding layers (`tok2vec` or `transformer`) are kept only if an
+    entity component listens to them.
+    :param nlp: a loaded spaCy pipeline
+    :return: a list of component names, in pipeline order
+    """
+    needed = {name for name in nlp.pipe_names if nlp.get_pipe_meta(name).factory in ENTITY_FACTORIES}
+    for name, component in nlp.pipeline:
+        if set(getattr(component, 'listening_components', [])) & needed:
+            needed.add(name)
+    return [name for name in nlp.pipe_names if name not in needed]
+
+
+def get_masakhaner_pipeline(hf_ner_model=MASAKHANER_MODEL, backend: str = SWAHILI_BACKEND,
+                            onnx_path: Optional[str] = SWAHILI_ONNX_PATH):
+    """
+    Load the Swahili NER pipeline.
+    :param hf_ner_model: the HuggingFace model to load
+    :param backend: one of `helpers.SWAHILI_BACKENDS`; `torch-int8` quantizes the model's linear layers to int8 as it
+                    loads (about a quarter of the memory, and faster on CPU), and `onnx` loads an exported copy of the
+                    model to run with ONNX Runtime
+    :param onnx_path: directory of the exported model, for the `onnx` backend
+    """
+    # imported here because torch and transformers are very slow to import, and only Swahili needs them
+    import torch
+    from transformers import pipeline, AutoTokenizer, AutoModelForTokenClassification
+    if TORCH_NUM_THREADS:
+        torch.set_num_threads(TORCH_NUM_THREADS)
+    if backend == SWAHILI_BACKEND_ONNX:
+        try:
+            from optimum.onnxruntime import ORTModelForTokenClassification
+        except ImportError:
+            raise RuntimeError("The onnx Swahili backend needs `pip install optimum[onnxruntime]`")
+        tokenizer = AutoTokenizer.from_pretrained(onnx_path)
+        model = ORTModelForTokenClassification.from_pretrained(onnx_path)
+    else:
+        tokenizer = AutoTokenizer.from_pretrained(hf_ner_model)
+        model = AutoModelForTokenClassification.from_pretrained(hf_ner_model)
+        if backend == SWAHILI_BACKEND_TORCH_INT8:
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return pipeline("ner", model=model, tokenizer=tokenizer, aggregation_strategy="simple")
+
+
+def run_huggingface_pipeline(nlp, texts: List[str], batch_size: int) -> List:
+    """
+    Run a HuggingFace pipeline on a list of texts, which it pads into batches of `batch_size`. Turns off gradient
+    tracking, which inference doesn't need.
+    """
+    import torch
+    with torch.inference_mode():
+        return nlp(texts, batch_size=batch_size)
+
+
+def default_loaders(snapshot_dir: Optional[str] = MODEL_SNAPSHOT_DIR) -> Dict[str, Callable]:
+    """
+    The function to call to load the default spaCy or HuggingFace NER model for each language.
+    :param snapshot_dir: load models from here when they have been saved there (see `helpers.snapshot`)
+    """
+    loaders = {lang: (lambda lang=lang: load_spacy_model(lang, snapshot_dir=snapshot_dir)) for lang in SPACY_MODELS}
+    loaders[SWAHILI] = lambda: get_masakhaner_pipeline(snapshot_path(snapshot_dir, MASAKHANER_MODEL) or
+                                                       MASAKHANER_MODEL)
+    return loaders
+
+
+def _rss_mb() -> Optional[float]:
+    # current resident memory of this process, or None if we can't tell on this platform
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class ModelRegistry:
+    """
+    Dict-like lookup from language code to NLP pipeline. Each pipeline is loaded the first time it is asked for, and
+    the least-recently-used ones are evicted to stay under a budget of loaded models and/or (estimated) memory. Memory
+    per model is estimated from the change in process memory while loading it.
+    """
+
+    def __init__(self, loaders: Dict[str, Callable], max_loaded: int = 0, max_memory_mb: int = 0):
+        """
+        :param loaders: map from language code to a no-argument function that returns the pipeline
+        :param max_loaded: most pipelines to keep in memory at once (0 for no limit)
+        :param max_memory_mb: most estimated memory to use for pipelines (0 for no limit)
+        """
+        self._loaders = loaders
+        self._max_loaded = max_loaded
+        self._max_memory_mb = max_memory_mb
+        self._models = OrderedDict()  # in least to most recently used order
+        self._stats = {lang: dict(loaded=False, loads=0, evictions=0, uses=0, lastLoadSecs=None, memoryMb=None,
+                                  lastUsed=None) for lang in loaders}
+        self._lock = threading.Lock()
+        self._load_locks = {lang: threading.Lock() for lang in loaders}
+
+    def __contains__(self, language_code: str) -> bool:
+        return language_code in self._loaders
+
+    def __getitem__(self, language_code: str):
+        return self.get(language_code)
+
+    def languages(self) -> List[str]:
+        return list(self._loaders.keys())
+
+    def is_loaded(self, language_code: str) -> bool:
+        with self._lock:
+            return language_code in self._models
+
+    def get(self, language_code: str):
+        model = self._use(language_code)
+        if model is not None:
+            return model
+        # only one thread should load any one model, the rest wait for it
+        with self._load_locks[language_code]:
+            model = self._use(language_code)
+            if model is not None:
+                return model
+            logger.info("Loading model for '{}'".format(language_code))
+            start_time = time.time()
+            start_rss = _rss_mb()
+            model = self._loaders[language_code]()
+            end_rss = _rss_mb()
+            load_secs = time.time() - start_time
+            record_stage('model_load', load_secs)
+            logger.info("  loaded '{}' in {:.1f} secs".format(language_code, load_secs))
+            with self._lock:
+                self._models[language_code] = model
+                stats = self._stats[language_code]
+                stats['loaded'] = True
+                stats['loads'] += 1
+                stats['uses'] += 1
+                stats['lastLoadSecs'] = round(load_secs, 3)
+                stats['memoryMb'] = round(max(end_rss - start_rss, 0), 1) if start_rss is not None else None
+                stats['lastUsed'] = time.time()
+                evicted = self._evict(keep=language_code)
+            if evicted:
+                gc.collect()  # give the memory from evicted models back as soon as we can
+            return model
+
+    def preload(self, language_codes: List[str]):
+        for lang in language_codes:
+            self.get(lang)
+
+    def status(self) -> Dict:
+        """
+        Summary of which models are loaded, in least to most recently used order, plus per-language load statistics.
+        """
+        with self._lock:
+            return dict(
+                loaded=list(self._models.keys()),
+                maxLoaded=self._max_loaded,
+                maxMemoryMb=self._max_memory_mb,
+                languages={lang: dict(stats) for lang, stats in self._stats.items()},
+            )
+
+    def _use(self, language_code: str):
+        with self._lock:
+            if language_code not in self._models:
+                return None
+            self._models.move_to_end(language_code)
+            stats = self._stats[language_code]
+            stats['uses'] += 1
+            stats['lastUsed'] = time.time()
+            return self._models[language_code]
+
+    def _memory_mb(self) -> float:
+        return sum(self._stats[lang]['memoryMb'] or 0 for lang in self._models)
+
+    def _over_budget(self) -> bool:
+        if self._max_loaded and len(self._models) > self._max_loaded:
+            return True
+        if self._max_memory_mb and self._memory_mb() > self._max_memory_mb:
+            return True
+        return False
+
+    def _evict(self, keep: str) -> bool:
+        # must be called while holding self._lock
+        evicted = False
+        while self._over_budget() and len(self._models) > 1:
+            lang = next(lang for lang in self._models if lang != keep)
+            del self._models[lang]
+            self._stats[lang]['loaded'] = False
+            self._stats[lang]['evictions'] += 1
+            logger.info("Evicted model for '{}'".format(lang))
+            evicted = True
+        return evicted
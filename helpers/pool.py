@@ -0,0 +1,114 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from helpers import NER_WORKERS, NER_QUEUE_SIZE, NER_FORK_AFTER_LOAD, NER_RETRY_AFTER_SECS, PRELOAD_LANGUAGES
+from helpers.exceptions import ServerBusyException
+from helpers.metrics import start_request_timings, record_stage
+
+logger = logging.getLogger(__name__)
+
+# set in worker processes, so they run the work themselves instead of sending it to a pool of their own
+_in_worker = False
+
+
+def init_worker():
+    """
+    Set up a worker process: it runs work itself from now on, rather than sending it to a pool of its own, and loads
+    the PRELOAD_LANGUAGES models. Also used for the worker processes of `cli.py`.
+    """
+    global _in_worker
+    _in_worker = True
+    import helpers.entities
+    helpers.entities.language_nlp_lookup.preload(PRELOAD_LANGUAGES)  # a no-op if they were loaded before forking
+
+
+def _noop():
+    return None
+
+
+def _run_timed(func, *args):
+    # runs in a worker, sending back how long each stage took along with the results
+    timings = start_request_timings()
+    return func(*args), timings
+
+
+class NERPool:
+    """
+    Runs CPU-bound NER work in a pool of worker processes, so one server process can use more than one core. Each
+    worker loads its own models; with `fork_after_load` they are loaded in this process first and the workers share
+    those memory pages copy-on-write. Only `queue_size` tasks can be running or waiting at once; beyond that `run`
+    raises a `ServerBusyException` so clients can back off and retry. With 0 workers work just runs in the caller.
+    """
+
+    def __init__(self, workers: int, queue_size: int, fork_after_load: bool = False,
+                 retry_after_secs: int = NER_RETRY_AFTER_SECS):
+        self._workers = workers
+        self._queue_size = queue_size
+        self._fork_after_load = fork_after_load
+        self._retry_after_secs = retry_after_secs
+        self._slots = threading.BoundedSemaphore(queue_size) if queue_size > 0 else None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return (self._workers > 0) and not _in_worker
+
+    @property
+    def forks_after_load(self) -> bool:
+        return self.enabled and self._fork_after_load
+
+    @property
+    def loads_models_here(self) -> bool:
+        """
+        True if models should be loaded in this process (ie. it is a worker, or workers will be forked from it).
+        """
+        return (not self.enabled) or self._fork_after_load
+
+    def start(self):
+        """
+        Start the worker processes now, rather than on the first task. With `fork_after_load` call this after loading
+        models, and before starting any other threads. Don't call this at import time, because processes started with
+        `spawn` import the main module again.
+        """
+        if self.enabled:
+            self._get_executor().submit(_noop).result()
+
+    def run(self, func, *args):
+        """
+        Run the function (which must be importable by the worker processes) and return its result.
+        """
+        if not self.enabled:
+            return func(*args)
+        if (self._slots is not None) and not self._slots.acquire(blocking=False):
+            raise ServerBusyException("Too many documents waiting for entity extraction, try again later",
+                                      self._retry_after_secs)
+        try:
+            results, timings = self._get_executor().submit(_run_timed, func, *args).result()
+            for name, secs in timings.items():
+                record_stage(name, secs)  # so the metrics include work done in the workers
+            return results
+        except BrokenProcessPool:
+            # a worker died (ie. ran out of memory), so start fresh ones for the next task
+            logger.warning("NER worker pool broke, restarting it")
+            with self._lock:
+                self._executor = None
+            raise RuntimeError("NER worker process failed")
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                context = multiprocessing.get_context('fork' if self._fork_after_load else 'spawn')
+                logger.info("Starting {} NER worker processes ({})".format(self._workers, context.get_start_method()))
+                self._executor = ProcessPoolExecutor(max_workers=self._workers, mp_context=context,
+                                                     initializer=init_worker)
+            return self._executor
+
+
+ner_pool = NERPool(NER_WORKERS, NER_QUEUE_SIZE, NER_FORK_AFTER_LOAD)
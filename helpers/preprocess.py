@@ -0,0 +1,148 @@
+import bisect
+import re
+from typing import Dict, List, Tuple
+
+# lines matching these (if they are short) are page furniture rather than article text
+BOILERPLATE_PATTERN = re.compile('|'.join([
+    r'\bcookies?\b',
+    r'\bnewsletter\b',
+    r'\bsubscribe\b',
+    r'\bsign up\b',
+    r'\ball rights reserved\b',
+    r'\bcopyright\b',
+    r'©',
+    r'\bshare (on|this|via)\b',
+    r'\b(related|recommended|more) (articles|stories|news|posts)\b',
+    r'\bread more\b',
+    r'\badvertisement\b',
+    r'\bprivacy policy\b',
+    r'\bterms of (use|service)\b',
+    r'\bclick here\b',
+    r'\bfollow us\b',
+]), re.IGNORECASE)
+BOILERPLATE_MAX_LINE_CHARS = 300
+# runs of at least this many short lines without sentence punctuation are menus or lists of links
+LINK_LIST_MIN_LINES = 5
+LINK_LIST_MAX_WORDS = 6
+
+_LINES = re.compile(r'[^\n]*\n|[^\n]+$')
+_WHITESPACE_RUN = re.compile(r'\s{2,}')
+
+
+class OffsetMap:
+    """
+    Maps character offsets in preprocessed text back to offsets in the original text. The preprocessed text is made of
+    segments, each either copied from the original (so offsets inside it map one-to-one) or a replacement for a longer
+    stretch of whitespace (so every offset inside it maps to the start of that stretch).
+    """
+
+    def __init__(self):
+        self._starts = []  # start of each segment in the preprocessed text
+        self._segments = []  # (original start, copied from the original?)
+
+    def add(self, processed_start: int, original_start: int, copied: bool):
+        self._starts.append(processed_start)
+        self._segments.append((original_start, copied))
+
+    def original(self, processed_offset: int) -> int:
+        idx = bisect.bisect_right(self._starts, processed_offset) - 1
+        if idx < 0:
+            return processed_offset
+        original_start, copied = self._segments[idx]
+        return original_start + (processed_offset - self._starts[idx]) if copied else original_start
+
+    def map_entities(self, entities: List[Dict]) -> List[Dict]:
+        """
+        Change the `start_char` and `end_char` of each entity to point into the original text.
+        """
+        for entity in entities:
+            if entity['end_char'] > entity['start_char']:
+                entity['end_char'] = self.original(entity['end_char'] - 1) + 1
+            else:
+                entity['end_char'] = self.original(entity['end_char'])
+            entity['start_char'] = self.original(entity['start_char'])
+        return entities
+
+
+def preprocess(text: str, collapse_whitespace: bool = False, drop_boilerplate: bool = False,
+               max_chars: int = 0) -> Tuple[str, OffsetMap]:
+    """
+    Clean up text extracted from a webpage so there is less for NER to work through.
+    :param text:
+    :param collapse_whitespace: replace runs of whitespace with a single space (or a newline, or two for a paragraph
+                                break), so they keep marking sentence and paragraph boundaries
+    :param drop_boilerplate: drop lines that look like page furniture (cookie banners, newsletter and share prompts,
+                             menus and lists of links) and lines repeated earlier in the text
+    :param max_chars: cut the result off at this many characters (0 for no limit)
+    :return: a tuple of the preprocessed text and an `OffsetMap` back to the original
+    """
+    offset_map = OffsetMap()
+    if not (collapse_whitespace or drop_boilerplate or max_chars):
+        offset_map.add(0, 0, True)
+        return text, offset_map
+    line_spans = _kept_lines(text) if drop_boilerplate else [(0, len(text))]
+    pieces = []
+    length = 0
+    for line_start, line_end in line_spans:
+        for original_start, piece, copied in _line_pieces(text, line_start, line_end, collapse_whitespace):
+            if max_chars and (length + len(piece) > max_chars):
+                piece = piece[:max_chars - length]
+            if not piece:
+                continue
+            offset_map.add(length, original_start, copied)
+            pieces.append(piece)
+            length += len(piece)
+            if max_chars and (length >= max_chars):
+                return ''.join(pieces), offset_map
+    return ''.join(pieces), offset_map
+
+
+def _line_pieces(text: str, start: int, end: int, collapse_whitespace: bool):
+    # (original start, text, copied from the original?) for the pieces making up the line
+    if not collapse_whitespace:
+        yield start, text[start:end], True
+        return
+    position = start
+    for match in _WHITESPACE_RUN.finditer(text, start, end):
+        run = match.group()
+        replacement = '\n\n' if run.count('\n') > 1 else ('\n' if '\n' in run else ' ')
+        if run == replacement:
+            continue
+        if match.start() > position:
+            yield position, text[position:match.start()], True
+        yield match.start(), replacement, False
+        position = match.end()
+    if end > position:
+        yield position, text[position:end], True
+
+
+def _kept_lines(text: str) -> List[Tuple[int, int]]:
+    lines = [(m.start(), m.end()) for m in _LINES.finditer(text)]
+    dropped = set()
+    seen = set()
+    for idx, (start, end) in enumerate(lines):
+        line = text[start:end].strip()
+        if not line:
+            continue
+        if line in seen:
+            dropped.add(idx)
+        elif (len(line) <= BOILERPLATE_MAX_LINE_CHARS) and BOILERPLATE_PATTERN.search(line):
+            dropped.add(idx)
+        seen.add(line)
+    dropped |= _link_list_lines(text, lines)
+    return [span for idx, span in enumerate(lines) if idx not in dropped]
+
+
+def _link_list_lines(text: str, lines: List[Tuple[int, int]]) -> set:
+    list_lines = set()
+    run = []
+    for idx, (start, end) in enumerate(lines + [(len(text), len(text))]):  # an empty line at the end closes any run
+        line = text[start:end].strip()
+        if line and (len(line.split()) <= LINK_LIST_MAX_WORDS) and not line.endswith(('.', '!', '?', ':', '"', '»')):
+            run.append(idx)
+            continue
+        if line or (idx == len(lines)):  # blank lines between items don't end a run
+            if len(run) >= LINK_LIST_MIN_LINES:
+                list_lines.update(run)
+            run = []
+    return list_lines
@@ -1,17 +1,33 @@
+import inspect
+import json
 import time
 from functools import wraps
+from typing import Dict, Optional, Type
 
 import mcmetadata.exceptions
+from fastapi import Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import Response
+from pydantic import BaseModel, ValidationError
 from requests.exceptions import SSLError, ReadTimeout, TooManyRedirects, ConnectionError, RequestException
 import logging
 
 import helpers
+from helpers import RESPONSE_TIMINGS
+from helpers.cache import start_request_stats
+from helpers.encoding import response_format, to_layout, encode, MEDIA_JSON
+from helpers.exceptions import ServerBusyException, RateLimitedException
+from helpers.metrics import start_request_timings, REQUEST_SECONDS, REQUESTS_IN_FLIGHT, ERRORS
 
 logger = logging.getLogger(__name__)
 
 STATUS_OK = 'ok'
 STATUS_ERROR = 'error'
 
+# the kinds of errors handled separately in `error_results`, for counting them (anything else counts as `Exception`)
+ERROR_CLASSES = [ServerBusyException, RateLimitedException, mcmetadata.exceptions.UnableToExtractError, SSLError, TooManyRedirects,
+                 ReadTimeout, ConnectionError, RequestException, ValueError, RuntimeError]
+
 
 def _duration(start_time: float):
     return int(round((time.time() - start_time) * 1000)) if start_time else 0
@@ -34,43 +50,169 @@ def _error_results(message: str, start_time: float, status_code: int = 400):
     }
 
 
+def _ok_results(results, start_time: float, cache_stats: Dict, timings: Dict):
+    response = {
+        'version': helpers.VERSION,
+        'status': STATUS_OK,
+        'duration': _duration(start_time),
+        'results': results,
+        'modelMode': helpers.MODEL_MODE
+    }
+    if cache_stats['hits'] or cache_stats['misses']:
+        response['entityCache'] = cache_stats
+    if RESPONSE_TIMINGS:
+        response['timings'] = {name: int(round(secs * 1000)) for name, secs in timings.items()}
+    return response
+
+
+def _error_class(exception: Exception) -> str:
+    return next((c.__name__ for c in ERROR_CLASSES if isinstance(exception, c)), Exception.__name__)
+
+
+def _exception_results(exception: Exception, start_time: float):
+    if isinstance(exception, (ServerBusyException, RateLimitedException)):
+        return back_off_response(exception, start_time)
+    return error_results(exception, start_time)
+
+
+def back_off_response(exception: Exception, start_time: float, media_type: Optional[str] = None) -> Response:
+    """
+    The response for a `ServerBusyException` (503) or `RateLimitedException` (429): a real HTTP status, with a header
+    and a `retryAfter` field telling clients how many seconds to wait before trying again.
+    :param media_type: what to encode it as (defaults to the one negotiated for the current request, or JSON)
+    """
+    results = error_results(exception, start_time)
+    results['retryAfter'] = exception.retry_after_secs
+    if media_type is None:
+        requested_format = response_format()
+        media_type = requested_format.media_type if requested_format is not None else MEDIA_JSON
+    return encode(results, media_type, status_code=results['statusCode'],
+                  headers={'Retry-After': str(exception.retry_after_secs)})
+
+
+def error_results(exception: Exception, start_time: float) -> Dict:
+    """
+    The error response for an exception. Use this directly for responses that report errors for each item separately
+    (ie. streams), and `api_method` everywhere else.
+    """
+    # don't log certain exceptions, because they are expected and are too noisy on Sentry
+    try:
+        raise exception
+    except ServerBusyException as sbe:
+        return _error_results(str(sbe), start_time, status_code=503)
+    except RateLimitedException as rle:
+        return _error_results(str(rle), start_time, status_code=429)
+    except mcmetadata.exceptions.UnableToExtractError as utee:
+        return _error_results(str(utee), start_time)
+    except SSLError as se:
+        # this is a subclass of ConnectionError, but good to catch it so we have a more detailed error message
+        return _error_results(str(se), start_time)
+    except TooManyRedirects as tmr:
+        return _error_results(str(tmr), start_time)
+    except ReadTimeout as rt:
+        return _error_results(str(rt), start_time)
+    except ConnectionError as ce:
+        return _error_results(str(ce), start_time)
+    except RequestException as rexc:
+        return _error_results(str(rexc), start_time)
+    except ValueError as ve:
+        return _error_results(str(ve), start_time)
+    except RuntimeError as re:
+        return _error_results(str(re), start_time)
+    except Exception as e:
+        # log other, unexpected, exceptions to Sentry
+        logger.exception(e)
+        return _error_results(str(e), start_time)
+
+
+def _encoded(response):
+    # when handling a request, encode the response the way the client asked for (see `helpers.encoding`)
+    requested_format = response_format()
+    if (requested_format is None) or isinstance(response, Response):
+        return response
+    if 'results' in response:
+        response['results'] = to_layout(response['results'], requested_format.layout, requested_format.top_k)
+    return encode(response, requested_format.media_type)
+
+
+def _start_request(endpoint: str):
+    REQUESTS_IN_FLIGHT.inc(endpoint=endpoint)
+    return time.time(), start_request_stats(), start_request_timings()
+
+
+def _end_request(endpoint: str, start_time: float):
+    REQUESTS_IN_FLIGHT.dec(endpoint=endpoint)
+    REQUEST_SECONDS.observe(time.time() - start_time, endpoint=endpoint)
+
+
 def api_method(func):
     """
     Helper to add metadata to every api method. Use this in server.py and it will add stuff like the
     version to the response. Plug it handles errors in one place, and supresses ones we don't care to log to Sentry.
+    Also records request metrics (see `helpers.metrics`), and encodes the response as the client asked for (see
+    `helpers.encoding`). Works for both regular and `async` methods.
     """
+    endpoint = func.__name__
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            start_time, cache_stats, timings = _start_request(endpoint)
+            try:
+                results = await func(*args, **kwargs)
+                return _encoded(_ok_results(results, start_time, cache_stats, timings))
+            except Exception as e:
+                ERRORS.inc(endpoint=endpoint, exception=_error_class(e))
+                return _encoded(_exception_results(e, start_time))
+            finally:
+                _end_request(endpoint, start_time)
+        return async_wrapper
+
     @wraps(func)
     def wrapper(*args, **kwargs):
-        start_time = time.time()
+        start_time, cache_stats, timings = _start_request(endpoint)
         try:
             results = func(*args, **kwargs)
-            return {
-                'version': helpers.VERSION,
-                'status': STATUS_OK,
-                'duration': _duration(start_time),
-                'results': results,
-                'modelMode': helpers.MODEL_MODE
-            }
-        # don't log certain exceptions, because they are expected and are too noisy on Sentry
-        except mcmetadata.exceptions.UnableToExtractError as utee:
-            return _error_results(str(utee), start_time)
-        except SSLError as se:
-            # this is a subclass of ConnectionError, but good to catch it so we have a more detailed error message
-            return _error_results(str(se), start_time)
-        except TooManyRedirects as tmr:
-            return _error_results(str(tmr), start_time)
-        except ReadTimeout as rt:
-            return _error_results(str(rt), start_time)
-        except ConnectionError as ce:
-            return _error_results(str(ce), start_time)
-        except RequestException as rexc:
-            return _error_results(str(rexc), start_time)
-        except ValueError as ve:
-            return _error_results(str(ve), start_time)
-        except RuntimeError as re:
-            return _error_results(str(re), start_time)
+            return _encoded(_ok_results(results, start_time, cache_stats, timings))
         except Exception as e:
-            # log other, unexpected, exceptions to Sentry
-            logger.exception(e)
-            return _error_results(str(e), start_time)
+            ERRORS.inc(endpoint=endpoint, exception=_error_class(e))
+            return _encoded(_exception_results(e, start_time))
+        finally:
+            _end_request(endpoint, start_time)
     return wrapper
+
+
+def _is_json(content_type: str) -> bool:
+    media_type = content_type.split(';')[0].strip().lower()
+    return (media_type == 'application/json') or media_type.endswith('+json')
+
+
+def form_or_json(model: Type[BaseModel]):
+    """
+    A FastAPI dependency that reads the fields of the model from the request body, sent either as a form (like all
+    the original endpoints take) or as a JSON object, depending on the `Content-Type`. Bad or missing fields get the
+    same 422 response as FastAPI's own validation. Pair it with `form_or_json_openapi` to document the endpoint.
+    """
+    async def parse(request: Request) -> BaseModel:
+        try:
+            if _is_json(request.headers.get('content-type', '')):
+                fields = await request.json()
+            else:
+                fields = dict(await request.form())
+        except json.JSONDecodeError as e:
+            raise RequestValidationError([dict(type='json_invalid', loc=('body', e.pos), msg="JSON decode error",
+                                               input={}, ctx=dict(error=e.msg))])
+        try:
+            return model.model_validate(fields)
+        except ValidationError as e:
+            raise RequestValidationError([dict(error, loc=('body',) + tuple(error['loc']))
+                                          for error in e.errors(include_url=False)])
+    return parse
+
+
+def form_or_json_openapi(model: Type[BaseModel]) -> Dict:
+    # the `openapi_extra` for an endpoint using `form_or_json`, so the docs show both kinds of body
+    schema = model.model_json_schema()
+    return {'requestBody': {'required': True, 'content': {
+        'application/x-www-form-urlencoded': {'schema': schema},
+        'application/json': {'schema': schema},
+    }}}
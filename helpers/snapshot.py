@@ -0,0 +1,46 @@
+"""
+Save the language models to a local directory, so servers can load them from there (via the MODEL_SNAPSHOT_DIR env var)
+instead of from installed packages or the HuggingFace hub. spaCy pipelines are saved with `to_disk` and the Swahili
+model with `save_pretrained`.
+
+Run from the repo root with: `python -m helpers.snapshot /path/to/snapshot [languages...]`
+"""
+import argparse
+import logging
+import os
+import time
+from typing import List
+
+from helpers import LANGUAGES, SWAHILI
+from helpers.models import MASAKHANER_MODEL, spacy_model_name
+
+logger = logging.getLogger(__name__)
+
+
+def save_snapshot(snapshot_dir: str, languages: List[str]):
+    """
+    Save the models for each language into the directory, with the names `helpers.models.snapshot_path` looks for.
+    The full models are saved, so settings like SPACY_NER_ONLY and SWAHILI_BACKEND still apply when loading them.
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    for lang in languages:
+        start_time = time.time()
+        if lang == SWAHILI:
+            from transformers import AutoTokenizer, AutoModelForTokenClassification
+            path = os.path.join(snapshot_dir, MASAKHANER_MODEL.replace('/', '--'))
+            AutoTokenizer.from_pretrained(MASAKHANER_MODEL).save_pretrained(path)
+            AutoModelForTokenClassification.from_pretrained(MASAKHANER_MODEL).save_pretrained(path)
+        else:
+            import spacy
+            model_name = spacy_model_name(lang)
+            path = os.path.join(snapshot_dir, model_name)
+            spacy.load(model_name).to_disk(path)
+        logger.info("Saved '{}' model to {} in {:.1f} secs".format(lang, path, time.time() - start_time))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Save the language models to a directory for faster startup.")
+    parser.add_argument('snapshot_dir', help="directory to save the models in")
+    parser.add_argument('languages', nargs='*', default=LANGUAGES, help="languages to save (default: all)")
+    args = parser.parse_args()
+    save_snapshot(args.snapshot_dir, args.languages)
@@ -0,0 +1,60 @@
+import logging
+import threading
+import time
+from typing import Dict
+
+from helpers import PRELOAD_LANGUAGES
+import helpers.entities as entities
+from helpers.pool import ner_pool
+
+logger = logging.getLogger(__name__)
+
+_ready = threading.Event()
+_state = dict(loading=False, loadSecs=None, error=None)
+
+
+def load_models():
+    """
+    Load the PRELOAD_LANGUAGES models, in this process or in the NER worker processes (see `helpers.pool`), and mark
+    the server as ready once they are.
+    """
+    _state['loading'] = True
+    start_time = time.time()
+    try:
+        if ner_pool.loads_models_here:
+            entities.language_nlp_lookup.preload(PRELOAD_LANGUAGES)
+        ner_pool.start()  # the workers load their own models as they start
+        _state['loadSecs'] = round(time.time() - start_time, 3)
+        _ready.set()
+        logger.info("Ready, after loading models for {} secs".format(_state['loadSecs']))
+    except Exception as e:
+        _state['error'] = str(e)
+        logger.exception(e)
+    finally:
+        _state['loading'] = False
+
+
+def start(background: bool = True):
+    """
+    Get the server ready to handle requests. In the background by default, so the server can start accepting
+    connections (ie. for health checks) right away.
+    """
+    if background:
+        threading.Thread(target=load_models, name="model-loader", daemon=True).start()
+    else:
+        load_models()
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+def readiness() -> Dict:
+    return dict(
+        ready=is_ready(),
+        loading=_state['loading'],
+        loadSecs=_state['loadSecs'],
+        error=_state['error'],
+        languages=PRELOAD_LANGUAGES,
+        loaded=entities.language_nlp_lookup.status()['loaded'],
+    )
@@ -0,0 +1,127 @@
+import asyncio
+import json
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from helpers.encoding import json_default
+from helpers.request import STATUS_OK, error_results, _duration
+
+_END = object()  # put on the results queue once every line has been handled
+
+
+async def ndjson_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[Optional[bytes]]:
+    """
+    Split a stream of bytes into lines, without ever holding more than one line in memory.
+    :param chunks: the body, ie. from `request.stream()`
+    :param max_line_bytes: lines longer than this are skipped, yielding None in their place
+    """
+    buffer = b''
+    skipping = False  # in the middle of a line that is too long
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            if skipping:
+                skipping = False  # this is the end of the long line
+                continue
+            yield line if len(line) <= max_line_bytes else None
+        if (not skipping) and (len(buffer) > max_line_bytes):
+            skipping = True
+            yield None
+        if skipping:
+            buffer = b''
+    if buffer and not skipping:
+        yield buffer
+
+
+async def process_ndjson(chunks: AsyncIterator[bytes], handler: Callable[[Dict], Awaitable[Dict]],
+                         max_in_flight: int, max_line_bytes: int) -> AsyncIterator[bytes]:
+    """
+    Run the handler on each JSON object in a newline-delimited stream, with at most `max_in_flight` running at once,
+    and yield a line of JSON for each as soon as it finishes (so not necessarily in input order). A document's slot is
+    only freed once its result has been taken, so the body isn't read any faster than documents are handled and their
+    results are sent, and memory stays bounded however long the stream is (and however slowly the client reads).
+    :param chunks: the request body
+    :param handler: async function that takes the parsed object and returns its results
+    :param max_in_flight: most documents to work on at once
+    :param max_line_bytes: the longest line to accept
+    :return: lines of JSON, each with the `id` from the input object, the `line` number, and the results or error
+    """
+    results = asyncio.Queue()
+    slots = asyncio.Semaphore(max_in_flight)
+    tasks = set()
+
+    async def handle(line_number: int, line: Optional[bytes]):
+        # `handle_line` catches everything, so there is always a result, and its slot is released once it is sent
+        results.put_nowait(await handle_line(line_number, line, handler, max_line_bytes))
+
+    async def read():
+        line_number = 0
+        try:
+            async for line in ndjson_lines(chunks, max_line_bytes):
+                line_number += 1
+                if (line is not None) and not line.strip():
+                    continue
+                await slots.acquire()
+                task = asyncio.ensure_future(handle(line_number, line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(set(tasks))
+        except ClientDisconnect:
+            pass
+        finally:
+            results.put_nowait(_END)
+
+    reader = asyncio.ensure_future(read())
+    try:
+        while True:
+            result = await results.get()
+            if result is _END:
+                break
+            yield (json.dumps(result, default=json_default) + '\n').encode('utf-8')
+            slots.release()
+        await reader  # raise anything that went wrong reading the body
+    finally:
+        reader.cancel()
+        for task in list(tasks):
+            task.cancel()
+
+
+async def handle_line(line_number: int, line: Optional[bytes], handler: Callable[[Dict], Awaitable[Dict]],
+                      max_line_bytes: int) -> Dict:
+    """
+    Run the handler on one line of JSON, returning its results (or the error) along with the `id` from the line and
+    the line number. This is what `process_ndjson` yields for each line, and what `cli.py` writes out.
+    """
+    start_time = time.time()
+    item_id = None
+    try:
+        if line is None:
+            raise ValueError("Line is longer than {} bytes".format(max_line_bytes))
+        item = json.loads(line)
+        if not isinstance(item, dict):
+            raise ValueError("Each line must be a JSON object")
+        item_id = item.get('id')
+        item_results = await handler(item)
+        return dict(id=item_id, line=line_number, status=STATUS_OK, duration=_duration(start_time),
+                    results=item_results)
+    except Exception as e:
+        return dict(id=item_id, line=line_number) | error_results(e, start_time)
+
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """
+    Streams lines of JSON back while the request body is still being read. The standard `StreamingResponse` listens
+    for the client disconnecting by reading from `receive`, which would swallow the rest of the request body, so here
+    a disconnect is noticed when reading the body instead.
+    """
+
+    media_type = 'application/x-ndjson'
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.stream_response(send)
@@ -0,0 +1,37 @@
+from typing import Dict, List
+
+
+def normalize(text: str) -> str:
+    # mentions that differ only in case or spacing count as the same entity
+    return ' '.join(text.split()).casefold()
+
+
+def summarize(entities: List[Dict], top_k: int = 0) -> List[Dict]:
+    """
+    Aggregate entity mentions into one entry for each unique (normalized text, type), in a single pass. Each entry has
+    the `text`, `start_char` and `end_char` of the first mention plus a `count` of all of them, and they are sorted by
+    count (most first), then by where they first appear.
+    :param entities: mentions as returned by `helpers.entities.from_text`
+    :param top_k: only keep the most frequent this many of each type (0 to keep them all)
+    """
+    summary = {}
+    for entity in entities:
+        key = (normalize(entity['text']), entity['type'])
+        entry = summary.get(key)
+        if entry is None:
+            summary[key] = dict(text=entity['text'], type=entity['type'], count=1, start_char=entity['start_char'],
+                                end_char=entity['end_char'])
+            continue
+        entry['count'] += 1
+        if entity['start_char'] < entry['start_char']:  # custom entities come after the model's, so can be earlier
+            entry.update(text=entity['text'], start_char=entity['start_char'], end_char=entity['end_char'])
+    entries = sorted(summary.values(), key=lambda e: (-e['count'], e['start_char']))
+    if top_k <= 0:
+        return entries
+    kept_by_type = {}
+    top_entries = []
+    for entry in entries:
+        if kept_by_type.get(entry['type'], 0) < top_k:
+            kept_by_type[entry['type']] = kept_by_type.get(entry['type'], 0) + 1
+            top_entries.append(entry)
+    return top_entries
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import unittest
+
+import httpx
+from fastapi import FastAPI
+
+import helpers.encoding as encoding
+
+from helpers.admission import AdmissionMiddleware, ConcurrencyLimiter, TokenBucket, DEADLINE_HEADER
+from helpers.encoding import MEDIA_JSON, MEDIA_MSGPACK
+from helpers.exceptions import ServerBusyException
+from helpers.request import api_method
+
+
+def _app(**kwargs) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/slow")
+    @api_method
+    async def slow():
+        await asyncio.sleep(0.1)
+        return {}
+
+    @app.get("/health")
+    def health():
+        return dict(status="ok")
+
+    app.add_middleware(AdmissionMiddleware, **kwargs)
+    return app
+
+
+def _post_all(app: FastAPI, count: int, path: str = "/slow", headers=None):
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await asyncio.gather(*[client.post(path, headers=headers) for _ in range(count)])
+    return asyncio.run(run())
+
+
+class TestConcurrencyLimiter(unittest.TestCase):
+
+    def test_queue(self):
+        async def run():
+            limiter = ConcurrencyLimiter('/test', max_concurrent=1, queue_size=1, retry_after_secs=2)
+            await limiter.acquire(1)
+            waiting = asyncio.ensure_future(limiter.acquire(1))
+            await asyncio.sleep(0)
+            assert limiter.waiting == 1
+            with self.assertRaises(ServerBusyException):  # the queue is full
+                await limiter.acquire(1)
+            limiter.release(0.01)
+            await waiting  # the slot is handed over
+            assert (limiter.active, limiter.waiting) == (1, 0)
+            limiter.release(0.01)
+            assert limiter.active == 0
+        asyncio.run(run())
+
+    def test_deadline(self):
+        async def run():
+            limiter = ConcurrencyLimiter('/test', max_concurrent=1, queue_size=10, retry_after_secs=2)
+            await limiter.acquire(1)
+            with self.assertRaises(ServerBusyException):  # waits until the deadline
+                await limiter.acquire(0.05)
+            assert limiter.waiting == 0
+            limiter.release(5)  # requests now take 5 secs
+            await limiter.acquire(1)
+            with self.assertRaises(ServerBusyException):  # turned away right away, since it can't start in time
+                await asyncio.wait_for(limiter.acquire(1), 0.01)
+            limiter.release()
+        asyncio.run(run())
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_burst(self):
+        bucket = TokenBucket(rate_per_sec=1, burst=2)
+        assert bucket.take() == 0
+        assert bucket.take() == 0
+        assert 0 < bucket.take() <= 1
+
+
+class TestAdmissionMiddleware(unittest.TestCase):
+
+    def test_off(self):
+        responses = _post_all(_app(max_concurrent=0, rate_per_sec=0), 5)
+        assert all(r.status_code == 200 for r in responses)
+
+    def test_queue_full(self):
+        responses = _post_all(_app(max_concurrent=1, queue_size=1, retry_after_secs=7), 4)
+        assert sorted(r.status_code for r in responses) == [200, 200, 503, 503]
+        busy = next(r for r in responses if r.status_code == 503)
+        assert busy.headers['Retry-After'] == '7'
+        data = busy.json()
+        assert (data['status'], data['statusCode'], data['retryAfter']) == ('error', 503, 7)
+        assert busy.headers['Content-Type'] == MEDIA_JSON
+        assert busy.headers['Vary'] == 'Accept'
+
+    @unittest.skipUnless(encoding.msgpack, "msgpack isn't installed")
+    def test_queue_full_msgpack(self):
+        responses = _post_all(_app(max_concurrent=1, queue_size=1), 3, headers={'Accept': MEDIA_MSGPACK})
+        busy = next(r for r in responses if r.status_code == 503)
+        assert busy.headers['Content-Type'] == MEDIA_MSGPACK
+        assert encoding.msgpack.unpackb(busy.content)['statusCode'] == 503
+
+    def test_client_deadline(self):
+        responses = _post_all(_app(max_concurrent=1, queue_size=10), 2, headers={DEADLINE_HEADER: '0.01'})
+        assert sorted(r.status_code for r in responses) == [200, 503]
+
+    def test_rate_limit(self):
+        app = _app(rate_per_sec=0.1, burst=2, api_keys={'one', 'two'})
+        responses = _post_all(app, 3, headers={'X-API-Key': 'one'})
+        assert sorted(r.status_code for r in responses) == [200, 200, 429]
+        limited = next(r for r in responses if r.status_code == 429)
+        assert json.loads(limited.text)['statusCode'] == 429
+        assert int(limited.headers['Retry-After']) >= 1
+        # other clients have their own buckets, and other methods aren't limited
+        assert _post_all(app, 1, headers={'X-API-Key': 'two'})[0].status_code == 200
+        async def get():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+                return await client.get('/health', headers={'X-API-Key': 'one'})
+        assert asyncio.run(get()).status_code == 200
+
+    def test_unknown_api_keys(self):
+        app = _app(rate_per_sec=0.1, burst=2, api_keys={'one'})
+        responses = [_post_all(app, 1, headers={'X-API-Key': key})[0] for key in ['made', 'up', 'keys']]
+        assert [r.status_code for r in responses] == [200, 200, 429]  # all the same client, by IP address
+        assert _post_all(app, 1, headers={'X-API-Key': 'one'})[0].status_code == 200
+
+    def test_spoofed_forwarded_for(self):
+        app = _app(rate_per_sec=0.1, burst=2, trusted_proxies=1)
+        # what a client sends comes before the address the proxy adds, so making it up each time doesn't help
+        responses = [_post_all(app, 1, headers={'X-Forwarded-For': '10.0.0.{}, 203.0.113.7'.format(idx)})[0]
+                     for idx in range(3)]
+        assert [r.status_code for r in responses] == [200, 200, 429]
+        assert _post_all(app, 1, headers={'X-Forwarded-For': '203.0.113.8'})[0].status_code == 200
+        # behind two proxies, the client is the one the outer proxy saw
+        app = _app(rate_per_sec=0.1, burst=2, trusted_proxies=2)
+        responses = [_post_all(app, 1, headers={'X-Forwarded-For': '10.0.0.{}, 203.0.113.7, 10.1.1.1'.format(idx)})[0]
+                     for idx in range(3)]
+        assert [r.status_code for r in responses] == [200, 200, 429]
+
+    def test_unknown_paths(self):
+        responses = _post_all(_app(max_concurrent=1, queue_size=0), 3, path="/nothing")
+        assert all(r.status_code == 404 for r in responses)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import threading
+import time
+import unittest
+
+from helpers.batching import MicroBatcher
+
+
+class TestMicroBatcher(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self._batches = []
+
+    def _upper(self, texts):
+        self._batches.append(list(texts))
+        time.sleep(0.01)
+        return [text.upper() for text in texts]
+
+    def _call_concurrently(self, batcher, calls):
+        results = [None] * len(calls)
+
+        def call(idx):
+            results[idx] = batcher(calls[idx])
+        threads = [threading.Thread(target=call, args=(idx,)) for idx in range(len(calls))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_disabled(self):
+        batcher = MicroBatcher(self._upper, 10, 0)
+        assert not batcher.enabled
+        assert batcher(['a', 'b']) == ['A', 'B']
+        assert self._batches == [['a', 'b']]
+
+    def test_coalesces(self):
+        batcher = MicroBatcher(self._upper, 100, 200)
+        calls = [['a'], ['b', 'c'], ['d'], [], ['e']]
+        results = self._call_concurrently(batcher, calls)
+        assert results == [['A'], ['B', 'C'], ['D'], [], ['E']]
+        assert len(self._batches) < 4
+        assert sorted(text for batch in self._batches for text in batch) == ['a', 'b', 'c', 'd', 'e']
+
+    def test_max_batch_size(self):
+        batcher = MicroBatcher(self._upper, 2, 200)
+        calls = [[str(i)] for i in range(6)]
+        results = self._call_concurrently(batcher, calls)
+        assert results == [[str(i)] for i in range(6)]
+        assert max(len(batch) for batch in self._batches) == 2
+
+    def test_errors(self):
+        def fail(texts):
+            raise RuntimeError("model failed")
+        batcher = MicroBatcher(fail, 10, 10)
+        self.assertRaises(RuntimeError, batcher, ['a'])
+        # the background thread keeps going after an error
+        batcher._func = self._upper
+        assert batcher(['a']) == ['A']
+
+
+if __name__ == "__main__":
+    unittest.main()
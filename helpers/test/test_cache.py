@@ -0,0 +1,94 @@
+import multiprocessing
+import os
+import tempfile
+import unittest
+
+from helpers.cache import LRUCache, SQLiteCache, TieredCache, cache_key, start_request_stats
+
+SAMPLE_ENTITIES = [dict(text='Boston', type='GPE', start_char=10, end_char=16)]
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._db_path = os.path.join(self._temp_dir.name, 'cache.db')
+
+    def tearDown(self) -> None:
+        self._temp_dir.cleanup()
+
+    def test_cache_key(self):
+        assert cache_key('en', 'some text') == cache_key('en', 'some text')
+        assert cache_key('en', 'some text') != cache_key('es', 'some text')
+        assert cache_key('a', 'bc') != cache_key('ab', 'c')
+
+    def test_lru(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        assert cache.get('a') == 1  # now 'b' is the least recently used
+        cache.put('c', 3)
+        assert len(cache) == 2
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+
+    def test_sqlite(self):
+        cache = SQLiteCache(self._db_path)
+        assert cache.get('a') is None
+        cache.put('a', SAMPLE_ENTITIES)
+        assert cache.get('a') == SAMPLE_ENTITIES
+        # make sure it survives a restart
+        assert SQLiteCache(self._db_path).get('a') == SAMPLE_ENTITIES
+
+    def test_sqlite_fork(self):
+        cache = SQLiteCache(self._db_path)
+        cache.put('a', 1)  # opens the connection before forking, like the gunicorn master does with --preload
+
+        def child():
+            if cache._db._db is not None:  # it must open its own connection
+                os._exit(1)
+            cache.put('b', cache.get('a') + 1)
+            os._exit(0)
+        process = multiprocessing.get_context('fork').Process(target=child)
+        process.start()
+        process.join()
+        assert process.exitcode == 0
+        assert cache.get('b') == 2
+
+    def test_sqlite_prune(self):
+        cache = SQLiteCache(self._db_path, max_size=5)
+        for i in range(SQLiteCache.PRUNE_EVERY):
+            cache.put(str(i), i)
+        assert cache.get(str(SQLiteCache.PRUNE_EVERY - 1)) == SQLiteCache.PRUNE_EVERY - 1
+        assert cache.get('0') is None
+
+    def test_tiered(self):
+        disk_cache = TieredCache(10, self._db_path)
+        disk_cache.put('a', SAMPLE_ENTITIES)
+        # a new cache (ie. after a restart) has an empty memory tier, but finds it on disk
+        cache = TieredCache(10, self._db_path)
+        assert cache.get('a') == SAMPLE_ENTITIES
+        assert cache.get('b') is None
+        assert cache.stats() == dict(hits=1, misses=1)
+
+    def test_disabled(self):
+        cache = TieredCache(0)
+        assert not cache.enabled
+        cache.put('a', SAMPLE_ENTITIES)
+        assert cache.get('a') is None
+        assert cache.stats() == dict(hits=0, misses=0)
+
+    def test_request_stats(self):
+        cache = TieredCache(10)
+        cache.put('a', SAMPLE_ENTITIES)
+        request_stats = start_request_stats()
+        cache.get('a')
+        cache.get('a')
+        cache.get('b')
+        assert request_stats == dict(hits=2, misses=1)
+        assert start_request_stats() == dict(hits=0, misses=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
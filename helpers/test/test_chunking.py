@@ -0,0 +1,74 @@
+import re
+import unittest
+
+from helpers.chunking import chunk_spans, merge_entities
+
+SAMPLE_TEXT = """President Samia Suluhu Hassan met with officials from the World Bank in Dar es Salaam on Monday.
+
+The talks covered new loans for roads in Dodoma and Arusha. Officials from Kenya and Uganda also attended, along
+with a delegation from the African Development Bank. Reporters from Nairobi asked about the timeline!
+
+Later, the President travelled to Zanzibar for a meeting with local leaders? No statement was released."""
+
+
+def _capitalized_words(text: str):
+    # a stand-in for a model, finding runs of capitalized words
+    return [dict(text=m.group(), type='X', start_char=m.start(), end_char=m.end())
+            for m in re.finditer(r'[A-Z]\w*(?: [A-Z]\w*)*', text)]
+
+
+class TestChunking(unittest.TestCase):
+
+    def test_short_text(self):
+        assert chunk_spans("Short text.", 100) == [(0, 11)]
+        assert chunk_spans(SAMPLE_TEXT, 0) == [(0, len(SAMPLE_TEXT))]
+
+    def test_spans(self):
+        spans = chunk_spans(SAMPLE_TEXT, 120)
+        assert len(spans) > 1
+        assert spans[0][0] == 0
+        assert spans[-1][1] == len(SAMPLE_TEXT)
+        for (start, end), (next_start, _) in zip(spans, spans[1:]):
+            assert end - start <= 120
+            assert next_start == end  # no gaps, no overlap
+            assert SAMPLE_TEXT[end - 1].isspace()  # split at a boundary, not mid-word
+
+    def test_paragraph_boundaries(self):
+        spans = chunk_spans(SAMPLE_TEXT, 180)
+        assert SAMPLE_TEXT[:spans[0][1]].endswith("Monday.\n\n")
+
+    def test_overlap(self):
+        spans = chunk_spans(SAMPLE_TEXT, 120, overlap_chars=30)
+        for (start, end), (next_start, next_end) in zip(spans, spans[1:]):
+            assert end - start <= 120
+            assert start < next_start < end
+            assert next_end > end
+
+    def test_no_boundaries(self):
+        text = 'x' * 250
+        spans = chunk_spans(text, 100)
+        assert spans == [(0, 100), (100, 200), (200, 250)]
+
+    def test_merge_matches_whole_text(self):
+        expected = _capitalized_words(SAMPLE_TEXT)
+        for max_chars, overlap_chars in [(120, 0), (120, 30), (60, 15), (1000, 0)]:
+            spans = chunk_spans(SAMPLE_TEXT, max_chars, overlap_chars)
+            chunk_entities = [_capitalized_words(SAMPLE_TEXT[start:end]) for start, end in spans]
+            merged = merge_entities(spans, chunk_entities)
+            assert merged == expected, (max_chars, overlap_chars)
+            for e in merged:
+                assert SAMPLE_TEXT[e['start_char']:e['end_char']] == e['text']
+
+    def test_merge_seam_duplicate(self):
+        # the first window cut "Dar es Salaam" short, the second found all of it
+        spans = [(0, 20), (10, 40)]
+        chunk_entities = [
+            [dict(text='Dar', type='LOC', start_char=14, end_char=17)],
+            [dict(text='Dar es Salaam', type='LOC', start_char=4, end_char=17)],
+        ]
+        merged = merge_entities(spans, chunk_entities)
+        assert merged == [dict(text='Dar es Salaam', type='LOC', start_char=14, end_char=27)]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import gzip
+import unittest
+from typing import Optional
+
+from fastapi import FastAPI, Depends, Request
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+import helpers.compression as compression
+from helpers.compression import RequestDecompressionMiddleware, ResponseCompressionMiddleware
+from helpers.request import form_or_json
+
+
+class Item(BaseModel):
+    text: str
+    url: Optional[str] = None
+
+
+def _app(max_bytes: int = 1000) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/item")
+    def item(fields: Item = Depends(form_or_json(Item))):
+        return dict(text=fields.text, url=fields.url)
+
+    @app.post("/echo")
+    async def echo(request: Request):
+        chunks = [chunk async for chunk in request.stream()]
+        return dict(length=sum(len(c) for c in chunks), chunks=len([c for c in chunks if c]))
+
+    @app.get("/big")
+    def big():
+        return dict(text="a" * 5000)
+
+    app.add_middleware(RequestDecompressionMiddleware, max_bytes=max_bytes)
+    app.add_middleware(ResponseCompressionMiddleware, minimum_size=1000, excluded_paths=['/echo'])
+    return app
+
+
+class TestRequestDecompression(unittest.TestCase):
+
+    def setUp(self):
+        self._client = TestClient(_app())
+
+    def test_form_and_json(self):
+        response = self._client.post('/item', data=dict(text="hello"))
+        assert response.json() == dict(text="hello", url=None)
+        response = self._client.post('/item', json=dict(text="hello", url="https://example.com"))
+        assert response.json() == dict(text="hello", url="https://example.com")
+        response = self._client.post('/item', json=dict(url="https://example.com"))
+        assert response.status_code == 422
+        assert response.json()['detail'][0]['loc'] == ['body', 'text']
+        response = self._client.post('/item', content=b'{"text": ', headers={'Content-Type': 'application/json'})
+        assert response.status_code == 422
+
+    def test_gzip(self):
+        response = self._client.post('/item', content=gzip.compress(b'{"text": "hello"}'),
+                                     headers={'Content-Encoding': 'gzip', 'Content-Type': 'application/json'})
+        assert response.json() == dict(text="hello", url=None)
+        response = self._client.post('/item', content=gzip.compress(b'text=hello'),
+                                     headers={'Content-Encoding': 'gzip',
+                                              'Content-Type': 'application/x-www-form-urlencoded'})
+        assert response.json() == dict(text="hello", url=None)
+
+    def test_streamed(self):
+        body = gzip.compress(b'a' * 900)
+
+        def chunks():
+            for start in range(0, len(body), 5):
+                yield body[start:start + 5]
+        response = self._client.post('/echo', content=chunks(), headers={'Content-Encoding': 'gzip'})
+        assert response.json()['length'] == 900
+
+    def test_too_big(self):
+        response = self._client.post('/echo', content=gzip.compress(b'a' * 1001), headers={'Content-Encoding': 'gzip'})
+        assert response.status_code == 413
+        response = self._client.post('/echo', content=b'a' * 1001)  # only compressed bodies are limited
+        assert response.json()['length'] == 1001
+
+    def test_bomb(self):
+        pieces = []
+        decoder = compression.decompressor('gzip', pieces.append)
+        decoder.write(gzip.compress(b'\0' * (10 * 1024 * 1024)))  # about 10KB compressed
+        decoder.finish()
+        assert sum(len(piece) for piece in pieces) == 10 * 1024 * 1024
+        assert max(len(piece) for piece in pieces) <= compression._PIECE_BYTES
+        response = self._client.post('/echo', content=gzip.compress(b'\0' * (10 * 1024 * 1024)),
+                                     headers={'Content-Encoding': 'gzip'})
+        assert response.status_code == 413
+
+    def test_bad_encoding(self):
+        response = self._client.post('/echo', content=b'not gzip', headers={'Content-Encoding': 'gzip'})
+        assert response.status_code == 400
+        response = self._client.post('/echo', content=gzip.compress(b'a' * 100)[:-10],
+                                     headers={'Content-Encoding': 'gzip'})
+        assert response.status_code == 400
+        response = self._client.post('/echo', content=b'a', headers={'Content-Encoding': 'br'})
+        assert response.status_code == 415
+
+    @unittest.skipUnless(compression.zstandard, "zstandard isn't installed")
+    def test_zstd(self):
+        body = compression.zstandard.ZstdCompressor().compress(b'{"text": "hello"}')
+        response = self._client.post('/item', content=body,
+                                     headers={'Content-Encoding': 'zstd', 'Content-Type': 'application/json'})
+        assert response.json() == dict(text="hello", url=None)
+
+
+class TestResponseCompression(unittest.TestCase):
+
+    def test_gzip(self):
+        client = TestClient(_app())
+        response = client.get('/big', headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['content-encoding'] == 'gzip'
+        assert response.json()['text'] == "a" * 5000  # httpx decompresses it
+        response = client.post('/item', data=dict(text="small"), headers={'Accept-Encoding': 'gzip'})
+        assert 'content-encoding' not in response.headers
+        response = client.get('/big', headers={'Accept-Encoding': 'identity'})
+        assert 'content-encoding' not in response.headers
+
+
+if __name__ == "__main__":
+    unittest.main()
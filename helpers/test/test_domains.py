@@ -0,0 +1,61 @@
+import unittest
+from unittest import mock
+
+import mcmetadata.urls
+
+import helpers.domains as domains
+from helpers.cache import LRUCache
+
+URLS = [
+    "https://www.nytimes.com/2023/01/01/world/story.html",
+    "https://www.nytimes.com/2023/01/02/us/another-story.html",
+    "http://m.bbc.co.uk/news/world-12345",
+    "https://NEWS.bbc.co.uk:443/sport",
+    "https://foo.wordpress.com/2020/01/01/post/",
+    "https://bar.wordpress.com/about",
+    "https://example.com/mirror/sub.wordpress.com/post",
+    "https://x.blogspot.com/2020/a.html",
+    "https://archive.is/o/abc12/https://www.nytimes.com/story",
+    "https://127.0.0.1:8000/story",
+    "https://amp-foo-com.cdn.ampproject.org/c/foo.com/story",
+    "https://www.com/a.html",
+    "https://www.com/",
+    "https://www.com/%2E",
+    "http://gov.cn/",
+]
+
+
+class TestCanonicalDomain(unittest.TestCase):
+
+    def setUp(self):
+        self._cache_patch = mock.patch.object(domains, '_domain_cache', LRUCache(100))
+        self._cache_patch.start()
+
+    def tearDown(self):
+        self._cache_patch.stop()
+
+    def test_same_as_mcmetadata(self):
+        for _ in range(2):  # the second time round comes from the cache
+            for url in URLS:
+                assert domains.canonical_domain(url) == mcmetadata.urls.canonical_domain(url), url
+
+    def test_hosts_remembered(self):
+        with mock.patch.object(mcmetadata.urls, 'canonical_domain', wraps=mcmetadata.urls.canonical_domain) as full:
+            assert domains.canonical_domain(URLS[0]) == 'nytimes.com'
+            assert domains.canonical_domain(URLS[1]) == 'nytimes.com'
+            assert full.call_count == 1
+
+    def test_path_dependent_not_remembered(self):
+        with mock.patch.object(mcmetadata.urls, 'canonical_domain', wraps=mcmetadata.urls.canonical_domain) as full:
+            for _ in range(2):
+                domains.canonical_domain("https://archive.is/o/abc12/https://www.nytimes.com/story")
+            assert full.call_count == 2
+
+    def test_batch(self):
+        results = domains.canonical_domains(["https://www.nytimes.com/story", "", "not a url",
+                                             "https://www.bbc.co.uk/news"])
+        assert results == ['nytimes.com', None, None, 'bbc.co.uk']
+
+
+if __name__ == "__main__":
+    unittest.main()
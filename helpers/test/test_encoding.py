@@ -0,0 +1,82 @@
+import unittest
+from unittest import mock
+
+import helpers.encoding as encoding
+from helpers.encoding import negotiate, columnar_entities, to_layout, encode, MEDIA_JSON, MEDIA_MSGPACK, \
+    LAYOUT_ROWS, LAYOUT_COLUMNAR, LAYOUT_SUMMARY
+
+ENTITIES = [
+    dict(text="Barack Obama", type="PERSON", start_char=0, end_char=12),
+    dict(text="Boston", type="GPE", start_char=21, end_char=27),
+    dict(text="Michelle Obama", type="PERSON", start_char=33, end_char=47),
+]
+
+
+class TestNegotiate(unittest.TestCase):
+
+    def test_json(self):
+        for accept in [None, '', '*/*', 'application/json', 'text/html, application/*;q=0.5', 'image/png']:
+            assert negotiate(accept) == MEDIA_JSON
+
+    def test_msgpack(self):
+        with mock.patch.object(encoding, 'msgpack', object()):
+            assert negotiate('application/msgpack') == MEDIA_MSGPACK
+            assert negotiate('application/x-msgpack, application/json;q=0.5') == MEDIA_MSGPACK
+            assert negotiate('application/msgpack;q=0.5, application/json') == MEDIA_JSON
+            assert negotiate('application/msgpack;q=0') == MEDIA_JSON
+
+    def test_msgpack_not_installed(self):
+        with mock.patch.object(encoding, 'msgpack', None):
+            assert negotiate('application/msgpack') == MEDIA_JSON
+
+
+class TestLayout(unittest.TestCase):
+
+    def test_columnar(self):
+        columns = columnar_entities(ENTITIES)
+        assert columns['types'] == ['PERSON', 'GPE']
+        assert columns['type'] == [0, 1, 0]
+        assert columns['text'] == [e['text'] for e in ENTITIES]
+        assert columns['start_char'] == [0, 21, 33]
+        assert columns['end_char'] == [12, 27, 47]
+        rows = [dict(text=columns['text'][i], type=columns['types'][columns['type'][i]],
+                     start_char=columns['start_char'][i], end_char=columns['end_char'][i])
+                for i in range(len(columns['text']))]
+        assert rows == ENTITIES
+
+    def test_nested(self):
+        results = [dict(entities=ENTITIES, url=None), dict(entities=[], url='https://example.com')]
+        assert to_layout(results, LAYOUT_ROWS) == results
+        columnar = to_layout(results, LAYOUT_COLUMNAR)
+        assert columnar[0]['entities']['types'] == ['PERSON', 'GPE']
+        assert columnar[1]['entities']['text'] == []
+        assert columnar[1]['url'] == 'https://example.com'
+
+    def test_summary(self):
+        results = dict(entities=ENTITIES + ENTITIES[:1], url=None)
+        summary = to_layout(results, LAYOUT_SUMMARY, top_k=1)['entities']
+        assert [(e['text'], e['count']) for e in summary] == [("Barack Obama", 2), ("Boston", 1)]
+
+
+class TestEncode(unittest.TestCase):
+
+    def test_json(self):
+        response = encode(dict(entities=ENTITIES, text="Café"), MEDIA_JSON)
+        assert response.media_type == MEDIA_JSON
+        assert "Café".encode('utf-8') in response.body
+        assert response.headers['Vary'] == 'Accept'
+
+    def test_headers(self):
+        response = encode({}, MEDIA_JSON, status_code=503, headers={'Retry-After': '3'})
+        assert response.status_code == 503
+        assert (response.headers['Retry-After'], response.headers['Vary']) == ('3', 'Accept')
+
+    @unittest.skipUnless(encoding.msgpack, "msgpack isn't installed")
+    def test_msgpack(self):
+        response = encode(dict(entities=ENTITIES), MEDIA_MSGPACK)
+        assert response.media_type == MEDIA_MSGPACK
+        assert encoding.msgpack.unpackb(response.body) == dict(entities=ENTITIES)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,11 @@
 import unittest
 import json
 import os
+from unittest import mock
 
 from helpers import MODEL_MODE, MODEL_MODE_SMALL
 import helpers.entities as entities
+from helpers.models import load_spacy_model
 
 this_dir = os.path.dirname(os.path.abspath(__file__))
 
@@ -46,6 +48,42 @@ class TestEntities(unittest.TestCase):
             assert 'type' in e
             assert e['type'] in ['DATE', 'PER', 'LOC', 'ORG']
 
+    def test_batch(self):
+        spanish_story = json.load(open(os.path.join(this_dir, 'fixtures', '2210723002.json')))
+        korean_stories = json.load(open(os.path.join(this_dir, 'fixtures', 'ko_sample_stories.json')))
+        items = [
+            dict(text=spanish_story['story_text'], language=spanish_story['language']),
+            dict(text=korean_stories[0], language='ko'),
+            dict(text=spanish_story['story_text'], language='ES'),
+        ]
+        results = entities.from_texts(items, batch_size=2)
+        assert len(results) == len(items)
+        for item, entity_list in zip(items, results):
+            assert entity_list == entities.from_text(item['text'], item['language'])
+
+    def test_long_text(self):
+        story = json.load(open(os.path.join(this_dir, 'fixtures', '2210723002.json')))
+        whole_entities = entities._from_text(story['story_text'], story['language'])
+        # split the story into many small windows, which should find the same entities
+        with mock.patch.object(entities, 'CHUNK_MAX_CHARS', 500):
+            chunked_entities = entities._from_text(story['story_text'], story['language'])
+        assert len(chunked_entities) > 0
+        for e in chunked_entities:
+            assert story['story_text'][e['start_char']:e['end_char']].strip() == e['text']
+        same = [e for e in chunked_entities if e in whole_entities]
+        assert len(same) >= 0.9 * len(whole_entities)
+
+    def test_ner_only(self):
+        # disabling the components NER doesn't need must not change the entities it finds
+        spanish_story = json.load(open(os.path.join(this_dir, 'fixtures', '2210723002.json')))
+        korean_stories = json.load(open(os.path.join(this_dir, 'fixtures', 'ko_sample_stories.json')))
+        for lang, texts in [('es', [spanish_story['story_text']]), ('ko', korean_stories)]:
+            full_nlp = load_spacy_model(lang, ner_only=False)
+            ner_nlp = load_spacy_model(lang, ner_only=True)
+            assert len(ner_nlp.pipe_names) < len(full_nlp.pipe_names)
+            for text in texts:
+                assert entities._entities_as_dict(ner_nlp(text)) == entities._entities_as_dict(full_nlp(text))
+
 
 if __name__ == "__main__":
     unittest.main()
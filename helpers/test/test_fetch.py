@@ -0,0 +1,173 @@
+import asyncio
+import threading
+import unittest
+from unittest import mock
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from requests.exceptions import ConnectionError, TooManyRedirects
+
+import helpers.fetch as fetch
+
+SAMPLE_HTML = """<html><head><title>Pigeon Sells For Record Price</title></head><body>
+<article>
+<p>A Belgian racing pigeon was sold for a record price on Sunday to a buyer in China, the auction house said.</p>
+<p>The two-year-old female, named New Kim, fetched 1.6 million euros after a fierce bidding war between two Chinese
+buyers, far above the previous record for a pigeon sold at auction.</p>
+<p>Belgium has a long tradition of pigeon racing, and its birds are prized by breeders around the world who are
+willing to pay high prices for proven champions and their offspring.</p>
+</article>
+</body></html>"""
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    requests = []  # (path, If-None-Match header) of every request received
+
+    def do_GET(self):
+        _Handler.requests.append((self.path, self.headers.get('If-None-Match')))
+        if self.path == '/etag':
+            if self.headers.get('If-None-Match') == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+            else:
+                self.send_response(200)
+                self.send_header('ETag', '"v1"')
+                self._respond(200, 'text/html; charset=utf-8', SAMPLE_HTML.encode('utf-8'), status_sent=True)
+        elif self.path == '/article':
+            self._respond(200, 'text/html; charset=utf-8', SAMPLE_HTML.encode('utf-8'))
+        elif self.path == '/latin-1':
+            # no charset in the header, so the encoding has to be guessed
+            self._respond(200, 'text/html', SAMPLE_HTML.replace('Belgian', 'Belgian café').encode('latin-1'))
+        elif self.path == '/redirect':
+            self.send_response(302)
+            self.send_header('Location', '/article')
+            self.end_headers()
+        elif self.path == '/loop':
+            self.send_response(302)
+            self.send_header('Location', '/loop')
+            self.end_headers()
+        elif self.path == '/data.json':
+            self._respond(200, 'application/json', b'{}')
+        else:
+            self._respond(404, 'text/html', b'not found')
+
+    def _respond(self, status: int, content_type: str, body: bytes, status_sent: bool = False):
+        if not status_sent:
+            self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestFetch(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls._server = HTTPServer(('127.0.0.1', 0), _Handler)
+        cls._base_url = 'http://127.0.0.1:{}'.format(cls._server.server_address[1])
+        threading.Thread(target=cls._server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls._server.shutdown()
+
+    def setUp(self) -> None:
+        _Handler.requests = []
+        # start each test with an empty url cache
+        url_cache_patcher = mock.patch.object(fetch, 'url_cache', fetch.LRUCache(10))
+        url_cache_patcher.start()
+        self.addCleanup(url_cache_patcher.stop)
+
+    def _fetch(self, path: str):
+        return self._fetch_url(self._base_url + path)
+
+    @staticmethod
+    def _fetch_url(url: str):
+        async def run():
+            try:
+                return await fetch.extract_url(url)
+            finally:
+                await fetch.close()
+        return asyncio.run(run())
+
+    def test_fetch(self):
+        results = self._fetch('/article')
+        assert results['original_url'] == results['url'] == self._base_url + '/article'
+        assert 'Belgian racing pigeon' in results['text_content']
+
+    def test_host_limits_dropped(self):
+        async def run():
+            try:
+                await asyncio.gather(*[fetch.extract_url(self._base_url + '/article') for _ in range(3)])
+                return dict(fetch._host_limits)
+            finally:
+                await fetch.close()
+        assert asyncio.run(run()) == {}
+
+    def test_too_many_redirects(self):
+        self.assertRaises(TooManyRedirects, self._fetch, '/loop')
+
+    def test_not_found(self):
+        self.assertRaises(RuntimeError, self._fetch, '/missing')
+
+    def test_not_html(self):
+        self.assertRaises(RuntimeError, self._fetch, '/data.json')
+
+    def test_bad_host(self):
+        self.assertRaises(ConnectionError, self._fetch_url, 'http://127.0.0.1:1/article')
+
+    def test_extract(self):
+        url = 'https://bit.ly/pigeon'
+        results = fetch.extract(url, SAMPLE_HTML, 'https://example.com/pigeon')
+        assert results['original_url'] == url
+        assert results['url'] == 'https://example.com/pigeon'
+        assert results['is_shortened']
+        assert 'Belgian racing pigeon' in results['text_content']
+
+    def test_extract_url(self):
+        results = self._fetch('/redirect')
+        assert results['original_url'] == self._base_url + '/redirect'
+        assert results['url'] == self._base_url + '/article'
+        assert 'Belgian racing pigeon' in results['text_content']
+
+    def test_extract_url_cached(self):
+        first_results = self._fetch('/article')
+        first_results['text_content'] = None  # make sure changing results doesn't change the cache
+        results = self._fetch('/article')
+        assert 'Belgian racing pigeon' in results['text_content']
+        assert len(_Handler.requests) == 1
+
+    @mock.patch.object(fetch, 'URL_CACHE_TTL_SECS', 0)
+    def test_extract_url_revalidated(self):
+        self._fetch('/etag')
+        with mock.patch.object(fetch, 'extract') as extract:
+            results = self._fetch('/etag')
+            extract.assert_not_called()
+        assert 'Belgian racing pigeon' in results['text_content']
+        assert _Handler.requests == [('/etag', None), ('/etag', '"v1"')]
+
+    def test_encoding_guessed_off_the_loop(self):
+        guessed_on = []
+
+        def guess_encoding(content):
+            guessed_on.append(threading.current_thread())
+            return guess(content)
+        guess = fetch._guess_encoding
+        with mock.patch.object(fetch, '_guess_encoding', guess_encoding):
+            results = self._fetch('/latin-1')
+        assert 'Belgian café racing pigeon' in results['text_content']
+        assert guessed_on and (threading.main_thread() not in guessed_on)
+
+    def test_cache_key(self):
+        assert fetch._cache_key('HTTPS://Example.COM/Article?id=1#top') == 'https://example.com/Article?id=1'
+        keys = {fetch._cache_key(url) for url in ['https://bit.ly/AbC', 'https://bit.ly/abc', 'https://bit.ly/abc?x=1',
+                                                  'http://bit.ly/abc', 'https://www.bit.ly/abc']}
+        assert len(keys) == 5
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,186 @@
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from requests.exceptions import ConnectionError, TooManyRedirects
+
+from helpers.jobs import JobStore, JobRunner, public_view, is_retryable, check_callback_url, STAGE_FETCH, STAGE_NER, STATUS_QUEUED, \
+    STATUS_RUNNING, STATUS_DONE, STATUS_FAILED
+
+
+class TestJobStore(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._dir.name, 'jobs.sqlite')
+        self.store = JobStore(self.path)
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def test_stages(self):
+        job = self.store.submit(dict(url='https://example.com'))
+        assert (job['status'], job['stage'], job['params']) == (STATUS_QUEUED, STAGE_FETCH, dict(url='https://example.com'))
+        assert self.store.claim(STAGE_NER, 60) is None
+        claimed = self.store.claim(STAGE_FETCH, 60)
+        assert (claimed['id'], claimed['status'], claimed['attempts']) == (job['id'], STATUS_RUNNING, 1)
+        assert self.store.claim(STAGE_FETCH, 60) is None  # already taken
+        self.store.advance(job['id'], STAGE_NER, dict(text="some text"))
+        claimed = self.store.claim(STAGE_NER, 60)
+        assert claimed['data'] == dict(text="some text")
+        self.store.finish(job['id'], dict(entities=[]), 60)
+        finished = JobStore(self.path).get(job['id'])  # saved on disk
+        assert finished['status'] == STATUS_DONE
+        assert public_view(finished)['results'] == dict(entities=[])
+
+    def test_lease(self):
+        job = self.store.submit({})
+        self.store.claim(STAGE_FETCH, -1)  # as if the worker died and its lease ran out
+        claimed = self.store.claim(STAGE_FETCH, 60)
+        assert (claimed['id'], claimed['attempts']) == (job['id'], 2)
+
+    def test_retry_later(self):
+        job = self.store.submit({})
+        self.store.claim(STAGE_FETCH, 60)
+        self.store.retry(job['id'], "ConnectionError: down", 60)
+        assert self.store.claim(STAGE_FETCH, 60) is None  # not until the backoff is over
+        assert self.store.get(job['id'])['error'] == "ConnectionError: down"
+
+    def test_fork(self):
+        self.store.submit({})  # opens the connection before forking, like the gunicorn master could with --preload
+
+        def child():
+            self.store.submit({})  # on its own connection
+            os._exit(0)
+        process = multiprocessing.get_context('fork').Process(target=child)
+        process.start()
+        process.join()
+        assert process.exitcode == 0
+        assert self.store.counts() == {STATUS_QUEUED: 2}
+
+    def test_prune(self):
+        job = self.store.submit({})
+        self.store.fail(job['id'], "bad", -1)
+        kept = self.store.submit({})
+        assert self.store.prune() == 1
+        assert self.store.get(job['id']) is None
+        assert self.store.get(kept['id']) is not None
+
+
+class TestJobRunner(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.store = JobStore(os.path.join(self._dir.name, 'jobs.sqlite'))
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def _run(self, fetch_func, params_list, wait_secs=1.0, **kwargs):
+        def process(params, data):
+            return dict(url=params['url'], text=data['text'].upper())
+
+        async def run():
+            runner = JobRunner(self.store, fetch_func, process, fetch_workers=2, ner_workers=1,
+                               retry_backoff_secs=0.01, poll_secs=0.01, **kwargs)
+            runner.start()
+            submitted = [await runner.submit(params) for params in params_list]
+            deadline = time.time() + wait_secs
+            while time.time() < deadline:
+                jobs = [self.store.get(job['id']) for job in submitted]
+                if all(job['status'] in (STATUS_DONE, STATUS_FAILED) for job in jobs):
+                    break
+                await asyncio.sleep(0.01)
+            await runner.stop()
+            return [self.store.get(job['id']) for job in submitted]
+        return asyncio.run(run())
+
+    def test_done(self):
+        async def fetch(params):
+            return dict(text="page at " + params['url'])
+        jobs = self._run(fetch, [dict(url='a'), dict(url='b')])
+        assert [job['status'] for job in jobs] == [STATUS_DONE, STATUS_DONE]
+        assert jobs[1]['results'] == dict(url='b', text="PAGE AT B")
+
+    def test_retries(self):
+        calls = []
+
+        async def flaky_fetch(params):
+            calls.append(params['url'])
+            if len(calls) < 3:
+                raise ConnectionError("connection refused")
+            return dict(text="finally")
+        job = self._run(flaky_fetch, [dict(url='a')], max_attempts=3)[0]
+        assert job['status'] == STATUS_DONE
+        assert len(calls) == 3
+
+    def test_gives_up(self):
+        async def down_fetch(params):
+            raise ConnectionError("connection refused")
+        job = self._run(down_fetch, [dict(url='a')], max_attempts=2)[0]
+        assert (job['status'], job['attempts']) == (STATUS_FAILED, 2)
+        assert 'ConnectionError' in job['error']
+
+    def test_not_retryable(self):
+        async def redirect_fetch(params):
+            raise TooManyRedirects("loop")
+        job = self._run(redirect_fetch, [dict(url='a')])[0]
+        assert (job['status'], job['attempts']) == (STATUS_FAILED, 1)
+
+    def test_callback(self):
+        async def fetch(params):
+            return dict(text="text")
+        with mock.patch('httpx.post') as post:
+            job = self._run(fetch, [dict(url='a', callback_url='https://example.com/done')])[0]
+        assert job['status'] == STATUS_DONE
+        assert post.call_args.args[0] == 'https://example.com/done'
+        assert '"status": "done"' in post.call_args.kwargs['content']
+
+    def test_bad_callback_url(self):
+        for callback_url in ['http://[::1', 'ftp://example.com/done', 'not a url']:
+            with self.assertRaises(ValueError):
+                check_callback_url(callback_url)
+        check_callback_url('https://example.com/done')
+        check_callback_url(None)
+
+        async def fetch(params):
+            return dict(text="text")
+        with self.assertRaises(ValueError):
+            self._run(fetch, [dict(url='a', callback_url='http://[::1')])
+
+    def test_callback_invalid_url(self):
+        async def fetch(params):
+            return dict(text="text")
+        bad_job = self.store.submit(dict(url='a', callback_url='http://[::1'))  # ie. from before urls were checked
+        job = self._run(fetch, [dict(url='b')])[0]
+        assert job['status'] == STATUS_DONE  # the worker carried on
+        assert self.store.get(bad_job['id'])['status'] == STATUS_DONE
+
+    def test_worker_error(self):
+        async def fetch(params):
+            return dict(text="text")
+        advance = self.store.advance
+        calls = []
+
+        def failing_advance(*args):
+            calls.append(args)
+            if len(calls) == 1:
+                raise RuntimeError("disk full")
+            return advance(*args)
+        with mock.patch.object(self.store, 'advance', side_effect=failing_advance):
+            jobs = self._run(fetch, [dict(url='a'), dict(url='b')])
+        assert sorted(job['status'] for job in jobs) == [STATUS_DONE, STATUS_FAILED]
+        assert "disk full" in next(job['error'] for job in jobs if job['status'] == STATUS_FAILED)
+
+    def test_retryable(self):
+        assert is_retryable(ConnectionError())
+        assert not is_retryable(TooManyRedirects())
+        assert not is_retryable(ValueError())
+
+
+if __name__ == "__main__":
+    unittest.main()
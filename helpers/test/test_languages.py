@@ -0,0 +1,59 @@
+import unittest
+
+from helpers import LANGUAGE_AUTO
+from helpers.exceptions import UnknownLanguageException
+import helpers.languages as languages
+
+SAMPLE_TEXTS = {
+    'en': "President Joe Biden met with Prime Minister Justin Trudeau in Ottawa on Friday to discuss trade and border "
+          "security.",
+    'es': "El presidente del Gobierno se reunió el martes en Madrid con los líderes de los sindicatos para hablar de "
+          "las pensiones.",
+    'fr': "Le président Emmanuel Macron a reçu mardi à l'Élysée le chancelier allemand pour évoquer la guerre en "
+          "Ukraine.",
+    'sw': "Rais Samia Suluhu Hassan alikutana na maafisa wa Benki ya Dunia jijini Dar es Salaam siku ya Jumatatu "
+          "kujadili mikopo mipya.",
+}
+
+
+class TestDetect(unittest.TestCase):
+
+    def test_supported(self):
+        for lang, text in SAMPLE_TEXTS.items():
+            assert languages.detect(text) == lang
+
+    def test_unsupported(self):
+        with self.assertRaises(UnknownLanguageException):
+            languages.detect("Il presidente del Consiglio ha incontrato martedì a Roma i rappresentanti dei sindacati "
+                             "per discutere della riforma delle pensioni.")
+
+    def test_empty(self):
+        with self.assertRaises(UnknownLanguageException):
+            languages.detect("   ")
+
+    def test_prefix_only(self):
+        text = SAMPLE_TEXTS['sw'] + " " + (SAMPLE_TEXTS['en'] + " ") * 20
+        assert languages.detect(text, max_chars=len(SAMPLE_TEXTS['sw'])) == 'sw'
+        assert languages.detect(text, max_chars=0) == 'en'
+
+    def test_min_confidence(self):
+        with self.assertRaises(UnknownLanguageException):
+            languages.detect("ok", min_confidence=1.01)
+
+
+class TestResolve(unittest.TestCase):
+
+    def test_passed_in(self):
+        assert languages.resolve('EN', SAMPLE_TEXTS['fr']) == 'en'  # trusted, not detected
+
+    def test_auto(self):
+        assert languages.resolve(LANGUAGE_AUTO, SAMPLE_TEXTS['fr']) == 'fr'
+        assert languages.resolve('AUTO', SAMPLE_TEXTS['es']) == 'es'
+
+    def test_unsupported(self):
+        with self.assertRaises(UnknownLanguageException):
+            languages.resolve('it', SAMPLE_TEXTS['en'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import threading
+import unittest
+
+from helpers.metrics import Counter, Gauge, Histogram, Registry, stage, start_request_timings, STAGE_SECONDS
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_counter(self):
+        registry = Registry()
+        counter = registry.add(Counter('docs_total', "Documents", ('language',)))
+        counter.inc(language='en')
+        counter.inc(2, language='en')
+        counter.inc(language='es')
+        assert counter.value(language='en') == 3
+        assert registry.exposition() == ('# HELP docs_total Documents\n'
+                                         '# TYPE docs_total counter\n'
+                                         'docs_total{language="en"} 3\n'
+                                         'docs_total{language="es"} 1\n')
+
+    def test_gauge(self):
+        gauge = Gauge('in_flight', "Requests in flight", ('endpoint',))
+        gauge.inc(endpoint='a')
+        gauge.inc(endpoint='a')
+        gauge.dec(endpoint='a')
+        assert gauge.value(endpoint='a') == 1
+        assert 'in_flight{endpoint="a"} 1' in gauge.exposition()
+
+    def test_histogram(self):
+        histogram = Histogram('latency_seconds', "Latency", ('stage',), buckets=(0.1, 1))
+        histogram.observe(0.05, stage='spacy')
+        histogram.observe(0.5, stage='spacy')
+        histogram.observe(5, stage='spacy')
+        assert histogram.count(stage='spacy') == 3
+        lines = histogram.exposition()
+        assert 'latency_seconds_bucket{stage="spacy",le="0.1"} 1' in lines
+        assert 'latency_seconds_bucket{stage="spacy",le="1"} 2' in lines
+        assert 'latency_seconds_bucket{stage="spacy",le="+Inf"} 3' in lines
+        assert 'latency_seconds_sum{stage="spacy"} 5.55' in lines
+        assert 'latency_seconds_count{stage="spacy"} 3' in lines
+
+    def test_escaping(self):
+        counter = Counter('errors_total', "Errors", ('exception',))
+        counter.inc(exception='a "quoted"\nname')
+        assert 'errors_total{exception="a \\"quoted\\"\\nname"} 1' in counter.exposition()
+
+    def test_stage_timings(self):
+        before = STAGE_SECONDS.count(stage='test')
+        timings = start_request_timings()
+        with stage('test'):
+            pass
+        with stage('test'):
+            pass
+        assert STAGE_SECONDS.count(stage='test') == before + 2
+        assert list(timings.keys()) == ['test']
+        # other requests (ie. in other threads) have their own timings
+        other_timings = []
+        thread = threading.Thread(target=lambda: other_timings.append(start_request_timings()))
+        thread.start()
+        thread.join()
+        assert other_timings == [{}]
+
+
+if __name__ == "__main__":
+    unittest.main()
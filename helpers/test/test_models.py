@@ -0,0 +1,111 @@
+import os
+import tempfile
+import unittest
+
+import spacy
+
+from helpers.models import ModelRegistry, unused_by_ner, load_spacy_model, snapshot_path, spacy_model_name
+
+
+class TestModelRegistry(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self._load_counts = {}
+
+    def _loaders(self, languages):
+        def make_loader(lang):
+            def loader():
+                self._load_counts[lang] = self._load_counts.get(lang, 0) + 1
+                return "model-{}".format(lang)
+            return loader
+        return {lang: make_loader(lang) for lang in languages}
+
+    def test_lazy_loading(self):
+        registry = ModelRegistry(self._loaders(['en', 'es']))
+        assert 'en' in registry
+        assert 'xx' not in registry
+        assert self._load_counts == {}
+        assert registry['en'] == 'model-en'
+        assert registry['en'] == 'model-en'
+        assert self._load_counts == {'en': 1}
+        assert registry.is_loaded('en')
+        assert not registry.is_loaded('es')
+
+    def test_preload(self):
+        registry = ModelRegistry(self._loaders(['en', 'es', 'fr']))
+        registry.preload(['en', 'fr'])
+        assert self._load_counts == {'en': 1, 'fr': 1}
+        assert registry.status()['loaded'] == ['en', 'fr']
+
+    def test_lru_eviction(self):
+        registry = ModelRegistry(self._loaders(['en', 'es', 'fr']), max_loaded=2)
+        registry.get('en')
+        registry.get('es')
+        registry.get('en')  # now 'es' is the least recently used
+        registry.get('fr')
+        status = registry.status()
+        assert status['loaded'] == ['en', 'fr']
+        assert status['languages']['es']['loaded'] is False
+        assert status['languages']['es']['evictions'] == 1
+        registry.get('es')  # reloads, and evicts 'en'
+        assert self._load_counts == {'en': 1, 'es': 2, 'fr': 1}
+        assert registry.status()['loaded'] == ['fr', 'es']
+
+    def test_status(self):
+        registry = ModelRegistry(self._loaders(['en']))
+        registry.get('en')
+        registry.get('en')
+        stats = registry.status()['languages']['en']
+        assert stats['loaded'] is True
+        assert stats['loads'] == 1
+        assert stats['uses'] == 2
+        assert stats['lastLoadSecs'] is not None
+
+
+class TestUnusedByNER(unittest.TestCase):
+
+    def test_own_embeddings(self):
+        nlp = spacy.blank('en')
+        for name in ['tok2vec', 'tagger', 'sentencizer', 'ner', 'entity_ruler']:
+            nlp.add_pipe(name)
+        nlp._link_components()
+        assert unused_by_ner(nlp) == ['tok2vec', 'tagger', 'sentencizer']
+
+    def test_shared_embeddings(self):
+        nlp = spacy.blank('en')
+        nlp.add_pipe('tok2vec')
+        nlp.add_pipe('tagger')
+        nlp.add_pipe('ner', config={'model': {
+            '@architectures': 'spacy.TransitionBasedParser.v2', 'state_type': 'ner', 'extra_state_tokens': False,
+            'hidden_width': 64, 'maxout_pieces': 2, 'use_upper': True,
+            'tok2vec': {'@architectures': 'spacy.Tok2VecListener.v1', 'width': 96, 'upstream': '*'},
+        }})
+        nlp._link_components()
+        assert unused_by_ner(nlp) == ['tagger']  # the ner component needs the shared tok2vec
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def test_snapshot_path(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            assert snapshot_path(None, 'en_core_web_sm') is None
+            assert snapshot_path(snapshot_dir, 'en_core_web_sm') is None
+            os.mkdir(os.path.join(snapshot_dir, 'Davlan--xlm-roberta-large-masakhaner'))
+            assert snapshot_path(snapshot_dir, 'Davlan/xlm-roberta-large-masakhaner') == \
+                os.path.join(snapshot_dir, 'Davlan--xlm-roberta-large-masakhaner')
+
+    def test_load_spacy_snapshot(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            nlp = spacy.blank('en')
+            nlp.add_pipe('sentencizer')
+            nlp.add_pipe('entity_ruler').add_patterns([dict(label='GPE', pattern='Boston')])
+            nlp.meta['name'] = 'snapshot_test'
+            nlp.to_disk(os.path.join(snapshot_dir, spacy_model_name('en')))
+            loaded = load_spacy_model('en', ner_only=True, snapshot_dir=snapshot_dir)
+            assert loaded.meta['name'] == 'snapshot_test'
+            assert loaded.pipe_names == ['entity_ruler']
+            assert [ent.text for ent in loaded("Rain in Boston").ents] == ['Boston']
+
+
+if __name__ == "__main__":
+    unittest.main()
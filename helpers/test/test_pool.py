@@ -0,0 +1,57 @@
+import os
+import threading
+import time
+import unittest
+
+from helpers.exceptions import ServerBusyException
+from helpers.metrics import stage, start_request_timings
+from helpers.pool import NERPool
+
+
+def _slow_pid(secs: float) -> int:
+    time.sleep(secs)
+    return os.getpid()
+
+
+def _staged_pid() -> int:
+    with stage('spacy'):
+        return os.getpid()
+
+
+class TestNERPool(unittest.TestCase):
+
+    def test_disabled(self):
+        pool = NERPool(0, 0)
+        assert not pool.enabled
+        assert pool.loads_models_here
+        assert pool.run(_slow_pid, 0) == os.getpid()
+
+    def test_runs_in_worker(self):
+        pool = NERPool(1, 4)
+        assert pool.enabled
+        assert not pool.loads_models_here
+        pool.start()
+        assert pool.run(_slow_pid, 0) != os.getpid()
+
+    def test_timings(self):
+        pool = NERPool(1, 4)
+        pool.start()
+        timings = start_request_timings()
+        assert pool.run(_staged_pid) != os.getpid()
+        assert list(timings.keys()) == ['spacy']  # the work in the worker is timed here too
+
+    def test_busy(self):
+        pool = NERPool(1, 1, retry_after_secs=7)
+        pool.start()
+        worker = threading.Thread(target=pool.run, args=(_slow_pid, 2))
+        worker.start()
+        time.sleep(0.5)  # make sure the slow task has the only slot
+        with self.assertRaises(ServerBusyException) as context:
+            pool.run(_slow_pid, 0)
+        assert context.exception.retry_after_secs == 7
+        worker.join()
+        assert pool.run(_slow_pid, 0) != os.getpid()  # works again once there is space
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+
+from helpers.preprocess import preprocess
+
+SAMPLE_TEXT = """We use cookies to improve your experience. Accept all?
+
+Home
+World
+Politics
+Business
+Sports
+
+President   Samia Suluhu Hassan met with officials from the World Bank in
+Dar es Salaam on Monday.
+
+
+
+The talks covered new loans for roads in Dodoma.
+Sign up for our newsletter!
+The talks covered new loans for roads in Dodoma.
+"""
+
+
+class TestPreprocess(unittest.TestCase):
+
+    def _check_offsets(self, original: str, processed: str, offset_map, word: str):
+        start = processed.index(word)
+        entities = offset_map.map_entities([dict(text=word, start_char=start, end_char=start + len(word))])
+        assert original[entities[0]['start_char']:entities[0]['end_char']] == word
+
+    def test_off(self):
+        text, offset_map = preprocess(SAMPLE_TEXT)
+        assert text == SAMPLE_TEXT
+        assert offset_map.original(10) == 10
+
+    def test_collapse_whitespace(self):
+        text, offset_map = preprocess(SAMPLE_TEXT, collapse_whitespace=True)
+        assert "President Samia" in text
+        assert "in\nDar es Salaam" in text
+        assert "Monday.\n\nThe talks" in text  # paragraph breaks are kept
+        for word in ["Samia Suluhu Hassan", "Dar es Salaam", "Dodoma", "World Bank"]:
+            self._check_offsets(SAMPLE_TEXT, text, offset_map, word)
+
+    def test_drop_boilerplate(self):
+        text, offset_map = preprocess(SAMPLE_TEXT, drop_boilerplate=True)
+        assert "cookies" not in text
+        assert "newsletter" not in text
+        assert "Politics" not in text
+        assert text.count("The talks covered") == 1
+        assert "Samia Suluhu Hassan" in text
+        for word in ["Samia Suluhu Hassan", "Dar es Salaam", "Dodoma"]:
+            self._check_offsets(SAMPLE_TEXT, text, offset_map, word)
+
+    def test_short_lists_kept(self):
+        text = "Team A\nTeam B\nTeam C\n"
+        assert preprocess(text, drop_boilerplate=True)[0] == text
+
+    def test_max_chars(self):
+        text, offset_map = preprocess(SAMPLE_TEXT, collapse_whitespace=True, drop_boilerplate=True, max_chars=40)
+        assert len(text) == 40
+        assert text.strip().startswith("President Samia")
+        self._check_offsets(SAMPLE_TEXT, text, offset_map, "Samia")
+
+    def test_entity_spanning_collapsed_whitespace(self):
+        original = "Visit New    York today"
+        text, offset_map = preprocess(original, collapse_whitespace=True)
+        assert text == "Visit New York today"
+        entities = offset_map.map_entities([dict(text="New York", start_char=6, end_char=14)])
+        assert original[entities[0]['start_char']:entities[0]['end_char']] == "New    York"
+
+
+if __name__ == "__main__":
+    unittest.main()
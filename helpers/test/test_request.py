@@ -0,0 +1,97 @@
+import json
+import unittest
+from unittest import mock
+
+from fastapi.responses import JSONResponse
+
+import helpers
+import helpers.request
+from helpers.encoding import _response_format, ResponseFormat, MEDIA_JSON, LAYOUT_COLUMNAR
+from helpers.exceptions import ServerBusyException
+from helpers.metrics import stage, ERRORS, REQUEST_SECONDS, REQUESTS_IN_FLIGHT
+from helpers.request import api_method, STATUS_OK, STATUS_ERROR
+
+
+@api_method
+def _ok():
+    return dict(answer=42)
+
+
+@api_method
+def _staged():
+    with stage('fetch'):
+        pass
+    return {}
+
+
+@api_method
+def _entities():
+    return dict(entities=[dict(text="Boston", type="GPE", start_char=0, end_char=6)])
+
+
+@api_method
+def _value_error():
+    raise ValueError("bad value")
+
+
+@api_method
+def _busy():
+    raise ServerBusyException("too busy", 3)
+
+
+class TestApiMethod(unittest.TestCase):
+
+    def test_ok(self):
+        response = _ok()
+        assert response['status'] == STATUS_OK
+        assert response['results'] == dict(answer=42)
+        assert response['version'] == helpers.VERSION
+
+    def test_metrics(self):
+        requests_before = REQUEST_SECONDS.count(endpoint='_ok')
+        errors_before = ERRORS.value(endpoint='_value_error', exception='ValueError')
+        _ok()
+        _value_error()
+        assert REQUEST_SECONDS.count(endpoint='_ok') == requests_before + 1
+        assert ERRORS.value(endpoint='_value_error', exception='ValueError') == errors_before + 1
+        assert REQUESTS_IN_FLIGHT.value(endpoint='_ok') == 0
+
+    def test_timings(self):
+        assert 'timings' not in _staged()
+        with mock.patch.object(helpers.request, 'RESPONSE_TIMINGS', True):
+            response = _staged()
+        assert list(response['timings'].keys()) == ['fetch']
+
+    def test_error(self):
+        response = _value_error()
+        assert response['status'] == STATUS_ERROR
+        assert response['statusCode'] == 400
+        assert response['message'] == "bad value"
+
+    def test_busy(self):
+        response = _busy()
+        assert isinstance(response, JSONResponse)
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '3'
+        assert response.headers['Vary'] == 'Accept'
+        content = json.loads(response.body)
+        assert content['status'] == STATUS_ERROR
+        assert content['statusCode'] == 503
+
+    def test_encoded(self):
+        token = _response_format.set(ResponseFormat(MEDIA_JSON, LAYOUT_COLUMNAR))  # as if handling a request
+        try:
+            response = _entities()
+            error_response = _value_error()
+        finally:
+            _response_format.reset(token)
+        assert response.media_type == MEDIA_JSON
+        content = json.loads(response.body)
+        assert content['status'] == STATUS_OK
+        assert content['results']['entities'] == dict(types=['GPE'], text=['Boston'], type=[0], start_char=[0],
+                                                      end_char=[6])
+        assert json.loads(error_response.body)['message'] == "bad value"
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import asyncio
+import datetime as dt
+import json
+import unittest
+from typing import List
+
+from helpers.stream import ndjson_lines, process_ndjson
+
+
+async def _chunks(chunks: List[bytes]):
+    for chunk in chunks:
+        yield chunk
+
+
+def _collect(generator) -> List:
+    async def run():
+        return [item async for item in generator]
+    return asyncio.run(run())
+
+
+class TestStream(unittest.TestCase):
+
+    def test_lines(self):
+        lines = _collect(ndjson_lines(_chunks([b'{"a"', b': 1}\n{"b": 2}\n', b'\n{"c": 3}']), 100))
+        assert lines == [b'{"a": 1}', b'{"b": 2}', b'', b'{"c": 3}']
+
+    def test_long_line(self):
+        lines = _collect(ndjson_lines(_chunks([b'short\n', b'x' * 10, b'x' * 10, b'\nafter\n']), 15))
+        assert lines == [b'short', None, b'after']
+
+    def test_process(self):
+        in_flight = []
+        most_in_flight = []
+
+        async def handler(item):
+            in_flight.append(item['id'])
+            most_in_flight.append(len(in_flight))
+            await asyncio.sleep(0.05 if item['id'] == 1 else 0)  # so the first one finishes last
+            in_flight.remove(item['id'])
+            if item['id'] == 3:
+                raise ValueError("bad item")
+            return dict(double=item['value'] * 2)
+
+        body = b''.join(json.dumps(dict(id=i, value=i)).encode('utf-8') + b'\n' for i in range(1, 6)) + b'[1, 2]\n'
+        lines = _collect(process_ndjson(_chunks([body]), handler, max_in_flight=2, max_line_bytes=1000))
+        results = [json.loads(line) for line in lines]
+        assert max(most_in_flight) == 2
+        assert len(results) == 6
+        assert results[-1]['id'] == 1  # streamed back as each one finishes
+        by_line = {r['line']: r for r in results}
+        assert by_line[2]['status'] == 'ok'
+        assert by_line[2]['id'] == 2
+        assert by_line[2]['results'] == dict(double=4)
+        assert by_line[3]['status'] == 'error'
+        assert by_line[3]['message'] == "bad item"
+        assert by_line[6]['status'] == 'error'
+        assert by_line[6]['id'] is None
+
+    def test_slow_reader(self):
+        handled = []
+
+        async def handler(item):
+            handled.append(item['id'])
+            return {}
+
+        async def run():
+            body = b''.join(json.dumps(dict(id=i)).encode('utf-8') + b'\n' for i in range(20))
+            lines = process_ndjson(_chunks([body]), handler, max_in_flight=2, max_line_bytes=1000)
+            await lines.__anext__()
+            await asyncio.sleep(0.05)  # a client that doesn't read any more
+            assert len(handled) == 2  # the one sent, and one waiting to be
+            rest = [line async for line in lines]
+            assert len(rest) == 19
+        asyncio.run(run())
+
+    def test_dates(self):
+        async def handler(item):
+            return dict(publication_date=dt.datetime(2024, 3, 1, 12, 30))  # like the metadata for a url
+
+        lines = _collect(process_ndjson(_chunks([b'{"id": 1}\n']), handler, max_in_flight=2, max_line_bytes=1000))
+        assert json.loads(lines[0])['results'] == dict(publication_date='2024-03-01T12:30:00')
+
+
+if __name__ == "__main__":
+    unittest.main()
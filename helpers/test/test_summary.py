@@ -0,0 +1,45 @@
+import unittest
+
+from helpers.summary import normalize, summarize
+
+ENTITIES = [
+    dict(text="Barack Obama", type="PERSON", start_char=0, end_char=12),
+    dict(text="Boston", type="GPE", start_char=21, end_char=27),
+    dict(text="barack  Obama", type="PERSON", start_char=40, end_char=53),
+    dict(text="Obama", type="PERSON", start_char=60, end_char=65),
+    dict(text="Boston", type="ORG", start_char=70, end_char=76),
+    dict(text="2022", type="C_DATE", start_char=80, end_char=84),
+    dict(text="2022", type="C_DATE", start_char=90, end_char=94),
+    dict(text="2022", type="C_DATE", start_char=30, end_char=34),
+]
+
+
+class TestSummary(unittest.TestCase):
+
+    def test_normalize(self):
+        assert normalize(" Barack\n Obama ") == normalize("barack obama")
+
+    def test_summarize(self):
+        summary = summarize(ENTITIES)
+        assert [(e['text'], e['type'], e['count']) for e in summary] == [
+            ("2022", "C_DATE", 3),
+            ("Barack Obama", "PERSON", 2),
+            ("Boston", "GPE", 1),
+            ("Obama", "PERSON", 1),
+            ("Boston", "ORG", 1),
+        ]
+        # the first mention, even though it came later in the list
+        assert (summary[0]['start_char'], summary[0]['end_char']) == (30, 34)
+        assert (summary[1]['start_char'], summary[1]['end_char']) == (0, 12)
+
+    def test_top_k(self):
+        summary = summarize(ENTITIES, top_k=1)
+        assert [(e['text'], e['type']) for e in summary] == [
+            ("2022", "C_DATE"), ("Barack Obama", "PERSON"), ("Boston", "GPE"), ("Boston", "ORG")]
+
+    def test_empty(self):
+        assert summarize([]) == []
+
+
+if __name__ == "__main__":
+    unittest.main()
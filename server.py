@@ -1,20 +1,49 @@
 import logging
 import os
+from contextlib import asynccontextmanager
 import sentry_sdk
 from sentry_sdk.integrations.asgi import SentryAsgiMiddleware
 from sentry_sdk.integrations.logging import ignore_logger
-from typing import Optional, Dict
-from fastapi import FastAPI, Form
-import mcmetadata
+from typing import Optional, Dict, List
+from fastapi import FastAPI, Form, Body, Request, Depends
+from fastapi.responses import PlainTextResponse, JSONResponse
+from pydantic import BaseModel, Field
 import uvicorn
 
 import helpers
+import helpers.documents as documents
 import helpers.entities as entities
-from helpers.request import api_method
+import helpers.domains as domains
+import helpers.fetch as fetch
+import helpers.jobs as jobs
+import helpers.languages as languages
+import helpers.startup as startup
+from helpers.admission import AdmissionMiddleware
+from helpers.compression import RequestDecompressionMiddleware, ResponseCompressionMiddleware
+from helpers.encoding import ResponseFormatMiddleware
+from helpers.executor import run_in_executor
+from helpers.metrics import registry
+from helpers.pool import ner_pool
+from helpers.request import api_method, form_or_json, form_or_json_openapi
+from helpers.stream import process_ndjson, NDJSONStreamingResponse
 from helpers.exceptions import UnknownLanguageException
 
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # models load in the background so we can answer health checks right away, except when the NER workers are forked
+    # from this process, which has to happen after the models are loaded and before other threads start
+    startup.start(background=not ner_pool.forks_after_load)
+    if job_runner is not None:
+        job_runner.start()
+    yield
+    if job_runner is not None:
+        await job_runner.stop()
+    await fetch.close()
+
+
 app = FastAPI(
     title="News Entity Server",
     description="Extract entities from online news in multiple languages",
@@ -27,8 +56,18 @@ app = FastAPI(
         "email": "r.bhargava@northeastern.edu",
         "url": "https://dataculture.northeastern.edu"
     },
+    lifespan=lifespan,
 )
 
+# accept gzip (or zstd) request bodies, decompressing them as they are read
+app.add_middleware(RequestDecompressionMiddleware)
+# encode responses with orjson, or msgpack for clients that ask for it, optionally with columnar entities
+app.add_middleware(ResponseFormatMiddleware)
+# gzip larger responses for clients that accept it, but not streamed ones, so results still go out as they are ready
+app.add_middleware(ResponseCompressionMiddleware, excluded_paths=['/entities/stream'])
+# cap concurrent work and rate limit clients (both off unless configured), before any work starts on a request
+app.add_middleware(AdmissionMiddleware)
+
 SENTRY_DSN = os.environ.get('SENTRY_DSN', None)  # optional centralized logging to Sentry
 if SENTRY_DSN:
     sentry_sdk.init(dsn=SENTRY_DSN, release=helpers.VERSION,
@@ -48,10 +87,6 @@ else:
     logger.info("Not logging errors to Sentry")
 
 
-# HACK: ovveride mcmetadata timeout to be longer
-mcmetadata.webpages.DEFAULT_TIMEOUT_SECS = 60*5
-
-
 @app.get("/version")
 @api_method
 def version():
@@ -64,84 +99,184 @@ def supported_languages():
     return helpers.LANGUAGES
 
 
+@app.get("/models")
+@api_method
+def loaded_models():
+    """
+    Return which language models are currently loaded, plus how long they took to load and how often they are used.
+    """
+    return entities.language_nlp_lookup.status()
+
+
+@app.get("/health/live")
+def health_live():
+    """
+    Returns 200 as long as the server is running.
+    """
+    return dict(status="ok")
+
+
+@app.get("/health/ready")
+def health_ready():
+    """
+    Returns 200 once the models listed in PRELOAD_LANGUAGES are loaded and the server is ready for work, 503 until then.
+    """
+    readiness = startup.readiness()
+    return JSONResponse(readiness, status_code=200 if readiness['ready'] else 503)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Return request, stage, document and error metrics for this process, in the Prometheus text format.
+    """
+    return PlainTextResponse(registry.exposition(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/entities/from-url")
 @api_method
-def entities_from_url(url: str = Form(..., description="A publicly accessible web url of a news story."),
-                      title: Optional[int] = Form(None, description="Optional 1 or 0 indicating if the title should be prefixed the content before checking for entities.",)):
+async def entities_from_url(url: str = Form(..., description="A publicly accessible web url of a news story."),
+                            title: Optional[int] = Form(None, description="Optional 1 or 0 indicating if the title should be prefixed the content before checking for entities.",),
+                            language: Optional[str] = Form(None, description="Optional two-letter language code, or `auto` to detect it, to use instead of the one found in the webpage.")):
     """
     Return all the entities found in content extracted from the URL.
     """
-    article_info = mcmetadata.extract(url)
-    include_title = title == 1 if title is not None else False
-    article_text = ""
-    if include_title and (article_info['article_title'] is not None):
-        article_text += article_info['article_title'] + " "
-    article_text += article_info['text_content']
-    found_entities = entities.from_text(article_text, article_info['language'])
-    results = article_info | dict(entities=found_entities)
-    results = _backwards_compatible_results(results)
-    del results['text']
-    return results
+    # download without tying up a thread, then do the CPU-heavy parts on the worker pool
+    article_info = await fetch.extract_url(url)
+    return await run_in_executor(documents.entities_from_article, article_info, title, language)
 
 
 @app.post("/content/from-url")
 @api_method
-def content_from_url(url: str = Form(..., description="A publicly accessible web url of a news story.")):
+async def content_from_url(url: str = Form(..., description="A publicly accessible web url of a news story.")):
     """
     Return the content found at the URL. This uses a fallback mechanism to iterate through a list of 3rd party content
     extractors. It will try each until it finds one that succeeds.
     """
-    results = mcmetadata.extract(url)
-    results = _backwards_compatible_results(results)
+    results = await fetch.extract_url(url)
+    results = documents.backwards_compatible_results(results)
     # for backwards compatability
     return results
 
 
-def _backwards_compatible_results(results: Dict) -> Dict:
-    results['text'] = results['text_content']
-    del results['text_content']
-    results['title'] = results['article_title']
-    del results['article_title']
-    results['url'] = results['original_url']
-    del results['original_url']
-    results['domain_name'] = results['canonical_domain']
-    del results['canonical_domain']
-    return results
+async def _fetch_for_job(params: Dict) -> Dict:
+    return await fetch.extract_url(params['url'])
+
+
+def _entities_for_job(params: Dict, article_info: Dict) -> Dict:
+    return documents.entities_from_article(article_info, params.get('title'), params.get('language'))
+
+
+# jobs for `/jobs/entities/from-url`, kept in a SQLite file so they survive restarts (only if JOB_DB_PATH is set); each
+# worker process opens the file on first use, so this is safe to create before gunicorn forks them
+job_runner = jobs.JobRunner(jobs.JobStore(helpers.JOB_DB_PATH), _fetch_for_job, _entities_for_job) \
+    if helpers.JOB_DB_PATH else None
+
+
+def _job_runner() -> jobs.JobRunner:
+    if job_runner is None:
+        raise RuntimeError("The job API is turned off; set JOB_DB_PATH to turn it on")
+    return job_runner
 
 
-@app.post("/entities/from-content")
+@app.post("/jobs/entities/from-url")
 @api_method
-def entities_from_content(text: str = Form(..., description="Raw text to check for entities."),
-                          language: str = Form(..., description="One of the supported two-letter language codes.", length=2),
-                          url: Optional[str] = Form(..., description="Helpful for some metadata if you pass in the original URL (optional).")):
+async def job_entities_from_url(url: str = Form(..., description="A publicly accessible web url of a news story."),
+                                title: Optional[int] = Form(None, description="Optional 1 or 0 indicating if the title should be prefixed the content before checking for entities.",),
+                                language: Optional[str] = Form(None, description="Optional two-letter language code, or `auto` to detect it, to use instead of the one found in the webpage."),
+                                callback_url: Optional[str] = Form(None, description="Optional url to POST the finished job to.")):
     """
-    Return all the entities found in content passed in.
+    Queue up finding the entities in content extracted from the URL, like `/entities/from-url`, and return the job
+    right away. Poll `/jobs/{job_id}` for the results, or pass a `callback_url` to have the finished job POSTed to it.
     """
+    job = await _job_runner().submit(dict(url=url, title=title, language=language, callback_url=callback_url))
+    return jobs.public_view(job)
+
+
+@app.get("/jobs/{job_id}")
+@api_method
+def job_status(job_id: str):
+    """
+    Return the status of a job, plus its results once it is `done` (or its `error` if it `failed`).
+    """
+    job = _job_runner().store.get(job_id)
+    if job is None:
+        raise ValueError("No job {} (finished jobs are deleted after JOB_RESULT_TTL_SECS)".format(job_id))
+    return jobs.public_view(job)
+
+
+class ContentItem(BaseModel):
+    text: str = Field(..., description="Raw text to check for entities.")
+    language: str = Field(..., description="One of the supported two-letter language codes, or `auto` to detect it.")
+    url: Optional[str] = Field(None, description="Helpful for some metadata if you pass in the original URL (optional).")
+
+
+@app.post("/entities/from-content", openapi_extra=form_or_json_openapi(ContentItem))
+@api_method
+def entities_from_content(item: ContentItem = Depends(form_or_json(ContentItem))):
+    """
+    Return all the entities found in content passed in, as a form or a JSON object.
+    """
+    lang = languages.resolve(item.language, item.text)
     results = dict(
-        entities=entities.from_text(text, language),
-        domain_name=mcmetadata.urls.canonical_domain(url) if url is not None else None,
-        url=url
+        entities=entities.from_text(item.text, lang),
+        domain_name=domains.canonical_domain(item.url) if item.url is not None else None,
+        url=item.url,
+        language=lang,
     )
     return results
 
 
-@app.post("/entities/from-html")
+@app.post("/entities/from-content/batch")
 @api_method
-def entities_from_html(html: str = Form(..., description="Raw HTML to check for entities."),
-                       language: str = Form(..., description="One of the supported two-letter language codes.", length=2),
-                       url: Optional[str] = Form(..., description="Helpful for some metadata if you pass in the original URL (optional).")):
+def entities_from_content_batch(items: List[ContentItem] = Body(..., description="A list of documents to check for entities."),
+                                batch_size: Optional[int] = None):
     """
-    Return all the entities found in content from HTML passed in.
+    Return all the entities found in a list of content passed in, in the same order. Much faster than calling
+    `/entities/from-content` once for each document.
     """
-    content = mcmetadata.content.from_html(url, html)
-    results = dict(
-        entities=entities.from_text(content['text'], language),
-        domain_name=mcmetadata.urls.canonical_domain(url) if url is not None else None,
-        url=url
-    )
+    item_languages = entities.resolve_languages([dict(text=item.text, language=item.language) for item in items])
+    found_entities = entities.from_texts([dict(text=item.text, language=lang)
+                                          for item, lang in zip(items, item_languages)],
+                                         batch_size=batch_size)
+    results = [dict(
+        entities=item_entities,
+        domain_name=domains.canonical_domain(item.url) if item.url is not None else None,
+        url=item.url,
+        language=lang,
+    ) for item, item_entities, lang in zip(items, found_entities, item_languages)]
     return results
 
 
+@app.post("/entities/stream", response_class=NDJSONStreamingResponse)
+async def entities_stream(request: Request):
+    """
+    Return the entities found in a stream of documents, for bulk processing. POST newline-delimited JSON, one object
+    per line with an `id`, a `language` (or `auto` to detect it) and either `text`, `html` (plus an optional `url`, like
+    `/entities/from-html`) or a `url` to fetch (plus optional `title`, like `/entities/from-url`). Results are streamed
+    back as newline-delimited JSON as each document finishes, so not necessarily in the same order; match them up by
+    `id`.
+    """
+    lines = process_ndjson(request.stream(), documents.entities_from_stream_item, helpers.STREAM_MAX_IN_FLIGHT,
+                           helpers.STREAM_MAX_LINE_BYTES)
+    return NDJSONStreamingResponse(lines)
+
+
+class HtmlItem(BaseModel):
+    html: str = Field(..., description="Raw HTML to check for entities.")
+    language: str = Field(..., description="One of the supported two-letter language codes, or `auto` to detect it.")
+    url: Optional[str] = Field(None, description="Helpful for some metadata if you pass in the original URL (optional).")
+
+
+@app.post("/entities/from-html", openapi_extra=form_or_json_openapi(HtmlItem))
+@api_method
+def entities_from_html(item: HtmlItem = Depends(form_or_json(HtmlItem))):
+    """
+    Return all the entities found in content from HTML passed in, as a form or a JSON object.
+    """
+    return documents.entities_from_html(item.html, item.language, item.url)
+
+
 @app.post("/domains/from-url")
 @api_method
 def domain_from_url(url: str = Form(..., description="A publicly accessible web url of a news story.")):
@@ -149,11 +284,23 @@ def domain_from_url(url: str = Form(..., description="A publicly accessible web
     Return the useful "canonical" domain for a url
     """
     results = dict(
-        domain_name=mcmetadata.urls.canonical_domain(url),
+        domain_name=domains.canonical_domain(url),
         url=url,
     )
     return results
 
 
+@app.post("/domains/from-url/batch")
+@api_method
+def domains_from_urls(urls: List[str] = Body(..., description="A list of web urls.")):
+    """
+    Return the useful "canonical" domain for each url in a list, in the same order. Much faster than calling
+    `/domains/from-url` once for each url, especially when many are from the same sites.
+    """
+    if len(urls) > helpers.DOMAINS_BATCH_MAX_URLS:
+        raise ValueError("Too many urls ({}), the limit is {}".format(len(urls), helpers.DOMAINS_BATCH_MAX_URLS))
+    return [dict(domain_name=domain, url=url) for url, domain in zip(urls, domains.canonical_domains(urls))]
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
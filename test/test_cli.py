@@ -0,0 +1,60 @@
+import gzip
+import json
+import os
+import tempfile
+import unittest
+
+import cli
+
+
+class TestCli(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def _write_input(self, name: str, count: int) -> str:
+        path = os.path.join(self._dir.name, name)
+        with gzip.open(path, 'wt') as f:
+            for idx in range(count):
+                f.write(json.dumps(dict(id=idx, language='en', text="Document {}".format(idx))) + '\n')
+        return path
+
+    def test_read_chunks(self):
+        path = self._write_input('docs.jsonl.gz', 25)
+        chunks = list(cli.read_chunks(path, 10))
+        assert [(chunk, first_line_number, len(lines)) for chunk, first_line_number, lines in chunks] == [
+            (0, 1, 10), (1, 11, 10), (2, 21, 5)]
+        assert json.loads(chunks[2][2][0])['id'] == 20
+        assert cli.shard_name(path, 2) == 'docs-00002.jsonl.gz'
+
+    def test_checkpoint(self):
+        output_dir = os.path.join(self._dir.name, 'output')
+        os.makedirs(output_dir)
+        with open(os.path.join(output_dir, cli.CHECKPOINT_FILENAME), 'w') as f:
+            for shard in ['docs-00000.jsonl.gz', 'docs-00001.jsonl.gz']:
+                f.write(json.dumps(dict(shard=shard, docs=10, errors=0, secs=1, chunkLines=10)) + '\n')
+        open(os.path.join(output_dir, 'docs-00000.jsonl.gz'), 'w').close()
+        done = cli.load_checkpoint(output_dir, 10)
+        assert list(done.keys()) == ['docs-00000.jsonl.gz']  # the other shard has gone missing, so it is done again
+        with self.assertRaises(SystemExit):
+            cli.load_checkpoint(output_dir, 5)
+
+    def test_run(self):
+        path = self._write_input('docs.jsonl.gz', 12)
+        output_dir = os.path.join(self._dir.name, 'output')
+        totals = cli.run([path], output_dir, workers=1, chunk_lines=5, fetch_concurrency=2)
+        assert (totals['chunks'], totals['docs'], totals['errors']) == (3, 12, 0)
+        with gzip.open(os.path.join(output_dir, 'docs-00002.jsonl.gz'), 'rt') as f:
+            results = [json.loads(line) for line in f]
+        assert [r['id'] for r in results] == [10, 11]
+        assert results[0]['line'] == 11
+        assert 'entities' in results[0]['results']
+        totals = cli.run([path], output_dir, workers=1, chunk_lines=5, fetch_concurrency=2)  # all done already
+        assert (totals['chunks'], totals['skippedChunks']) == (0, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,6 @@
 import unittest
 import time
+import gzip
 
 import mcmetadata.content
 from fastapi.testclient import TestClient
@@ -8,7 +9,7 @@ import os
 import json
 
 from server import app
-from helpers import ENGLISH, SPANISH, VERSION, FRENCH, KOREAN, SWAHILI, MODEL_MODE_SMALL
+from helpers import ENGLISH, SPANISH, VERSION, FRENCH, KOREAN, SWAHILI, MODEL_MODE_SMALL, JOB_DB_PATH
 
 
 ENGLISH_ARTICLE_URL = 'https://web.archive.org/web/20240329152732/https://apnews.com/article/belgium-racing-pigeon-fetches-million-9ae40c9f2e9e11699c42694250e012f7'
@@ -25,6 +26,18 @@ class TestServer(unittest.TestCase):
         self._client = TestClient(app)
         time.sleep(1)  # Delay before each test runs to make sure we don't hit WM rate limit
 
+    def test_health(self):
+        response = self._client.get('/health/live')
+        assert response.status_code == 200
+        with TestClient(app) as client:  # runs the startup code, which loads models in the background
+            for _ in range(600):
+                response = client.get('/health/ready')
+                if response.status_code == 200:
+                    break
+                time.sleep(1)
+            assert response.status_code == 200
+            assert response.json()['ready']
+
     def test_basic(self):
         url = "https://web.archive.org/web/20221228220125/https://www.bostonglobe.com/2022/12/28/metro/more-cancellations-delays-travelers-southwest-airlines/"
         response = self._client.post('/entities/from-url', data=dict(url=url, language=ENGLISH))
@@ -149,6 +162,25 @@ class TestServer(unittest.TestCase):
         assert 'domain_name' in data['results']
         assert data['results']['domain_name'] == 'apnews.com'
 
+    def test_domains_from_url_batch(self):
+        urls = [ENGLISH_ARTICLE_URL, "https://foo.wordpress.com/post", "not a url", ENGLISH_ARTICLE_URL]
+        response = self._client.post('/domains/from-url/batch', json=urls)
+        data = response.json()
+        assert data['status'] == 'ok'
+        assert [r['url'] for r in data['results']] == urls
+        single_data = self._client.post('/domains/from-url', data=dict(url=ENGLISH_ARTICLE_URL)).json()
+        assert data['results'][0]['domain_name'] == single_data['results']['domain_name']
+        assert data['results'][1]['domain_name'] == 'foo.wordpress.com'
+        assert data['results'][2]['domain_name'] is None
+        assert data['results'][3]['domain_name'] == data['results'][0]['domain_name']
+
+    @unittest.skipIf(JOB_DB_PATH, "the job API is turned on")
+    def test_jobs_turned_off(self):
+        response = self._client.post('/jobs/entities/from-url', data=dict(url=ENGLISH_ARTICLE_URL))
+        data = response.json()
+        assert data['status'] == 'error'
+        assert 'JOB_DB_PATH' in data['message']
+
     def test_content_from_url(self):
         response = self._client.post('/content/from-url', data=dict(url=ENGLISH_ARTICLE_URL))
         data = response.json()
@@ -174,6 +206,84 @@ class TestServer(unittest.TestCase):
         assert 'domain_name' in data['results']
         assert data['results']['domain_name'] == 'europapress.es'
 
+    def test_entities_from_text_json_gzip(self):
+        story = json.load(open(os.path.join(this_dir, 'fixtures', '1952688847.json')))
+        body = json.dumps(dict(text=story['story_text'], language=story['language'], url=story['url']))
+        response = self._client.post('/entities/from-content', content=gzip.compress(body.encode('utf-8')),
+                                     headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+        data = response.json()
+        assert data['status'] == 'ok'
+        assert len(data['results']['entities']) > 0
+        assert data['results']['domain_name'] == 'europapress.es'
+
+    def test_entities_from_text_batch(self):
+        story = json.load(open(os.path.join(this_dir, 'fixtures', '1952688847.json')))
+        items = [
+            dict(text=story['story_text'], language=story['language'], url=story['url']),
+            dict(text="Barack Obama visited Boston on Tuesday.", language=ENGLISH, url=None),
+            dict(text=story['story_text'], language=story['language'], url=story['url']),
+        ]
+        response = self._client.post('/entities/from-content/batch', json=items)
+        data = response.json()
+        assert data['status'] == 'ok'
+        assert len(data['results']) == 3
+        single_response = self._client.post('/entities/from-content', data=items[0])
+        single_data = single_response.json()
+        assert data['results'][0]['entities'] == single_data['results']['entities']
+        assert data['results'][2]['entities'] == single_data['results']['entities']
+        assert data['results'][0]['domain_name'] == 'europapress.es'
+        assert data['results'][1]['domain_name'] is None
+        assert data['results'][1]['entities'][0]['text'] == 'Barack Obama'
+
+    def test_entities_from_text_batch_unknown_language(self):
+        items = [dict(text="Barack Obama visited Boston on Tuesday.", language='xx')]
+        response = self._client.post('/entities/from-content/batch', json=items)
+        data = response.json()
+        assert data['status'] == 'error'
+
+    def test_entities_from_text_batch_auto_language(self):
+        story = json.load(open(os.path.join(this_dir, 'fixtures', '1952688847.json')))
+        items = [
+            dict(text=story['story_text'], language='auto', url=story['url']),
+            dict(text="Barack Obama visited Boston on Tuesday to talk about the economy.", language='auto', url=None),
+        ]
+        response = self._client.post('/entities/from-content/batch', json=items)
+        data = response.json()
+        assert data['status'] == 'ok'
+        assert [r['language'] for r in data['results']] == [story['language'], ENGLISH]
+        single_response = self._client.post('/entities/from-content', data=dict(items[0], language=story['language']))
+        assert data['results'][0]['entities'] == single_response.json()['results']['entities']
+
+    def test_entities_from_text_auto_unsupported_language(self):
+        response = self._client.post('/entities/from-content', data=dict(
+            text="Il presidente del Consiglio ha incontrato martedì a Roma i rappresentanti dei sindacati.",
+            language='auto', url=None))
+        data = response.json()
+        assert data['status'] == 'error'
+
+    def test_entities_stream(self):
+        story = json.load(open(os.path.join(this_dir, 'fixtures', '1952688847.json')))
+        items = [
+            dict(id='story', text=story['story_text'], language=story['language'], url=story['url']),
+            dict(id='obama', text="Barack Obama visited Boston on Tuesday.", language=ENGLISH),
+            dict(id='archived', url=ENGLISH_ARTICLE_URL, language=ENGLISH),
+            dict(id='unknown', text="Barack Obama visited Boston on Tuesday.", language='xx'),
+        ]
+        body = "".join(json.dumps(item) + "\n" for item in items) + "not json\n"
+        response = self._client.post('/entities/stream', content=body)
+        assert response.headers['content-type'] == 'application/x-ndjson'
+        results = {r['line']: r for r in [json.loads(line) for line in response.text.splitlines()]}
+        assert len(results) == 5
+        assert results[1]['id'] == 'story'
+        assert results[1]['status'] == 'ok'
+        assert results[1]['results']['domain_name'] == 'europapress.es'
+        assert results[2]['results']['entities'][0]['text'] == 'Barack Obama'
+        assert results[3]['status'] == 'ok'
+        assert len(results[3]['results']['entities']) > 0
+        assert results[4]['status'] == 'error'
+        assert results[5]['status'] == 'error'
+        assert results[5]['id'] is None
+
     def test_error_from_url(self):
         response = self._client.post('/entities/from-url', data=dict(
             url="https://app.clickup.com/t/3ymrcbv", language="ES"